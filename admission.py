@@ -0,0 +1,222 @@
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock (Windows) slots are only shared by the threads of one process
+    fcntl = None
+
+# How often a queued analysis checks again for a slot, memory and CPU
+POLL_INTERVAL = 0.1
+
+
+class Overloaded(Exception):
+    """Raised when an analysis cannot be admitted before its queue timeout"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f'Server is busy ({reason}), try again later')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TooLarge(Exception):
+    """Raised when an analysis needs more memory than the host could ever free for it"""
+
+    def __init__(self, need, budget):
+        super().__init__(f'Analysis needs about {need / 2 ** 20:.0f} MB, more than the {budget / 2 ** 20:.0f} MB '
+                         'this server can give one analysis; send a smaller file or chunksize')
+        self.need = need
+        self.budget = budget
+
+
+def available_memory_bytes():
+    """Memory that new work can use: MemAvailable, capped by the cgroup limit of a container.
+
+    Page cache the kernel can reclaim counts as available. Returns None
+    where neither can be read.
+    """
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+
+    # cgroup v2, as used by most container platforms
+    try:
+        with open('/sys/fs/cgroup/memory.max') as f:
+            limit = f.read().strip()
+        if limit != 'max':
+            with open('/sys/fs/cgroup/memory.current') as f:
+                used = int(f.read())
+            with open('/sys/fs/cgroup/memory.stat') as f:
+                stat = dict(line.split() for line in f)
+            headroom = int(limit) - used + int(stat.get('inactive_file', 0))
+            available = headroom if available is None else min(available, headroom)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+def total_memory_bytes():
+    """MemTotal, capped by the cgroup limit of a container, or None where neither can be read"""
+    total = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    total = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    try:
+        with open('/sys/fs/cgroup/memory.max') as f:
+            limit = f.read().strip()
+        if limit != 'max':
+            total = int(limit) if total is None else min(total, int(limit))
+    except (OSError, ValueError):
+        pass
+    return total
+
+
+def load_per_cpu():
+    """One-minute load average divided by the number of CPUs, or None where there is none"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class AdmissionControl:
+    """Admit CPU-heavy analyses into a fixed number of slots shared by all worker processes.
+
+    Slots are lock files in directory held with flock, so every gunicorn
+    worker sees the same slots and a slot is freed even if its worker dies.
+    An analysis waits up to queue_timeout for a free slot, for min_free_memory
+    plus its own expected need to be available, and for the load per CPU to
+    be at most max_load. If that does not happen in time it is rejected with
+    Overloaded instead of pushing the host into swap or the OOM killer.
+    """
+
+    def __init__(self, directory, slots, queue_timeout=30.0, min_free_memory=256 * 1024 * 1024,
+                 max_load=2.0):
+        if slots < 1:
+            raise ValueError('slots must be at least 1')
+        self.directory = directory
+        self.slots = slots
+        self.queue_timeout = queue_timeout
+        self.min_free_memory = min_free_memory
+        self.max_load = max_load
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {}
+        self._lock = threading.Lock()
+        self._local_slots = threading.BoundedSemaphore(slots)
+
+    @classmethod
+    def from_env(cls):
+        """Admission control configured by the HEDGE_ADMISSION_* and HEDGE_MAX_* variables"""
+        return cls(
+            os.environ.get('HEDGE_ADMISSION_DIR', os.path.join(tempfile.gettempdir(), 'hedge-admission')),
+            int(os.environ.get('HEDGE_MAX_ANALYSES', os.cpu_count() or 1)),
+            queue_timeout=float(os.environ.get('HEDGE_ADMISSION_TIMEOUT', 30)),
+            min_free_memory=int(os.environ.get('HEDGE_MIN_FREE_MEMORY', 256 * 1024 * 1024)),
+            max_load=float(os.environ.get('HEDGE_MAX_LOAD', 2.0))
+        )
+
+    def _try_slot(self):
+        """Take a free slot without waiting; None when every slot is busy"""
+        if fcntl is None:
+            return self._local_slots if self._local_slots.acquire(blocking=False) else None
+        os.makedirs(self.directory, exist_ok=True)
+        for k in range(self.slots):
+            slot = open(os.path.join(self.directory, f'slot-{k}.lock'), 'a')
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot
+            except OSError:
+                slot.close()
+        return None
+
+    def _release(self, slot):
+        if slot is self._local_slots:
+            slot.release()
+        else:
+            # Closing the file drops its lock
+            slot.close()
+
+    def check_fits(self, need):
+        """Raise TooLarge when need is more than the host's memory less min_free_memory,
+        which no amount of waiting would free"""
+        total = total_memory_bytes()
+        if total is not None and need > total - self.min_free_memory:
+            raise TooLarge(need, total - self.min_free_memory)
+
+    def saturated(self, need=0):
+        """What keeps new work from starting now ('memory' or 'cpu'), or None"""
+        memory = available_memory_bytes()
+        if memory is not None and memory < self.min_free_memory + need:
+            return 'memory'
+        load = load_per_cpu()
+        if self.max_load and load is not None and load > self.max_load:
+            return 'cpu'
+        return None
+
+    @contextmanager
+    def admit(self, need=0, timeout=None):
+        """Hold an analysis slot while the block runs.
+
+        need is the memory the analysis is expected to take; more than the
+        host could ever free raises TooLarge at once. timeout defaults to
+        queue_timeout; math.inf waits as long as it takes.
+        """
+        self.check_fits(need)
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        slot = None
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                slot = slot or self._try_slot()
+                reason = 'slots' if slot is None else self.saturated(need)
+                if reason is None:
+                    break
+                if time.monotonic() >= deadline:
+                    if slot is not None:
+                        self._release(slot)
+                    with self._lock:
+                        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+                    raise Overloaded(reason, max(1, math.ceil(self.queue_timeout)))
+                time.sleep(POLL_INTERVAL)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        with self._lock:
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            self._release(slot)
+
+    def report(self):
+        """Limits, current readings and this process's admission counts"""
+        return {
+            'slots': self.slots,
+            'queue_timeout': self.queue_timeout,
+            'min_free_memory': self.min_free_memory,
+            'max_load': self.max_load,
+            'available_memory': available_memory_bytes(),
+            'load_per_cpu': load_per_cpu(),
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected)
+        }
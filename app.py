@@ -1,12 +1,78 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, stream_with_context
 import pandas as pd
-import numpy as np
-import json
+import math
 import os
-from datetime import datetime
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 import re
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock (Windows) batches are only serialized within one process
+    fcntl = None
+
+from admission import AdmissionControl, Overloaded, TooLarge
+from cache import cache_from_env
+from clusters import CLUSTER_MIN_PAIRS
+from detection import check_detection_params, open_trade_store, prepare_trades, run_analysis
+from errors import InvalidInput
+from incremental import IncrementalDetector
+from instrumentation import configure_logging, count, instrument, metrics, stage
+from ingest import DEFAULT_CHUNKSIZE
+from jobs import JobManager, JobQueueFull
+from results import DEFAULT_PAGE_SIZE, ResultTable, page_filters
+from store import STORE_NAME_PATTERN, is_trade_store
+
+class SpooledRequest(Request):
+    """Request whose uploaded files stay in memory only up to a small size"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Larger uploads spill to a temporary file instead of a worker's memory
+        return tempfile.SpooledTemporaryFile(max_size=upload_spool_bytes, dir=upload_dir)
 
 app = Flask(__name__, static_folder='.')
+app.request_class = SpooledRequest
+
+# Larger request bodies are refused with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('HEDGE_MAX_UPLOAD_BYTES', 200 * 1024 * 1024))
+upload_spool_bytes = int(os.environ.get('HEDGE_UPLOAD_SPOOL_BYTES', 1024 * 1024))
+upload_dir = os.environ.get('HEDGE_UPLOAD_DIR') or None
+# Uploads above this size are always read in chunks
+chunked_upload_bytes = int(os.environ.get('HEDGE_CHUNKED_UPLOAD_BYTES', 50 * 1024 * 1024))
+# Largest chunksize a request may ask for
+max_chunksize = int(os.environ.get('HEDGE_MAX_CHUNKSIZE', 10 * DEFAULT_CHUNKSIZE))
+# Peak memory of an analysis per byte of CSV it holds at once, used to admit
+# it only when that much is free
+memory_per_upload_byte = float(os.environ.get('HEDGE_MEMORY_PER_UPLOAD_BYTE', 10))
+# Bytes read from the start of an upload to estimate the size of a row
+ROW_SAMPLE_BYTES = 64 * 1024
+
+admission = AdmissionControl.from_env()
+# Matching processes an analysis may use; a request can ask for fewer, never more
+max_workers = min(os.cpu_count() or 1, int(os.environ.get('HEDGE_WORKERS', 0)))
+
+configure_logging(os.environ.get('HEDGE_LOG_LEVEL', 'INFO'))
+profile_dir = os.environ.get('HEDGE_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'hedge-profiles'))
+
+analysis_cache = cache_from_env()
+
+jobs = JobManager(
+    os.environ.get('HEDGE_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'hedge-jobs')),
+    lambda source, params, progress: run_job(source, params, progress),
+    max_workers=int(os.environ.get('HEDGE_JOB_WORKERS', 2))
+)
+
+streams_dir = os.environ.get('HEDGE_STREAMS_DIR', os.path.join(tempfile.gettempdir(), 'hedge-streams'))
+# Streams without a batch for this many seconds are removed
+stream_ttl = float(os.environ.get('HEDGE_STREAM_TTL', 24 * 3600))
+stream_lock = threading.Lock()
+
+stores_dir = os.environ.get('HEDGE_STORES_DIR', os.path.join(tempfile.gettempdir(), 'hedge-stores'))
 
 @app.route('/')
 def index():
@@ -24,335 +90,400 @@ def script():
 def upload_icon():
     return send_from_directory('.', 'upload-icon.svg')
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
+def _uploaded_csv():
+    """Return the uploaded CSV file, or an error response if there is none"""
     if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+        return None, (jsonify({'error': 'No file part'}), 400)
     
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+        return None, (jsonify({'error': 'No selected file'}), 400)
     
     if not file.filename.endswith('.csv'):
-        return jsonify({'error': 'File must be a CSV'}), 400
-    
-    # Get parameters from request
-    price_threshold = float(request.form.get('price_threshold', 5))
-    confidence_threshold = float(request.form.get('confidence_threshold', 0.7))
-    include_close_price = request.form.get('include_close_price', 'true').lower() == 'true'
+        return None, (jsonify({'error': 'File must be a CSV'}), 400)
     
+    return file, None
+
+def _request_cache():
+    """The analysis cache, unless the request opts out with cache=false"""
+    if request.form.get('cache', 'true').lower() == 'false':
+        return None
+    return analysis_cache
+
+# Errors caused by what the client sent, answered with 400 rather than 500
+INPUT_ERRORS = (InvalidInput, pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError)
+
+def _number(values, name, default, kind=float, low=None, high=None):
+    """Read a numeric request field, rejecting malformed or out of range values as invalid input"""
+    value = values.get(name, default)
     try:
-        # Read CSV file
-        df = pd.read_csv(file)
-        
-        # Process data to find hedge pairs
-        hedge_pairs = find_hedge_pairs(df, price_threshold, confidence_threshold, include_close_price)
-        
-        # Generate summary statistics
-        summary_stats = generate_summary_stats(hedge_pairs, df)
-        
-        # Find notable patterns
-        notable_patterns = find_notable_patterns(hedge_pairs, df)
-        
-        return jsonify({
-            'hedge_pairs': hedge_pairs,
-            'summary_stats': summary_stats,
-            'notable_patterns': notable_patterns
-        })
-    
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        number = kind(value)
+    except (TypeError, ValueError):
+        raise InvalidInput(f"{name} must be a number, got '{value}'")
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise InvalidInput(f'{name} must be between {low} and {high}, got {number}')
+    return number
 
-def normalize_asset_name(asset):
-    """Normalize asset names (e.g., treat NQM5 and MNQM5 as equivalent)"""
-    # Remove any non-alphanumeric characters
-    asset = re.sub(r'[^a-zA-Z0-9]', '', asset)
-    
-    # Basic normalization rules
-    if 'NQ' in asset.upper():
-        return 'NQ'
-    if 'ES' in asset.upper():
-        return 'ES'
-    if 'CL' in asset.upper():
-        return 'CL'
-    
-    return asset
-
-def parse_list_field(field):
-    """Parse list fields from string representation"""
-    if isinstance(field, str):
-        # Remove brackets and split by comma
-        field = field.strip('[]').split(',')
-        # Convert to float if possible
-        try:
-            return [float(x.strip()) for x in field if x.strip()]
-        except ValueError:
-            return [x.strip() for x in field if x.strip()]
-    return field
-
-def find_hedge_pairs(df, price_threshold, confidence_threshold, include_close_price):
-    """Find potential hedge pairs in the trading data"""
-    # Clean data - ensure required columns exist
-    required_columns = ['tradehash', 'short_long', 'asset', 'entry_datetimes', 
-                        'market_entries', 'close_datetimes', 'market_closes', 
-                        'account_id', 'user_id', 'net_profit', 'total_contracts']
-    
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Required column '{col}' not found in CSV")
-    
-    # Clean data - remove rows with missing essential values
-    df = df.dropna(subset=required_columns)
-    
-    # Normalize asset names
-    df['normalized_asset'] = df['asset'].apply(normalize_asset_name)
-    
-    # Parse list fields
-    df['entry_datetimes_parsed'] = df['entry_datetimes'].apply(parse_list_field)
-    df['close_datetimes_parsed'] = df['close_datetimes'].apply(parse_list_field)
-    df['market_entries_parsed'] = df['market_entries'].apply(parse_list_field)
-    df['market_closes_parsed'] = df['market_closes'].apply(parse_list_field)
-    
-    # Extract first entry and close times as numeric values
-    df['entry_time'] = df['entry_datetimes_parsed'].apply(lambda x: float(x[0]) if isinstance(x, list) and len(x) > 0 else None)
-    df['close_time'] = df['close_datetimes_parsed'].apply(lambda x: float(x[0]) if isinstance(x, list) and len(x) > 0 else None)
-    
-    # Convert avg_market_entry and avg_market_close to float if they're not already
-    df['avg_market_entry'] = pd.to_numeric(df['avg_market_entry'], errors='coerce')
-    df['avg_market_close'] = pd.to_numeric(df['avg_market_close'], errors='coerce')
-    
-    # Group trades by normalized asset
-    hedge_pairs = []
-    pair_id = 1
+def analysis_params(form):
+    """Read analysis parameters from a submitted form, raising InvalidInput for malformed ones"""
+    params = {
+        'price_threshold': _number(form, 'price_threshold', 5),
+        'confidence_threshold': _number(form, 'confidence_threshold', 0.7),
+        'include_close_price': form.get('include_close_price', 'true').lower() == 'true',
+        'engine': form.get('engine', 'sweep'),
+        'chunksize': _number(form, 'chunksize', 0, int, low=0, high=max_chunksize),
+        'workers': _number(form, 'workers', max_workers, int, low=0, high=max_workers),
+        'cluster_min_pairs': _number(form, 'cluster_min_pairs', CLUSTER_MIN_PAIRS, int)
+    }
+    if params['cluster_min_pairs'] < 1:
+        raise InvalidInput('cluster_min_pairs must be at least 1')
+    return params
+
+def expected_memory(stream, upload_bytes, chunksize):
+    """Memory an analysis is expected to need: for the whole upload, or for
+    one chunk of it when it is read in chunks"""
+    if chunksize:
+        sample = stream.read(ROW_SAMPLE_BYTES)
+        stream.seek(0)
+        row_bytes = len(sample) / max(1, sample.count(b'\n'))
+        upload_bytes = min(upload_bytes, chunksize * row_bytes)
+    return upload_bytes * memory_per_upload_byte
+
+def run_job(source, params, progress):
+    """Job runner: analyze a stored upload into a ResultTable"""
+    with open(source, 'rb') as stream:
+        need = expected_memory(stream, os.path.getsize(source), params['chunksize'])
+    # Queued jobs wait for an analysis slot and memory however long it takes
+    with admission.admit(need, timeout=math.inf), instrument('job'):
+        return ResultTable.from_analysis(
+            run_analysis(source, progress=progress, cache=analysis_cache, **params)
+        )
+
+def _form_flag(name):
+    return request.form.get(name, 'false').lower() == 'true'
+
+@lru_cache(maxsize=16)
+def _open_store(path, modified):
+    """Keep stores mapped between requests; re-ingesting a store changes modified"""
+    return open_trade_store(path)
+
+def _trade_store(name):
+    """Return the named trade store, or an error response if there is none"""
+    path = os.path.join(stores_dir, name)
+    if not STORE_NAME_PATTERN.match(name) or not is_trade_store(path):
+        return None, (jsonify({'error': 'Trade store not found'}), 404)
+    return _open_store(path, os.path.getmtime(os.path.join(path, 'meta.json'))), None
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    # Stores created with `python store.py ingest` are analyzed by name instead of uploaded
+    if request.form.get('store'):
+        file, error = _trade_store(request.form['store'])
+    else:
+        file, error = _uploaded_csv()
+    if error:
+        return error
     
-    # Group by normalized asset
-    for asset, group in df.groupby('normalized_asset'):
-        trades = group.to_dict('records')
-        
-        for i in range(len(trades)):
-            trade1 = trades[i]
+    # Get parameters from request
+    try:
+        params = analysis_params(request.form)
+    except InvalidInput as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Long analyses can run as a background job instead
+    if _form_flag('async') and not request.form.get('store'):
+        return create_job()
+    
+    need = 0
+    if not request.form.get('store'):
+        upload_bytes = request.content_length or 0
+        if upload_bytes > chunked_upload_bytes:
+            params['chunksize'] = params['chunksize'] or DEFAULT_CHUNKSIZE
+        need = expected_memory(file.stream, upload_bytes, params['chunksize'])
+    
+    timings = None
+    try:
+        # Analyses wait for a free slot and enough memory, or are turned away with 503
+        with (admission.admit(need),
+              instrument('analyze', profile_dir if _form_flag('profile') else None) as timings):
+            # timings=true adds stage timings to the response, profile=true dumps a cProfile
+            result = run_analysis(file, cache=_request_cache(), **params)
+            if request.form.get('format', 'full') == 'compact':
+                result = ResultTable.from_analysis(result).compact()
             
-            # Skip if entry or close time is missing
-            if pd.isna(trade1['entry_time']) or pd.isna(trade1['close_time']):
-                continue
-                
-            for j in range(i + 1, len(trades)):
-                trade2 = trades[j]
-                
-                # Skip if entry or close time is missing
-                if pd.isna(trade2['entry_time']) or pd.isna(trade2['close_time']):
-                    continue
-                
-                # Check if trades have opposite directions
-                if trade1['short_long'] != trade2['short_long']:
-                    # Check if one is LONG and the other is SHORT
-                    if set([trade1['short_long'], trade2['short_long']]) == set(['LONG', 'SHORT']):
-                        # Check if entry prices are within threshold
-                        price_diff = abs(float(trade1['avg_market_entry']) - float(trade2['avg_market_entry']))
-                        
-                        if price_diff <= price_threshold:
-                            # Check if timeframes overlap
-                            time_overlap = ((trade2['entry_time'] >= trade1['entry_time'] and 
-                                            trade2['entry_time'] <= trade1['close_time']) or 
-                                           (trade1['entry_time'] >= trade2['entry_time'] and 
-                                            trade1['entry_time'] <= trade2['close_time']))
-                            
-                            if time_overlap:
-                                # Calculate confidence score
-                                confidence_score = calculate_confidence_score(
-                                    trade1, trade2, price_diff, price_threshold, 
-                                    time_overlap, include_close_price
-                                )
-                                
-                                # Only include pairs with confidence above threshold
-                                if confidence_score >= confidence_threshold:
-                                    # Determine hedge type
-                                    hedge_type = 'self_hedge' if trade1['user_id'] == trade2['user_id'] else 'inter_user_hedge'
-                                    
-                                    # Format entry and close times for display
-                                    entry_time1 = datetime.fromtimestamp(trade1['entry_time']/1000).strftime('%Y-%m-%d %H:%M:%S')
-                                    close_time1 = datetime.fromtimestamp(trade1['close_time']/1000).strftime('%Y-%m-%d %H:%M:%S')
-                                    entry_time2 = datetime.fromtimestamp(trade2['entry_time']/1000).strftime('%Y-%m-%d %H:%M:%S')
-                                    close_time2 = datetime.fromtimestamp(trade2['close_time']/1000).strftime('%Y-%m-%d %H:%M:%S')
-                                    
-                                    # Create hedge pair object
-                                    hedge_pair = {
-                                        'id': pair_id,
-                                        'type': hedge_type,
-                                        'asset': asset,
-                                        'trade1': {
-                                            'tradehash': trade1['tradehash'],
-                                            'direction': trade1['short_long'],
-                                            'entry_time': entry_time1,
-                                            'close_time': close_time1,
-                                            'entry_price': float(trade1['avg_market_entry']),
-                                            'close_price': float(trade1['avg_market_close']),
-                                            'net_profit': float(trade1['net_profit']),
-                                            'user_id': trade1['user_id'],
-                                            'account_id': trade1['account_id'],
-                                            'quantity': float(trade1['total_contracts'])
-                                        },
-                                        'trade2': {
-                                            'tradehash': trade2['tradehash'],
-                                            'direction': trade2['short_long'],
-                                            'entry_time': entry_time2,
-                                            'close_time': close_time2,
-                                            'entry_price': float(trade2['avg_market_entry']),
-                                            'close_price': float(trade2['avg_market_close']),
-                                            'net_profit': float(trade2['net_profit']),
-                                            'user_id': trade2['user_id'],
-                                            'account_id': trade2['account_id'],
-                                            'quantity': float(trade2['total_contracts'])
-                                        },
-                                        'entry_price_diff': price_diff,
-                                        'confidence': confidence_score,
-                                        'net_profit': float(trade1['net_profit']) + float(trade2['net_profit'])
-                                    }
-                                    
-                                    hedge_pairs.append(hedge_pair)
-                                    pair_id += 1
-    
-    return hedge_pairs
+            with stage('serialize', rows_in=len(result['hedge_pairs'])):
+                if _form_flag('timings'):
+                    result['timings'] = timings.as_dict()
+                response = jsonify(result)
+            count('response_bytes', response.content_length or 0)
+        return response
+    
+    except Overloaded as e:
+        return _overloaded(e)
+    except TooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        # Failures are logged with their traceback under the request id
+        status = 400 if isinstance(e, INPUT_ERRORS) else 500
+        error = {'error': str(e), 'type': type(e).__name__}
+        if timings is not None:
+            error.update(request_id=timings.request_id, stage=timings.failed_stage)
+        return jsonify(error), status
 
-def calculate_confidence_score(trade1, trade2, price_diff, price_threshold, time_overlap, include_close_price):
-    """Calculate confidence score based on how well the pair matches hedging criteria"""
-    score = 0
-    
-    # Price similarity (closer prices = higher score)
-    score += 0.4 * (1 - price_diff / price_threshold)
-    
-    # Time overlap
-    score += 0.3
-    
-    # If including close prices in matching
-    if include_close_price:
-        close_price_diff = abs(float(trade1['avg_market_close']) - float(trade2['avg_market_close']))
-        
-        # Close price similarity (closer prices = higher score)
-        score += 0.3 * (1 - min(close_price_diff / price_threshold, 1))
-    else:
-        # If not considering close prices, distribute the weight elsewhere
-        score += 0.15  # Add half of the potential close price score as a baseline
+def _overloaded(error):
+    response = jsonify({'error': str(error), 'reason': error.reason})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    limit = app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    return jsonify({'error': f'Upload is larger than the {limit:g} MB limit'}), 413
+
+@app.route('/admission/stats')
+def admission_stats():
+    return jsonify(admission.report())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    if analysis_cache is None:
+        return jsonify({'backend': 'off'})
+    return jsonify(analysis_cache.report())
+
+@app.route('/stores/<name>')
+def store_status(name):
+    store, error = _trade_store(name)
+    if error:
+        return error
+    return jsonify({'name': name, **store.describe()})
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    file, error = _uploaded_csv()
+    if error:
+        return error
     
-    # Quantity similarity (optional bonus)
-    qty1 = float(trade1['total_contracts'])
-    qty2 = float(trade2['total_contracts'])
-    if qty1 == qty2:
-        score += 0.1
+    try:
+        params = analysis_params(request.form)
+        check_detection_params(params['price_threshold'], params['engine'])
+    except InvalidInput as e:
+        return jsonify({'error': str(e)}), 400
     
-    return min(max(score, 0), 1)  # Ensure score is between 0 and 1
-
-def generate_summary_stats(hedge_pairs, df):
-    """Generate summary statistics for the detected hedge pairs"""
-    if not hedge_pairs:
-        return {
-            'total_hedges': 0,
-            'self_hedges': 0,
-            'inter_user_hedges': 0,
-            'avg_confidence': 0,
-            'users_involved': 0,
-            'accounts_involved': 0,
-            'users_percentage': 0,
-            'accounts_percentage': 0
-        }
+    # Jobs always stream the stored upload so memory stays bounded
+    params['chunksize'] = params['chunksize'] or DEFAULT_CHUNKSIZE
     
-    # Count hedge types
-    self_hedges = sum(1 for pair in hedge_pairs if pair['type'] == 'self_hedge')
-    inter_user_hedges = len(hedge_pairs) - self_hedges
+    # A job the host could never admit would wait for memory forever
+    try:
+        admission.check_fits(expected_memory(file.stream, request.content_length or 0, params['chunksize']))
+    except TooLarge as e:
+        return jsonify({'error': str(e)}), 413
     
-    # Calculate average confidence
-    avg_confidence = sum(pair['confidence'] for pair in hedge_pairs) / len(hedge_pairs)
+    try:
+        job = jobs.submit(file, params)
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
     
-    # Count unique users and accounts involved
-    unique_users = set()
-    unique_accounts = set()
+    return jsonify(job), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@lru_cache(maxsize=4)
+def load_result(path):
+    """Load a finished job's ResultTable, keeping the last few in memory for paging"""
+    return ResultTable.load(path)
+
+def _job_result(job_id):
+    """Return a finished job's ResultTable, or an error response"""
+    job = jobs.status(job_id)
+    if job is None:
+        return None, (jsonify({'error': 'Job not found'}), 404)
+    if job['status'] == 'failed':
+        return None, (jsonify({'error': job['error']}), 500)
+    if job['status'] != 'done':
+        return None, (jsonify(job), 409)
+    return load_result(jobs.result_path(job_id)), None
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    result, error = _job_result(job_id)
+    if error:
+        return error
+    if request.args.get('format', 'full') == 'compact':
+        return jsonify(result.compact())
+    return jsonify(result.full())
+
+@app.route('/jobs/<job_id>/summary')
+def job_summary(job_id):
+    result, error = _job_result(job_id)
+    if error:
+        return error
+    return jsonify(result.summary())
+
+@app.route('/jobs/<job_id>/pairs')
+def job_pairs(job_id):
+    """One page of pairs; follow next_cursor with the same sort and filters"""
+    result, error = _job_result(job_id)
+    if error:
+        return error
     
-    for pair in hedge_pairs:
-        unique_users.add(pair['trade1']['user_id'])
-        unique_users.add(pair['trade2']['user_id'])
-        unique_accounts.add(pair['trade1']['account_id'])
-        unique_accounts.add(pair['trade2']['account_id'])
+    try:
+        page = result.page(cursor=request.args.get('cursor'),
+                           limit=_number(request.args, 'limit', DEFAULT_PAGE_SIZE, int),
+                           **page_filters(request.args))
+    except InvalidInput as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Calculate percentages
-    total_users = df['user_id'].nunique()
-    total_accounts = df['account_id'].nunique()
+    return jsonify(page)
+
+@app.route('/jobs/<job_id>/pairs.<export_format>')
+def export_job_pairs(job_id, export_format):
+    """Stream every matching pair as NDJSON or CSV"""
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Export format must be ndjson or csv'}), 404
     
-    users_percentage = (len(unique_users) / total_users * 100) if total_users > 0 else 0
-    accounts_percentage = (len(unique_accounts) / total_accounts * 100) if total_accounts > 0 else 0
+    result, error = _job_result(job_id)
+    if error:
+        return error
     
-    return {
-        'total_hedges': len(hedge_pairs),
-        'self_hedges': self_hedges,
-        'inter_user_hedges': inter_user_hedges,
-        'avg_confidence': avg_confidence,
-        'users_involved': len(unique_users),
-        'accounts_involved': len(unique_accounts),
-        'users_percentage': users_percentage,
-        'accounts_percentage': accounts_percentage
-    }
+    try:
+        filters = page_filters(request.args)
+        rows = result.iter_ndjson(**filters) if export_format == 'ndjson' else result.iter_csv(**filters)
+        first = next(rows, '')
+    except InvalidInput as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        yield first
+        yield from rows
+    
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=hedge_pairs.{export_format}'
+    })
 
-def find_notable_patterns(hedge_pairs, df):
-    """Find notable patterns in the hedge pairs"""
-    if not hedge_pairs:
-        return {
-            'frequent_users': [],
-            'peak_hours': [],
-            'asset_distribution': []
-        }
-    
-    # Find users with multiple hedge pairs
-    user_hedge_counts = {}
-    for pair in hedge_pairs:
-        user1 = pair['trade1']['user_id']
-        user2 = pair['trade2']['user_id']
+STREAM_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+def _stream_path(stream_id):
+    return os.path.join(streams_dir, f'{stream_id}.pkl')
+
+def _stream_expired(path):
+    try:
+        return os.path.getmtime(path) < time.time() - stream_ttl
+    except FileNotFoundError:
+        return True
+
+def _load_stream(stream_id):
+    """Restore a stream's detector from its checkpoint, or None if it does not exist or expired"""
+    if not STREAM_ID_PATTERN.match(stream_id) or _stream_expired(_stream_path(stream_id)):
+        return None
+    return IncrementalDetector.restore(_stream_path(stream_id))
+
+@contextmanager
+def _locked_stream(stream_id, blocking=True):
+    """Hold a stream's lock file, shared by every worker process, while the block runs.
+
+    Yields False instead of waiting when blocking is off and the stream is busy.
+    """
+    if fcntl is None:
+        if stream_lock.acquire(blocking):
+            try:
+                yield True
+            finally:
+                stream_lock.release()
+        else:
+            yield False
+        return
+    os.makedirs(streams_dir, exist_ok=True)
+    with open(os.path.join(streams_dir, f'{stream_id}.lock'), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+def prune_streams():
+    """Remove the checkpoints and lock files of streams idle for longer than stream_ttl"""
+    if not os.path.isdir(streams_dir):
+        return
+    for name in os.listdir(streams_dir):
+        stream_id, _, extension = name.partition('.')
+        if extension not in ('pkl', 'lock') or not STREAM_ID_PATTERN.match(stream_id):
+            continue
+        if not _stream_expired(_stream_path(stream_id)):
+            continue
+        # Streams taking a batch right now are left alone
+        with _locked_stream(stream_id, blocking=False) as locked:
+            if locked and _stream_expired(_stream_path(stream_id)):
+                for path in (_stream_path(stream_id), os.path.join(streams_dir, f'{stream_id}.lock')):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+@app.route('/streams', methods=['POST'])
+def create_stream():
+    """Start an incremental detector fed with trade batches through /streams/<id>/trades"""
+    try:
+        params = analysis_params(request.form)
+        lateness = request.form.get('allowed_lateness')
+        detector = IncrementalDetector(
+            params['price_threshold'], params['confidence_threshold'], params['include_close_price'],
+            allowed_lateness=_number(request.form, 'allowed_lateness', None) if lateness else None
+        )
+    except InvalidInput as e:
+        return jsonify({'error': str(e)}), 400
+    
+    prune_streams()
+    stream_id = uuid.uuid4().hex
+    os.makedirs(streams_dir, exist_ok=True)
+    detector.checkpoint(_stream_path(stream_id))
+    return jsonify({'id': stream_id, **detector.status()}), 201
+
+@app.route('/streams/<stream_id>')
+def stream_status(stream_id):
+    detector = _load_stream(stream_id)
+    if detector is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify({'id': stream_id, **detector.status()})
+
+@app.route('/streams/<stream_id>/trades', methods=['POST'])
+def stream_trades(stream_id):
+    """Add a CSV batch of trades to a stream and return only the new hedge pairs"""
+    file, error = _uploaded_csv()
+    if error:
+        return error
+    
+    if not STREAM_ID_PATTERN.match(stream_id) or _stream_expired(_stream_path(stream_id)):
+        return jsonify({'error': 'Stream not found'}), 404
+    
+    # Batches of one stream are applied one at a time, whichever worker receives them
+    with _locked_stream(stream_id):
+        detector = _load_stream(stream_id)
+        if detector is None:
+            return jsonify({'error': 'Stream not found'}), 404
         
-        user_hedge_counts[user1] = user_hedge_counts.get(user1, 0) + 1
-        if user1 != user2:
-            user_hedge_counts[user2] = user_hedge_counts.get(user2, 0) + 1
-    
-    # Find users with high hedge counts
-    frequent_users = [
-        {'user_id': user_id, 'count': count}
-        for user_id, count in user_hedge_counts.items()
-        if count >= 3
-    ]
-    frequent_users.sort(key=lambda x: x['count'], reverse=True)
-    
-    # Check for time patterns (e.g., same time of day)
-    hour_patterns = {}
-    for pair in hedge_pairs:
-        # Convert timestamp to datetime
-        entry_time = datetime.strptime(pair['trade1']['entry_time'], '%Y-%m-%d %H:%M:%S')
-        hour = entry_time.hour
+        try:
+            watermark = request.form.get('watermark')
+            trades = prepare_trades(pd.read_csv(file))
+            hedge_pairs = detector.add_batch(
+                trades, _number(request.form, 'watermark', None) if watermark else None
+            )
+        except INPUT_ERRORS as e:
+            return jsonify({'error': str(e)}), 400
         
-        hour_patterns[hour] = hour_patterns.get(hour, 0) + 1
-    
-    # Find peak hours (hours with at least 80% of the max count)
-    max_hour_count = max(hour_patterns.values()) if hour_patterns else 0
-    peak_hours = [
-        {'hour': hour, 'count': count, 'percentage': count / len(hedge_pairs) * 100}
-        for hour, count in hour_patterns.items()
-        if count >= max_hour_count * 0.8
-    ]
-    peak_hours.sort(key=lambda x: x['count'], reverse=True)
-    
-    # Check for asset patterns
-    asset_patterns = {}
-    for pair in hedge_pairs:
-        asset = pair['asset']
-        asset_patterns[asset] = asset_patterns.get(asset, 0) + 1
+        detector.checkpoint(_stream_path(stream_id))
     
-    asset_distribution = [
-        {'asset': asset, 'count': count, 'percentage': count / len(hedge_pairs) * 100}
-        for asset, count in asset_patterns.items()
-    ]
-    asset_distribution.sort(key=lambda x: x['count'], reverse=True)
-    
-    return {
-        'frequent_users': frequent_users,
-        'peak_hours': peak_hours,
-        'asset_distribution': asset_distribution
-    }
+    return jsonify({'id': stream_id, 'hedge_pairs': hedge_pairs, **detector.status()})
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
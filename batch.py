@@ -0,0 +1,366 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from cache import hash_source
+from clusters import CLUSTER_MIN_PAIRS
+from detection import (check_detection_params, find_candidates, find_hedge_clusters, find_notable_patterns,
+                       generate_summary_stats, ingest_trade_store, match_asset_group, open_trade_store,
+                       run_analysis, symbol_normalizer)
+from errors import InvalidInput
+from ingest import DEFAULT_CHUNKSIZE
+from patterns import PairColumns
+from store import STORE_NAME_PATTERN, is_trade_store
+
+# Bump when the output layout changes; older outputs are then rebuilt
+MANIFEST_VERSION = 1
+
+
+def day_files(inputs):
+    """(day, path) of every CSV in the given directories, glob patterns or paths, in name order
+
+    A day is named by its file name without extension, so date-stamped
+    names such as 2025-06-02.csv sort chronologically.
+    """
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matched = glob.glob(os.path.join(pattern, '*.csv'))
+        else:
+            matched = glob.glob(pattern)
+        if not matched:
+            raise InvalidInput(f"No CSV files match '{pattern}'")
+        paths.update(os.path.abspath(path) for path in matched)
+
+    days = {}
+    for path in sorted(paths, key=os.path.basename):
+        day = os.path.splitext(os.path.basename(path))[0]
+        if not STORE_NAME_PATTERN.match(day):
+            raise InvalidInput(f"Invalid day name '{day}' from {path}")
+        if day in days:
+            raise InvalidInput(f"Day '{day}' is given twice: {days[day]} and {path}")
+        days[day] = path
+    return list(days.items())
+
+
+def write_json(path, value):
+    """Write JSON through a temporary file, so an interrupted run leaves no partial file"""
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(value, f, indent=2)
+        f.write('\n')
+    os.replace(f'{path}.tmp', path)
+
+
+def write_pairs(path, hedge_pairs):
+    """Write hedge pairs as one JSON line each"""
+    with open(f'{path}.tmp', 'w') as f:
+        for pair in hedge_pairs:
+            f.write(json.dumps(pair) + '\n')
+    os.replace(f'{path}.tmp', path)
+
+
+def read_pairs(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def store_path(output, day):
+    return os.path.join(output, 'stores', day)
+
+
+def day_dir(output, day):
+    return os.path.join(output, 'days', day)
+
+
+def crossing_path(output, previous_day, day):
+    return os.path.join(output, 'crossings', f'{previous_day}__{day}.ndjson')
+
+
+def analysis_params(price_threshold, confidence_threshold, include_close_price,
+                    cluster_min_pairs=CLUSTER_MIN_PAIRS):
+    """Everything the pairs depend on; outputs made with other params are rebuilt"""
+    return {
+        'price_threshold': price_threshold,
+        'confidence_threshold': confidence_threshold,
+        'include_close_price': include_close_price,
+        'cluster_min_pairs': cluster_min_pairs,
+        'symbols': symbol_normalizer.fingerprint
+    }
+
+
+def load_manifest(output, params):
+    """The manifest of output, or an empty one when it is missing, outdated or made with other params"""
+    empty = {'version': MANIFEST_VERSION, 'params': params, 'days': {}, 'crossings': {}}
+    try:
+        with open(os.path.join(output, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return empty
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('params') != params:
+        return empty
+    return manifest
+
+
+def process_day(day, path, output, params, chunksize, known_hash=None):
+    """Store and analyze one daily CSV, writing its pairs and summary; runs in a worker process
+
+    Returns the manifest entry of the day, or None when its contents still
+    hash to known_hash. A store left by an earlier run of the same file is
+    reused instead of ingesting the CSV again.
+    """
+    start = time.perf_counter()
+    source_hash = hash_source(path)
+    if source_hash == known_hash:
+        return None
+
+    store = None
+    if is_trade_store(store_path(output, day)):
+        try:
+            store = open_trade_store(store_path(output, day))
+        except ValueError:
+            # Stores of an older layout are ingested again
+            pass
+    if store is None or store.source_hash != source_hash:
+        store = ingest_trade_store(path, store_path(output, day), chunksize)
+
+    # Matching reads one asset group of the store at a time
+    result = run_analysis(store, params['price_threshold'], params['confidence_threshold'],
+                          params['include_close_price'], cluster_min_pairs=params['cluster_min_pairs'])
+
+    directory = day_dir(output, day)
+    os.makedirs(directory, exist_ok=True)
+    write_pairs(os.path.join(directory, 'pairs.ndjson'), result['hedge_pairs'])
+    write_json(os.path.join(directory, 'summary.json'), {
+        'day': day,
+        'rows': store.rows,
+        'total_pairs': len(result['hedge_pairs']),
+        'summary_stats': result['summary_stats'],
+        'notable_patterns': result['notable_patterns'],
+        'hedge_clusters': result['hedge_clusters']
+    })
+    return {
+        'file': path,
+        'source_hash': store.source_hash,
+        'rows': store.rows,
+        'pairs': len(result['hedge_pairs']),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def cross_day_pairs(previous, current, price_threshold, confidence_threshold, include_close_price):
+    """Hedge pairs of one trade from the previous day's store and one from the current day's.
+
+    Only trades whose time span overlaps the other day's trades can pair
+    across days, which is mostly positions held over midnight, so each asset
+    group is cut down to those before matching. Pairs inside one day are
+    left to that day's own analysis.
+    """
+    hedge_pairs = []
+    for asset in previous.keys():
+        if asset not in current.sizes:
+            continue
+        earlier, later = previous.load(asset), current.load(asset)
+        earlier = earlier[(earlier['close_time'] >= later['entry_time'].min())
+                          & (earlier['entry_time'] <= later['close_time'].max())]
+        later = later[(later['close_time'] >= earlier['entry_time'].min())
+                      & (later['entry_time'] <= earlier['close_time'].max())]
+        if earlier.empty or later.empty:
+            continue
+
+        # Same order as in the two files read one after the other
+        group = pd.concat([earlier, later], ignore_index=True)
+        pairs_i, pairs_j = find_candidates({asset: group}, price_threshold)[asset]
+        across = (pairs_i < len(earlier)) != (pairs_j < len(earlier))
+        hedge_pairs.extend(match_asset_group(
+            asset, group, price_threshold, confidence_threshold, include_close_price,
+            start_id=len(hedge_pairs) + 1, candidates=(pairs_i[across], pairs_j[across])
+        ))
+    return hedge_pairs
+
+
+def process_crossing(previous_day, day, output, params):
+    """Match the trades of two adjacent days against each other; runs in a worker process"""
+    start = time.perf_counter()
+    previous = open_trade_store(store_path(output, previous_day))
+    current = open_trade_store(store_path(output, day))
+    hedge_pairs = cross_day_pairs(previous, current, params['price_threshold'],
+                                  params['confidence_threshold'], params['include_close_price'])
+    write_pairs(crossing_path(output, previous_day, day), hedge_pairs)
+    return {
+        'source_hashes': [previous.source_hash, current.source_hash],
+        'pairs': len(hedge_pairs),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def merge_reports(output, days, params):
+    """Write the pairs of all days and the crossings between them as one report
+
+    Pairs are renumbered and tagged with the day or two days they come from.
+    Statistics, patterns and clusters are computed again over all of them,
+    with users and accounts counted once across days.
+    """
+    sources = []
+    for k, day in enumerate(days):
+        sources.append(([day], os.path.join(day_dir(output, day), 'pairs.ndjson')))
+        if k + 1 < len(days):
+            sources.append(([day, days[k + 1]], crossing_path(output, day, days[k + 1])))
+
+    directory = os.path.join(output, 'merged')
+    os.makedirs(directory, exist_ok=True)
+    parts = []
+    pair_id = 0
+    # Pairs are read one file at a time; only their column view is kept
+    with open(os.path.join(directory, 'pairs.ndjson.tmp'), 'w') as f:
+        for span, path in sources:
+            hedge_pairs = read_pairs(path)
+            for pair in hedge_pairs:
+                pair_id += 1
+                f.write(json.dumps({**pair, 'id': pair_id, 'days': span}) + '\n')
+            parts.append(PairColumns(hedge_pairs))
+    os.replace(os.path.join(directory, 'pairs.ndjson.tmp'), os.path.join(directory, 'pairs.ndjson'))
+
+    # Users and accounts with valid trades on any of the days
+    users, accounts, rows = set(), set(), 0
+    for day in days:
+        store = open_trade_store(store_path(output, day))
+        users.update(store.meta['dictionaries']['user_id'])
+        accounts.update(store.meta['dictionaries']['account_id'])
+        rows += store.rows
+
+    pairs = PairColumns.concat(parts)
+    write_json(os.path.join(directory, 'summary.json'), {
+        'days': days,
+        'rows': rows,
+        'total_pairs': len(pairs),
+        'cross_day_pairs': sum(len(part) for (span, _), part in zip(sources, parts) if len(span) == 2),
+        'summary_stats': generate_summary_stats(pairs, total_users=len(users), total_accounts=len(accounts)),
+        'notable_patterns': find_notable_patterns(pairs),
+        'hedge_clusters': find_hedge_clusters(pairs, params['cluster_min_pairs'])
+    })
+    return len(pairs)
+
+
+def run_batch(inputs, output, params, workers=None, chunksize=DEFAULT_CHUNKSIZE, force=False, log=None):
+    """Analyze a set of daily CSVs into output, skipping days the manifest shows as done.
+
+    Days are processed in parallel, one per worker process, each streaming
+    its file in chunks. Adjacent days are then matched against each other,
+    and finally merged results over all days are written. Returns a report
+    of what was processed, skipped or failed.
+    """
+    check_detection_params(params['price_threshold'], 'sweep')
+    if params['cluster_min_pairs'] < 1:
+        raise InvalidInput('cluster_min_pairs must be at least 1')
+    days = day_files(inputs)
+    names = [day for day, _ in days]
+    os.makedirs(output, exist_ok=True)
+    manifest = load_manifest(output, params)
+    if force:
+        manifest['days'], manifest['crossings'] = {}, {}
+    log = log or (lambda message: None)
+
+    def save():
+        write_json(os.path.join(output, 'manifest.json'), manifest)
+
+    def done(day):
+        entry = manifest['days'].get(day)
+        if entry and os.path.exists(os.path.join(day_dir(output, day), 'summary.json')):
+            return entry['source_hash']
+        return None
+
+    status = {day: 'skipped' for day in names}
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_day, day, path, output, params, chunksize, done(day)): day
+            for day, path in days
+        }
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed[day] = f'{type(e).__name__}: {e}'
+                status[day] = 'failed'
+                log(f'{day}: failed: {failed[day]}')
+                continue
+            if entry is not None:
+                manifest['days'][day] = entry
+                status[day] = 'processed'
+                save()
+                log(f"{day}: {entry['rows']} rows, {entry['pairs']} pairs ({entry['seconds']} s)")
+
+        # Trades of adjacent days, typically held over midnight, are matched once both days are stored
+        futures = {}
+        for previous_day, day in zip(names, names[1:]):
+            if previous_day in failed or day in failed:
+                continue
+            key = f'{previous_day}/{day}'
+            hashes = [manifest['days'][previous_day]['source_hash'], manifest['days'][day]['source_hash']]
+            entry = manifest['crossings'].get(key)
+            if entry and entry['source_hashes'] == hashes and os.path.exists(
+                    crossing_path(output, previous_day, day)):
+                continue
+            os.makedirs(os.path.join(output, 'crossings'), exist_ok=True)
+            futures[executor.submit(process_crossing, previous_day, day, output, params)] = key
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                manifest['crossings'][key] = future.result()
+            except Exception as e:
+                failed[key] = f'{type(e).__name__}: {e}'
+                log(f'{key}: failed: {failed[key]}')
+                continue
+            save()
+            log(f"{key}: {manifest['crossings'][key]['pairs']} cross-day pairs")
+
+    report = {'output': output, 'days': status, 'crossings': len(manifest['crossings'])}
+    if failed:
+        return {**report, 'failed': failed}
+
+    # The merged report covers exactly the days of this run
+    merged = {'days': names, 'day_hashes': [manifest['days'][day]['source_hash'] for day in names]}
+    if merged != manifest.get('merged', {}).get('sources') or not os.path.exists(
+            os.path.join(output, 'merged', 'summary.json')):
+        manifest['merged'] = {'sources': merged, 'pairs': merge_reports(output, names, params)}
+        save()
+        log(f"merged: {manifest['merged']['pairs']} pairs over {len(names)} days")
+    return {**report, 'total_pairs': manifest['merged']['pairs']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze a directory of daily trade CSVs')
+    parser.add_argument('inputs', nargs='+', help="directories of CSVs, glob patterns like 'trades/2025-06-*.csv' or files")
+    parser.add_argument('--output', required=True, help='directory for the stores, per-day and merged results')
+    parser.add_argument('--price-threshold', type=float, default=5.0)
+    parser.add_argument('--confidence-threshold', type=float, default=0.7)
+    parser.add_argument('--no-close-price', dest='include_close_price', action='store_false',
+                        help='leave the close price out of scoring')
+    parser.add_argument('--cluster-min-pairs', type=int, default=CLUSTER_MIN_PAIRS)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('HEDGE_WORKERS', 0)) or None,
+                        help='days processed at once (default: HEDGE_WORKERS or the number of CPUs)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--force', action='store_true', help='reprocess days the manifest shows as done')
+    args = parser.parse_args(argv)
+
+    params = analysis_params(args.price_threshold, args.confidence_threshold, args.include_close_price,
+                             args.cluster_min_pairs)
+    try:
+        report = run_batch(args.inputs, args.output, params, args.workers, args.chunksize, args.force,
+                           log=lambda message: print(message, file=sys.stderr))
+    except InvalidInput as e:
+        parser.error(str(e))
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 1 if 'failed' in report else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
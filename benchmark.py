@@ -0,0 +1,374 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+import detection
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Contract symbol and starting price of each root in the asset mix; NQ and
+# MNQ normalize to the same asset and share one price path
+CONTRACTS = {
+    'NQ': ('NQM5', 18000.0),
+    'MNQ': ('MNQM5', 18000.0),
+    'ES': ('ESM5', 5200.0),
+    'CL': ('CLN5', 75.0)
+}
+PRICE_PATHS = {'NQ': 'NQ', 'MNQ': 'NQ', 'ES': 'ES', 'CL': 'CL'}
+
+DEFAULT_ASSET_MIX = {'NQ': 0.4, 'MNQ': 0.2, 'ES': 0.3, 'CL': 0.1}
+
+START_TIME = 1745000000000  # epoch ms of the first generated trading day
+DAY_MS = 24 * 3600 * 1000
+MINUTE_MS = 60 * 1000
+
+STAGES = ['read_csv', 'parse_lists', 'matching', 'scoring', 'summary_stats', 'notable_patterns', 'json']
+
+
+def parse_asset_mix(text):
+    """Parse an asset mix such as 'NQ=0.4,MNQ=0.2,ES=0.3,CL=0.1' into weights"""
+    mix = {}
+    for part in text.split(','):
+        root, _, weight = part.partition('=')
+        root = root.strip().upper()
+        if root not in CONTRACTS:
+            raise ValueError(f"Unknown asset '{root}', expected one of {', '.join(CONTRACTS)}")
+        mix[root] = float(weight)
+    return mix
+
+
+def generate_trades(rows, seed=0, asset_mix=None, hedge_density=0.1, volatility=8.0,
+                    duration=300.0, trades_per_day=5000, users=500, accounts_per_user=2):
+    """Generate a synthetic trade frame in the CSV schema find_hedge_pairs reads.
+
+    Prices of each root follow a random walk with volatility points per
+    minute, trade durations are exponential with a mean of duration seconds
+    and entries are spread over rows / trades_per_day days. A hedge_density
+    share of the rows are deliberate hedges: the opposite side of an earlier
+    trade at nearly the same price and time, by the same user a third of the
+    time.
+    """
+    rng = np.random.default_rng(seed)
+    asset_mix = asset_mix or DEFAULT_ASSET_MIX
+    roots = list(asset_mix)
+    weights = np.array([asset_mix[root] for root in roots], dtype=float)
+
+    days = max(rows / trades_per_day, 1 / 24)
+    span = int(days * DAY_MS)
+    minutes = span // MINUTE_MS + 2
+
+    root_codes = rng.choice(len(roots), size=rows, p=weights / weights.sum())
+    entry_time = START_TIME + np.sort(rng.integers(0, span, size=rows))
+    hold = np.maximum(rng.exponential(duration * 1000, size=rows), 1000).astype(np.int64)
+    side = rng.integers(0, 2, size=rows)
+    user_id = rng.integers(1, users + 1, size=rows)
+    account_id = user_id * 10 + rng.integers(0, accounts_per_user, size=rows)
+    quantity = rng.integers(1, 6, size=rows)
+
+    # Deliberate hedges mirror a random earlier trade
+    hedges = np.flatnonzero(rng.random(rows) < hedge_density)
+    hedges = hedges[hedges > 0]
+    partners = (rng.random(len(hedges)) * hedges).astype(np.int64)
+    root_codes[hedges] = root_codes[partners]
+    side[hedges] = 1 - side[partners]
+    entry_time[hedges] = entry_time[partners] + (rng.random(len(hedges)) * hold[partners] / 2).astype(np.int64)
+    hold[hedges] = hold[partners]
+    same_user = rng.random(len(hedges)) < 1 / 3
+    user_id[hedges] = np.where(same_user, user_id[partners], user_id[hedges])
+    account_id[hedges] = np.where(same_user, account_id[partners], account_id[hedges])
+    quantity[hedges] = np.where(rng.random(len(hedges)) < 0.5, quantity[partners], quantity[hedges])
+    close_time = entry_time + hold
+
+    entry_price = np.empty(rows)
+    close_price = np.empty(rows)
+    paths = {}
+    for code, root in enumerate(roots):
+        path_root = PRICE_PATHS[root]
+        if path_root not in paths:
+            base = CONTRACTS[path_root][1]
+            # volatility is given for NQ; other roots move by the same relative amount
+            steps = rng.normal(0, volatility * base / CONTRACTS['NQ'][1], minutes)
+            paths[path_root] = np.maximum(base + np.cumsum(steps), base * 0.1)
+        path = paths[path_root]
+        mask = root_codes == code
+        tick = 0.01 if root == 'CL' else 0.25
+        entry_minute = (entry_time[mask] - START_TIME) // MINUTE_MS
+        close_minute = np.minimum((close_time[mask] - START_TIME) // MINUTE_MS, minutes - 1)
+        entry_price[mask] = np.round(path[entry_minute] / tick) * tick
+        close_price[mask] = np.round(path[close_minute] / tick) * tick
+    entry_price[hedges] = entry_price[partners] + np.round(rng.normal(0, 0.5, len(hedges)) * 4) / 4
+
+    direction = np.where(side == 1, 1.0, -1.0)
+    net_profit = np.round((close_price - entry_price) * direction * quantity * 20, 2)
+
+    # Some trades are filled in two parts, which gives two-element lists
+    split = rng.random(rows) < 0.2
+    second_fill = entry_time + (hold // 4)
+    symbols = np.array([CONTRACTS[root][0] for root in roots])
+
+    def list_column(first, second=None):
+        text = pd.Series(first).astype(str)
+        if second is not None:
+            text = text.where(~split, text + ', ' + pd.Series(second).astype(str))
+        return '[' + text + ']'
+
+    return pd.DataFrame({
+        'tradehash': [f'{seed:x}-{k:x}' for k in range(rows)],
+        'short_long': np.where(side == 1, 'LONG', 'SHORT'),
+        'asset': symbols[root_codes],
+        'entry_datetimes': list_column(entry_time, second_fill),
+        'market_entries': list_column(entry_price, entry_price),
+        'close_datetimes': list_column(close_time),
+        'market_closes': list_column(close_price),
+        'avg_market_entry': entry_price,
+        'avg_market_close': close_price,
+        'account_id': account_id,
+        'user_id': user_id,
+        'net_profit': net_profit,
+        'total_contracts': quantity
+    })
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_pipeline(path, price_threshold=5.0, confidence_threshold=0.7, include_close_price=True,
+                 engine='sweep', workers=None):
+    """Run each analysis stage on a CSV and time it on its own.
+
+    Stages follow find_hedge_pairs and run_analysis: read_csv, parse_lists
+    (prepare_trades), matching (candidate search), scoring
+    (score_candidates and building pair dicts), summary_stats,
+    notable_patterns and json serialization of the response.
+    """
+    stages = {}
+    counts = {}
+
+    def timed(name, rows_in, func):
+        """Run func as one stage; rows_in=None counts the rows it returns"""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func()
+        seconds = time.perf_counter() - wall
+        if rows_in is None:
+            rows_in = len(result)
+        stages[name] = {
+            'seconds': round(seconds, 6),
+            'cpu_seconds': round(time.process_time() - cpu, 6),
+            'rows_in': rows_in,
+            'rows_per_second': round(rows_in / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1)
+        }
+        return result
+
+    df = timed('read_csv', None, lambda: pd.read_csv(path))
+    counts['csv_bytes'] = os.path.getsize(path)
+    rows = len(df)
+
+    detection.check_detection_params(price_threshold, engine)
+    trades = timed('parse_lists', rows, lambda: detection.prepare_trades(df))
+    groups = dict(tuple(trades.groupby('normalized_asset')))
+
+    with detection.matching_pool(workers) as executor:
+        candidates = timed('matching', rows,
+                           lambda: detection.find_candidates(groups, price_threshold, engine, executor))
+    counts['candidates'] = int(sum(len(pairs_i) for pairs_i, _ in candidates.values()))
+
+    def score():
+        hedge_pairs = []
+        for asset, group in groups.items():
+            hedge_pairs.extend(detection.match_asset_group(
+                asset, group, price_threshold, confidence_threshold, include_close_price, engine,
+                start_id=len(hedge_pairs) + 1, candidates=candidates[asset]
+            ))
+        return hedge_pairs
+
+    hedge_pairs = timed('scoring', counts['candidates'], score)
+    counts['pairs'] = len(hedge_pairs)
+
+    summary_stats = timed('summary_stats', len(hedge_pairs),
+                          lambda: detection.generate_summary_stats(hedge_pairs, df))
+    notable_patterns = timed('notable_patterns', len(hedge_pairs),
+                             lambda: detection.find_notable_patterns(hedge_pairs, df))
+    payload = timed('json', len(hedge_pairs), lambda: json.dumps({
+        'hedge_pairs': hedge_pairs,
+        'summary_stats': summary_stats,
+        'notable_patterns': notable_patterns
+    }))
+    counts['json_bytes'] = len(payload)
+
+    total = sum(stage['seconds'] for stage in stages.values())
+    return {
+        'rows': rows,
+        **counts,
+        'total_seconds': round(total, 6),
+        'rows_per_second': round(rows / total, 1) if total > 0 else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': stages
+    }
+
+
+def _benchmark_size(task):
+    """Worker task: generate one CSV and run the pipeline on it in a fresh process"""
+    rows, generator_params, pipeline_params, directory = task
+    path = os.path.join(directory, f'trades-{rows}.csv')
+    generate_trades(rows, **generator_params).to_csv(path, index=False)
+    try:
+        return run_pipeline(path, **pipeline_params)
+    finally:
+        os.remove(path)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, generator_params, pipeline_params, repeat=1):
+    """Benchmark every size in its own process so peak memory is per size"""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    result = executor.submit(
+                        _benchmark_size, (rows, generator_params, pipeline_params, directory)
+                    ).result()
+                results.append(result)
+                print(f"{rows:>9} rows: {result['total_seconds']:.2f}s, {result['pairs']} pairs, "
+                      f"peak {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'generator': generator_params,
+        'pipeline': pipeline_params,
+        'results': results
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.2):
+    """Stage timings of current relative to baseline, matched by row count.
+
+    Stages slower by more than tolerance are listed as regressions.
+    """
+    base = {result['rows']: result for result in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        reference = base.get(result['rows'])
+        if reference is None:
+            continue
+        for stage in STAGES:
+            before = reference['stages'].get(stage, {}).get('seconds')
+            after = result['stages'].get(stage, {}).get('seconds')
+            if not before or after is None:
+                continue
+            ratio = after / before
+            comparison.append({
+                'rows': result['rows'],
+                'stage': stage,
+                'baseline_seconds': before,
+                'seconds': after,
+                'ratio': round(ratio, 3),
+                'regression': ratio > 1 + tolerance
+            })
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hedge detection pipeline')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_generator_args(command):
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--asset-mix', type=parse_asset_mix, default=DEFAULT_ASSET_MIX,
+                             help="root weights, e.g. 'NQ=0.4,MNQ=0.2,ES=0.3,CL=0.1'")
+        command.add_argument('--hedge-density', type=float, default=0.1,
+                             help='share of rows generated as deliberate hedges')
+        command.add_argument('--volatility', type=float, default=8.0, help='NQ points per minute')
+        command.add_argument('--duration', type=float, default=300.0, help='mean trade duration in seconds')
+        command.add_argument('--trades-per-day', type=int, default=5000)
+
+    generate = commands.add_parser('generate', help='write a synthetic trade CSV')
+    generate.add_argument('rows', type=int)
+    generate.add_argument('output')
+    add_generator_args(generate)
+
+    run = commands.add_parser('run', help='time every pipeline stage at several sizes')
+    run.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES)
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--price-threshold', type=float, default=5.0)
+    run.add_argument('--confidence-threshold', type=float, default=0.7)
+    run.add_argument('--engine', default='sweep')
+    run.add_argument('--workers', type=int, default=0)
+    run.add_argument('--output', help='write the JSON report here instead of stdout')
+    add_generator_args(run)
+
+    compare = commands.add_parser('compare', help='compare two JSON reports stage by stage')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--tolerance', type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        comparison = compare_reports(baseline, current, args.tolerance)
+        json.dump(comparison, sys.stdout, indent=2)
+        print()
+        return 1 if any(entry['regression'] for entry in comparison) else 0
+
+    generator_params = {
+        'seed': args.seed,
+        'asset_mix': args.asset_mix,
+        'hedge_density': args.hedge_density,
+        'volatility': args.volatility,
+        'duration': args.duration,
+        'trades_per_day': args.trades_per_day
+    }
+
+    if args.command == 'generate':
+        generate_trades(args.rows, **generator_params).to_csv(args.output, index=False)
+        return 0
+
+    pipeline_params = {
+        'price_threshold': args.price_threshold,
+        'confidence_threshold': args.confidence_threshold,
+        'engine': args.engine,
+        'workers': args.workers
+    }
+    report = run_benchmarks(args.rows, generator_params, pipeline_params, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
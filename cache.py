@@ -0,0 +1,310 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Bump when the layout of cached trades or candidates changes
+CACHE_VERSION = 1
+
+HASH_BLOCK_SIZE = 1 << 20
+
+# Cache budget of the host when HEDGE_CACHE_BYTES is not set
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def hash_source(source):
+    """SHA-256 of a CSV path or file object's contents; file objects are rewound"""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    else:
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def estimate_size(value):
+    """Rough in-memory size of a cached value in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class CacheStats:
+    """Hit and miss counters per kind of cached value"""
+
+    def __init__(self):
+        self.counts = {}
+
+    def record(self, kind, hit):
+        counts = self.counts.setdefault(kind, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+
+    def as_dict(self):
+        return {kind: dict(counts) for kind, counts in self.counts.items()}
+
+
+class MemoryCache:
+    """Size-bounded LRU cache of Python objects held in memory"""
+
+    name = 'memory'
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """Store value, evicting least recently used entries; False if it can never fit"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+        return True
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class DiskCache:
+    """Size-bounded LRU cache of pickled objects in a directory.
+
+    Recency is tracked with file modification times, so several processes
+    can share one cache directory.
+    """
+
+    name = 'disk'
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.pkl')
+
+    def _files(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                yield entry
+
+    @property
+    def bytes(self):
+        return sum(entry.stat().st_size for entry in self._files())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def put(self, key, value):
+        """Store value, evicting least recently used files; False if it can never fit"""
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if os.path.getsize(tmp_path) > self.max_bytes:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+        self._evict()
+        return True
+
+    def _evict(self):
+        files = sorted(self._files(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __len__(self):
+        return sum(1 for _ in self._files())
+
+    def clear(self):
+        for entry in self._files():
+            os.remove(entry.path)
+
+
+class CachedTrades:
+    """Prepared trades of one upload, loaded asset by asset from a cache.
+
+    Groups can still be evicted while the analysis runs, e.g. by the
+    candidates it stores. A missing group is then served from the trades
+    prepared again by reload, so eviction costs time but never fails the
+    analysis.
+    """
+
+    def __init__(self, cache, file_hash, meta, reload=None):
+        self.cache = cache
+        self.file_hash = file_hash
+        self.reload = reload
+        self.prepared = None
+        self.sizes = meta['sizes']
+        self.rows = meta['rows']
+        self.total_users = meta['total_users']
+        self.total_accounts = meta['total_accounts']
+
+    def keys(self):
+        return sorted(self.sizes)
+
+    def load(self, key):
+        group = self.cache.backend.get(self.cache.trades_key(self.file_hash, key))
+        if group is not None:
+            return group
+        if self.reload is None:
+            raise KeyError(f"Cached trades for '{key}' were evicted during the analysis")
+        if self.prepared is None:
+            self.prepared = self.reload()
+        return self.prepared.load(key)
+
+
+class CandidateStore:
+    """Per-asset candidate pairs of one upload and price threshold"""
+
+    def __init__(self, cache, file_hash, price_threshold):
+        self.cache = cache
+        self.file_hash = file_hash
+        self.price_threshold = price_threshold
+
+    def _key(self, asset):
+        return ('candidates', CACHE_VERSION, self.file_hash, self.price_threshold, asset)
+
+    def get(self, asset):
+        candidates = self.cache.backend.get(self._key(asset))
+        self.cache.stats.record('candidates', candidates is not None)
+        return candidates
+
+    def put(self, asset, candidates):
+        self.cache.backend.put(self._key(asset), candidates)
+
+
+class AnalysisCache:
+    """Caches prepared trades by upload hash and candidate pairs by upload hash
+    and price threshold, so changing only confidence_threshold or
+    include_close_price rescores cached candidates without parsing or matching.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = CacheStats()
+
+    def _meta_key(self, file_hash):
+        return ('trades', CACHE_VERSION, file_hash)
+
+    def trades_key(self, file_hash, asset):
+        return ('trades', CACHE_VERSION, file_hash, asset)
+
+    def get_trades(self, file_hash, reload=None):
+        """CachedTrades for an upload, or None unless every asset is cached
+
+        reload prepares the upload's trades again, for groups evicted later.
+        """
+        meta = self.backend.get(self._meta_key(file_hash))
+        hit = meta is not None and all(
+            self.trades_key(file_hash, key) in self.backend for key in meta['sizes']
+        )
+        self.stats.record('trades', hit)
+        return CachedTrades(self, file_hash, meta, reload) if hit else None
+
+    def put_trades(self, file_hash, trades):
+        """Copy a trade set (in-memory groups or spilled partitions) into the cache"""
+        for key in trades.keys():
+            if not self.backend.put(self.trades_key(file_hash, key), trades.load(key)):
+                return False
+        meta = {
+            'sizes': dict(trades.sizes),
+            'rows': trades.rows,
+            'total_users': trades.total_users,
+            'total_accounts': trades.total_accounts
+        }
+        return self.backend.put(self._meta_key(file_hash), meta)
+
+    def candidates(self, file_hash, price_threshold):
+        return CandidateStore(self, file_hash, price_threshold)
+
+    def report(self):
+        """Backend usage and hit/miss statistics"""
+        return {
+            'backend': self.backend.name,
+            'entries': len(self.backend),
+            'bytes': self.backend.bytes,
+            'max_bytes': self.backend.max_bytes,
+            'stats': self.stats.as_dict()
+        }
+
+
+def cache_from_env(environ=os.environ):
+    """Build the AnalysisCache configured by HEDGE_CACHE / HEDGE_CACHE_BYTES / HEDGE_CACHE_DIR
+
+    HEDGE_CACHE_BYTES is the budget of the whole host. The disk cache is
+    shared by every worker process, while each process has its own memory
+    cache, so the memory budget is split across WEB_CONCURRENCY workers.
+    """
+    kind = environ.get('HEDGE_CACHE', 'memory')
+    max_bytes = int(environ.get('HEDGE_CACHE_BYTES', DEFAULT_CACHE_BYTES))
+    if kind == 'off':
+        return None
+    if kind == 'disk':
+        directory = environ.get('HEDGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hedge-cache'))
+        return AnalysisCache(DiskCache(directory, max_bytes))
+    if kind == 'memory':
+        return AnalysisCache(MemoryCache(max_bytes // max(1, int(environ.get('WEB_CONCURRENCY', 1)))))
+    raise ValueError(f"Unknown HEDGE_CACHE backend '{kind}'")
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Two accounts are linked once they have hedged each other this many times
+CLUSTER_MIN_PAIRS = 2
+# Most clusters reported, and most users or accounts listed for each
+CLUSTER_LIMIT = 20
+CLUSTER_MEMBER_LIMIT = 100
+
+
+def connected_components(n, u, v):
+    """Component of each of n nodes joined by edges u[k]-v[k], labelled by its
+    smallest node.
+
+    Union-find run over all edges at once: every round hooks the larger root
+    of each edge under the smaller one, then compresses paths until every
+    node points at its root, so a round costs a few array passes.
+    """
+    parent = np.arange(n)
+    while True:
+        root_u, root_v = parent[u], parent[v]
+        split = root_u != root_v
+        if not split.any():
+            return parent
+        np.minimum.at(parent, np.maximum(root_u[split], root_v[split]),
+                      np.minimum(root_u[split], root_v[split]))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def _members(clusters, values, rank_of, limit):
+    """Distinct values per ranked cluster, in order of first appearance, at most limit each"""
+    members = pd.DataFrame({'rank': rank_of[clusters], 'value': values})
+    members = members[members['rank'] >= 0].drop_duplicates()
+    counts = members.groupby('rank', sort=False).size()
+    listed = members.groupby('rank', sort=False)['value'].agg(lambda group: group.tolist()[:limit])
+    return listed.to_dict(), counts.to_dict()
+
+
+def hedge_clusters(pairs, min_pairs=CLUSTER_MIN_PAIRS, limit=CLUSTER_LIMIT):
+    """Rings of users and accounts joined by repeated hedges, from PairColumns.
+
+    Users and accounts are the nodes of a graph. An account is joined to its
+    user, and two accounts are joined when they are the two sides of at least
+    min_pairs hedge pairs. Connected components of that graph are ranked by
+    the combined net_profit and then the number of their pairs.
+    """
+    user_codes, _ = pd.factorize(np.concatenate([pairs.user1, pairs.user2]))
+    account_codes, _ = pd.factorize(np.concatenate([pairs.account1, pairs.account2]))
+    n = len(pairs)
+    users = user_codes.max() + 1 if n else 0
+    account1, account2 = account_codes[:n], account_codes[n:]
+
+    # Weight of every account link; only repeated links join accounts
+    low, high = np.minimum(account1, account2), np.maximum(account1, account2)
+    _, link_codes, weights = np.unique(low * (account_codes.max() + 1) + high,
+                                           return_inverse=True, return_counts=True)
+    kept = weights[link_codes] >= min_pairs
+    if not kept.any():
+        return []
+
+    # Nodes: users first, then accounts
+    edges_u = np.concatenate([user_codes[:n][kept], user_codes[n:][kept], users + low[kept]])
+    edges_v = np.concatenate([users + account1[kept], users + account2[kept], users + high[kept]])
+    component = connected_components(users + account_codes.max() + 1, edges_u, edges_v)
+    clusters, _ = pd.factorize(component[users + account1[kept]])
+
+    pair_count = np.bincount(clusters)
+    net_profit = np.bincount(clusters, weights=pairs.net_profit[kept])
+    confidence = np.bincount(clusters, weights=np.asarray(pairs.confidence, dtype=float)[kept])
+    self_hedges = np.bincount(clusters, weights=pairs.self_hedge[kept]).astype(np.int64)
+    # Distinct links between two different accounts in each cluster
+    linked = np.unique(link_codes[kept], return_index=True)[1]
+    linked = linked[(low != high)[kept][linked]]
+    cluster_links = np.bincount(clusters[linked], minlength=len(pair_count))
+
+    order = np.lexsort((np.arange(len(pair_count)), -pair_count, -net_profit))[:limit]
+    rank_of = np.full(len(pair_count), -1)
+    rank_of[order] = np.arange(len(order))
+
+    both = np.concatenate([clusters, clusters])
+    member_users, user_counts = _members(
+        both, np.concatenate([pairs.user1[kept], pairs.user2[kept]]), rank_of, CLUSTER_MEMBER_LIMIT
+    )
+    member_accounts, account_counts = _members(
+        both, np.concatenate([pairs.account1[kept], pairs.account2[kept]]), rank_of, CLUSTER_MEMBER_LIMIT
+    )
+
+    result = []
+    for rank, cluster in enumerate(order.tolist()):
+        accounts = int(account_counts[rank])
+        possible = accounts * (accounts - 1) // 2
+        result.append({
+            'rank': rank + 1,
+            'users': member_users[rank],
+            'accounts': member_accounts[rank],
+            'user_count': int(user_counts[rank]),
+            'account_count': accounts,
+            'pair_count': int(pair_count[cluster]),
+            'self_hedges': int(self_hedges[cluster]),
+            'inter_user_hedges': int(pair_count[cluster] - self_hedges[cluster]),
+            'net_profit': float(net_profit[cluster]),
+            'avg_confidence': float(confidence[cluster] / pair_count[cluster]),
+            # Share of the possible account links that were hedged repeatedly
+            'density': float(cluster_links[cluster] / possible) if possible else 1.0
+        })
+    return result
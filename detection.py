@@ -0,0 +1,462 @@
+import pandas as pd
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from cache import hash_source
+from clusters import CLUSTER_LIMIT, CLUSTER_MIN_PAIRS, hedge_clusters
+from errors import InvalidInput
+from instrumentation import count, stage, timed_iter, timed_stage
+from ingest import (DEFAULT_CHUNKSIZE, TradeGroups, TradePartitions, open_source, parse_trade_lists,
+                    read_trade_chunks, trade_time_columns)
+from matching import (ENGINES, direction_codes, parallel_sweep_candidates, reference_candidates,
+                      sweep_candidates)
+from patterns import PairColumns, pair_patterns, pair_summary
+from scoring import build_hedge_pairs, score_candidates
+from store import TEXT_DTYPES, TradeStore, TradeStoreWriter
+from symbols import SymbolNormalizer
+
+def run_analysis(source, price_threshold, confidence_threshold, include_close_price, engine='sweep',
+                 chunksize=0, workers=None, progress=None, cache=None, cluster_min_pairs=CLUSTER_MIN_PAIRS):
+    """Run the full analysis of a trade CSV or TradeStore and return the response payload
+
+    progress, if given, is called as progress(stage, rows, fraction) while
+    the analysis moves through parsing, matching, scoring and summarizing.
+    With an AnalysisCache, prepared trades and candidate pairs are reused
+    for uploads that were analyzed before. Accounts hedging each other at
+    least cluster_min_pairs times are joined into hedge clusters.
+    """
+    if cluster_min_pairs < 1:
+        raise InvalidInput('cluster_min_pairs must be at least 1')
+    
+    if isinstance(source, TradeStore):
+        # Stores are already parsed, so matching starts straight away
+        check_detection_params(price_threshold, engine)
+        trades = source
+        report_progress(progress, 'parsing', trades.rows, 1.0)
+        candidate_store = None
+        if cache is not None:
+            file_hash = f'{source.source_hash}:{symbol_normalizer.fingerprint}'
+            candidate_store = cache.candidates(file_hash, price_threshold)
+        
+        with matching_pool(workers) as executor:
+            hedge_pairs = match_trade_set(
+                trades, price_threshold, confidence_threshold, include_close_price, engine,
+                executor, progress, candidate_store
+            )
+    elif cache is not None:
+        check_detection_params(price_threshold, engine)
+        with stage('hash'):
+            # Prepared trades also depend on how symbols are normalized
+            file_hash = f'{hash_source(source)}:{symbol_normalizer.fingerprint}'
+        
+        with tempfile.TemporaryDirectory() as directory, matching_pool(workers) as executor:
+            # Groups evicted during the analysis are prepared again from the upload
+            trades = cache.get_trades(
+                file_hash, reload=lambda: load_trade_set(source, directory, chunksize)
+            )
+            if trades is None:
+                trades = load_trade_set(source, directory, chunksize, progress)
+                cache.put_trades(file_hash, trades)
+            else:
+                report_progress(progress, 'parsing', trades.rows, 1.0)
+            
+            hedge_pairs = match_trade_set(
+                trades, price_threshold, confidence_threshold, include_close_price, engine,
+                executor, progress, cache.candidates(file_hash, price_threshold)
+            )
+    elif chunksize > 0:
+        # Stream the upload through per-asset partitions on disk
+        hedge_pairs, trades = find_hedge_pairs_chunked(
+            source, price_threshold, confidence_threshold, include_close_price, engine, chunksize,
+            workers=workers, progress=progress
+        )
+    else:
+        # Read CSV file
+        with stage('read_csv') as call:
+            df = pd.read_csv(source)
+            call.rows_out = len(df)
+        report_progress(progress, 'parsing', len(df), 1.0)
+        
+        # Process data to find hedge pairs
+        hedge_pairs = find_hedge_pairs(df, price_threshold, confidence_threshold, include_close_price,
+                                       engine, workers, progress=progress)
+        # Only the population of the upload is needed from here on
+        trades = TradeGroups({}, len(df), df['user_id'].nunique(), df['account_id'].nunique())
+    
+    # Summary statistics and patterns share one column view of the pairs
+    report_progress(progress, 'summarizing', trades.rows)
+    pairs = pair_columns(hedge_pairs)
+    summary_stats = generate_summary_stats(
+        pairs, total_users=trades.total_users, total_accounts=trades.total_accounts
+    )
+    notable_patterns = find_notable_patterns(pairs)
+    clusters = find_hedge_clusters(pairs, cluster_min_pairs)
+    
+    return {
+        'hedge_pairs': hedge_pairs,
+        'summary_stats': summary_stats,
+        'notable_patterns': notable_patterns,
+        'hedge_clusters': clusters
+    }
+
+def report_progress(progress, stage, rows, fraction=None):
+    if progress is not None:
+        progress(stage, rows, fraction)
+
+REQUIRED_COLUMNS = ['tradehash', 'short_long', 'asset', 'entry_datetimes',
+                    'market_entries', 'close_datetimes', 'market_closes',
+                    'account_id', 'user_id', 'net_profit', 'total_contracts']
+PRICE_COLUMNS = ['avg_market_entry', 'avg_market_close']
+
+# Exports with one open/close datetime per trade (the layout the Streamlit
+# front end was written for) are mapped onto the list-encoded columns
+DATETIME_ALIASES = {'open_datetime': 'entry_datetimes', 'close_datetime': 'close_datetimes'}
+COLUMN_ALIASES = {'market_profit': 'net_profit', 'trade_id': 'tradehash',
+                  'avg_market_entry': 'market_entries', 'avg_market_close': 'market_closes'}
+INPUT_COLUMNS = REQUIRED_COLUMNS + PRICE_COLUMNS + list(DATETIME_ALIASES) + list(COLUMN_ALIASES)
+
+# Columns kept for each trade once it has been prepared for matching
+PARTITION_COLUMNS = ['tradehash', 'short_long', 'normalized_asset', 'entry_time', 'close_time',
+                     'avg_market_entry', 'avg_market_close', 'net_profit', 'user_id',
+                     'account_id', 'total_contracts']
+
+# Maps contract symbols to the asset groups trades are matched within
+symbol_normalizer = SymbolNormalizer.from_env()
+
+def normalize_asset_name(asset, reference_year=None):
+    """Normalize asset names (e.g., treat NQM5 and MNQM5 as equivalent) traded in reference_year"""
+    return symbol_normalizer.normalize(asset, reference_year)
+
+def standardize_columns(df):
+    """Map the columns of either supported CSV layout onto REQUIRED_COLUMNS
+
+    Column names are stripped and lowercased. Single open/close datetimes
+    become one-element epoch millisecond lists (naive times are read as
+    UTC), and layouts without total_contracts count every trade as one
+    contract.
+    """
+    df.columns = df.columns.str.strip().str.lower()
+    
+    for alias, column in DATETIME_ALIASES.items():
+        if column not in df.columns and alias in df.columns:
+            times = pd.to_datetime(df[alias], errors='coerce', utc=True)
+            df[column] = (times - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(milliseconds=1)
+    
+    for alias, column in COLUMN_ALIASES.items():
+        if column not in df.columns and alias in df.columns:
+            df[column] = df[alias]
+    
+    if 'tradehash' not in df.columns:
+        df['tradehash'] = df.index.astype(str)
+    if 'total_contracts' not in df.columns:
+        df['total_contracts'] = 1
+    
+    return df
+
+def clean_trades(df):
+    """Map df onto REQUIRED_COLUMNS and drop rows missing any of them"""
+    df = standardize_columns(df)
+    
+    # Clean data - ensure required columns exist
+    for col in REQUIRED_COLUMNS:
+        if col not in df.columns:
+            raise InvalidInput(f"Required column '{col}' not found in CSV")
+    
+    # Clean data - remove rows with missing essential values
+    return df.dropna(subset=REQUIRED_COLUMNS)
+
+@timed_stage('prepare')
+def prepare_trades(df):
+    """Validate and clean trades, adding the derived columns used for matching"""
+    df = clean_trades(df)
+    
+    # Parse list fields in bulk and extract first/last entry and close times
+    lists = parse_trade_lists(df, ('entry_datetimes', 'close_datetimes'))
+    for name, values in trade_time_columns(lists).items():
+        df[name] = values
+    
+    # Normalize asset names; short contract years resolve against each entry time
+    df['normalized_asset'] = symbol_normalizer.normalize_column(df['asset'], df['entry_time'])
+    
+    # Convert avg_market_entry and avg_market_close to float if they're not already
+    df['avg_market_entry'] = pd.to_numeric(df['avg_market_entry'], errors='coerce')
+    df['avg_market_close'] = pd.to_numeric(df['avg_market_close'], errors='coerce')
+    
+    return df
+
+def matching_arrays(group):
+    """The compact per-trade arrays the sweep matcher works on"""
+    return (
+        group['entry_time'].to_numpy(dtype=float),
+        group['close_time'].to_numpy(dtype=float),
+        direction_codes(group['short_long']),
+        group['avg_market_entry'].to_numpy(dtype=float)
+    )
+
+def matching_pool(workers):
+    """Process pool for matching, or a no-op context when workers <= 1"""
+    if workers and workers > 1:
+        return ProcessPoolExecutor(max_workers=workers)
+    return nullcontext()
+
+@timed_stage('matching', rows_in=lambda groups: sum(len(group) for group in groups.values()),
+             rows_out=lambda found: sum(len(pairs_i) for pairs_i, _ in found.values()))
+def find_candidates(groups, price_threshold, engine='sweep', executor=None):
+    """Find LONG/SHORT candidate pairs for each asset group
+
+    With an executor the sweep runs as one process pool task per asset (or
+    per time shard of a large asset).
+    """
+    if engine == 'reference':
+        return {asset: reference_candidates(group.to_dict('records'), price_threshold)
+                for asset, group in groups.items()}
+    
+    if executor is not None:
+        return parallel_sweep_candidates(
+            {asset: matching_arrays(group) for asset, group in groups.items()},
+            price_threshold, executor
+        )
+    
+    return {asset: sweep_candidates(*matching_arrays(group), price_threshold)
+            for asset, group in groups.items()}
+
+def match_asset_group(asset, group, price_threshold, confidence_threshold, include_close_price,
+                      engine='sweep', start_id=1, candidates=None):
+    """Find hedge pairs within the prepared trades of one normalized asset"""
+    # Find LONG/SHORT candidates with overlapping timeframes and close entry prices
+    if candidates is None:
+        candidates = find_candidates({asset: group}, price_threshold, engine)[asset]
+    pairs_i, pairs_j = candidates
+    
+    with stage('scoring', rows_in=len(pairs_i)) as call:
+        # Calculate confidence scores for all candidates at once
+        price_diff, confidence = score_candidates(
+            group['avg_market_entry'].to_numpy(dtype=float),
+            group['avg_market_close'].to_numpy(dtype=float),
+            group['total_contracts'].to_numpy(dtype=float),
+            pairs_i, pairs_j, price_threshold, include_close_price
+        )
+        
+        # Only include pairs with confidence above threshold
+        accepted = confidence >= confidence_threshold
+        hedge_pairs = build_hedge_pairs(
+            asset, group, pairs_i[accepted], pairs_j[accepted],
+            price_diff[accepted], confidence[accepted], start_id=start_id
+        )
+        call.rows_out = len(hedge_pairs)
+    
+    count('candidates_examined', len(pairs_i))
+    count('candidates_accepted', len(hedge_pairs))
+    return hedge_pairs
+
+def check_detection_params(price_threshold, engine):
+    if engine not in ENGINES:
+        raise InvalidInput(f"Unknown matching engine '{engine}'")
+    if not price_threshold > 0:
+        raise InvalidInput("price_threshold must be greater than 0")
+
+def find_hedge_pairs(df, price_threshold, confidence_threshold, include_close_price, engine='sweep',
+                     workers=None, progress=None):
+    """Find potential hedge pairs in the trading data
+
+    engine='sweep' uses the sort-and-sweep matcher, engine='reference' the
+    original nested loop; both return identical pairs. workers > 1 spreads
+    the sweep over a process pool without changing the result.
+    """
+    check_detection_params(price_threshold, engine)
+    df = prepare_trades(df)
+    
+    # Group by normalized asset
+    groups = dict(tuple(df.groupby('normalized_asset')))
+    candidates = {}
+    with matching_pool(workers) as executor:
+        if executor is not None:
+            report_progress(progress, 'matching', 0, 0.0)
+            candidates = find_candidates(groups, price_threshold, engine, executor)
+    
+    hedge_pairs = []
+    rows_done = 0
+    for asset, group in groups.items():
+        report_progress(progress, 'matching', rows_done, rows_done / len(df))
+        if asset not in candidates:
+            candidates[asset] = find_candidates({asset: group}, price_threshold, engine)[asset]
+        
+        report_progress(progress, 'scoring', rows_done, rows_done / len(df))
+        hedge_pairs.extend(match_asset_group(
+            asset, group, price_threshold, confidence_threshold, include_close_price,
+            engine, start_id=len(hedge_pairs) + 1, candidates=candidates.pop(asset)
+        ))
+        rows_done += len(group)
+    
+    return hedge_pairs
+
+def spill_trade_partitions(source, directory, chunksize=DEFAULT_CHUNKSIZE, progress=None):
+    """Read a trade CSV in chunks and spill prepared trades to per-asset partitions"""
+    partitions = TradePartitions(directory)
+    
+    with open_source(source) as (stream, size):
+        chunks = read_trade_chunks(stream, INPUT_COLUMNS, chunksize)
+        for chunk in timed_iter('read_csv', chunks):
+            trades = prepare_trades(chunk)
+            partitions.observe(chunk)
+            with stage('spill', rows_in=len(trades)):
+                for asset, group in trades.groupby('normalized_asset'):
+                    partitions.append(asset, group[PARTITION_COLUMNS])
+            report_progress(progress, 'parsing', partitions.rows,
+                            stream.tell() / size if size else None)
+    
+    return partitions
+
+def find_hedge_pairs_chunked(source, price_threshold, confidence_threshold, include_close_price,
+                             engine='sweep', chunksize=DEFAULT_CHUNKSIZE, spill_dir=None, workers=None,
+                             progress=None):
+    """Find hedge pairs in a trade CSV without loading it into memory at once
+
+    Trades are spilled to per-asset partitions on disk and matched one asset
+    at a time, so peak memory follows the largest asset partition. Returns
+    the hedge pairs and the TradePartitions holding the population counts.
+    """
+    check_detection_params(price_threshold, engine)
+    
+    with tempfile.TemporaryDirectory(dir=spill_dir) as directory, matching_pool(workers) as executor:
+        partitions = spill_trade_partitions(source, directory, chunksize, progress)
+        hedge_pairs = match_trade_set(partitions, price_threshold, confidence_threshold,
+                                      include_close_price, engine, executor, progress)
+    
+    return hedge_pairs, partitions
+
+def load_trade_set(source, directory, chunksize=0, progress=None):
+    """Prepare the trades of a CSV as a trade set grouped by normalized asset
+
+    With chunksize > 0 the trades are spilled to partitions in directory,
+    otherwise they are held in memory.
+    """
+    if chunksize > 0:
+        return spill_trade_partitions(source, directory, chunksize, progress)
+    
+    with stage('read_csv') as call:
+        df = pd.read_csv(source)
+        call.rows_out = len(df)
+    report_progress(progress, 'parsing', len(df), 1.0)
+    trades = prepare_trades(df)[PARTITION_COLUMNS]
+    return TradeGroups(dict(tuple(trades.groupby('normalized_asset'))), len(df),
+                       df['user_id'].nunique(), df['account_id'].nunique())
+
+def ingest_trade_store(source, path, chunksize=DEFAULT_CHUNKSIZE, progress=None):
+    """Convert a trade CSV into a columnar trade store at path and open it
+
+    The CSV is read chunksize rows at a time; list fields are parsed once
+    here so later analyses of the store skip text parsing entirely.
+    """
+    with open_source(source) as (stream, size):
+        with stage('hash'):
+            writer = TradeStoreWriter(path, source_hash=hash_source(stream))
+        try:
+            # Ids are stored as written; the store decides their type once
+            chunks = read_trade_chunks(stream, INPUT_COLUMNS, chunksize, dtype=TEXT_DTYPES)
+            for chunk in timed_iter('read_csv', chunks):
+                trades = clean_trades(chunk)
+                writer.observe(chunk)
+                with stage('ingest', rows_in=len(trades)):
+                    writer.append(trades)
+                report_progress(progress, 'parsing', writer.rows,
+                                stream.tell() / size if size else None)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+    
+    return open_trade_store(path)
+
+def open_trade_store(path):
+    """Open a trade store grouped by the current symbol normalization"""
+    return TradeStore(path, symbol_normalizer.normalize)
+
+def match_trade_set(trades, price_threshold, confidence_threshold, include_close_price, engine='sweep',
+                    executor=None, progress=None, candidate_store=None):
+    """Find hedge pairs in a trade set one asset at a time
+
+    trades may be TradeGroups, TradePartitions, CachedTrades or a TradeStore. With a
+    candidate_store, cached candidates are rescored instead of rematched and
+    newly matched candidates are stored.
+    """
+    hedge_pairs = []
+    rows_done = 0
+    total_rows = sum(trades.sizes.values())
+    for asset in trades.keys():
+        fraction = rows_done / total_rows
+        report_progress(progress, 'matching', rows_done, fraction)
+        with stage('load_trades') as call:
+            group = trades.load(asset)
+            call.rows_out = len(group)
+        candidates = candidate_store.get(asset) if candidate_store is not None else None
+        if candidates is None:
+            candidates = find_candidates({asset: group}, price_threshold, engine, executor)[asset]
+            if candidate_store is not None:
+                candidate_store.put(asset, candidates)
+        
+        report_progress(progress, 'scoring', rows_done, fraction)
+        hedge_pairs.extend(match_asset_group(
+            asset, group, price_threshold, confidence_threshold, include_close_price,
+            engine, start_id=len(hedge_pairs) + 1, candidates=candidates
+        ))
+        rows_done += trades.sizes[asset]
+    
+    return hedge_pairs
+
+@timed_stage('summary_stats', rows_out=None)
+def generate_summary_stats(hedge_pairs, df=None, total_users=None, total_accounts=None):
+    """Generate summary statistics for the detected hedge pairs
+
+    hedge_pairs may be a list of pair dicts or their PairColumns. User and
+    account totals come from df unless given explicitly.
+    """
+    if not len(hedge_pairs):
+        return {
+            'total_hedges': 0,
+            'self_hedges': 0,
+            'inter_user_hedges': 0,
+            'avg_confidence': 0,
+            'users_involved': 0,
+            'accounts_involved': 0,
+            'users_percentage': 0,
+            'accounts_percentage': 0
+        }
+    
+    if total_users is None:
+        total_users = df['user_id'].nunique()
+    if total_accounts is None:
+        total_accounts = df['account_id'].nunique()
+    
+    return pair_summary(pair_columns(hedge_pairs), total_users, total_accounts)
+
+@timed_stage('notable_patterns', rows_out=None)
+def find_notable_patterns(hedge_pairs, df=None):
+    """Find notable patterns in the hedge pairs (a list of pair dicts or their PairColumns)"""
+    if not len(hedge_pairs):
+        return {
+            'frequent_users': [],
+            'frequent_accounts': [],
+            'peak_hours': [],
+            'asset_distribution': [],
+            'repeat_hours': [],
+            'price_bands': []
+        }
+    
+    return pair_patterns(pair_columns(hedge_pairs))
+
+@timed_stage('clusters')
+def find_hedge_clusters(hedge_pairs, min_pairs=CLUSTER_MIN_PAIRS, limit=CLUSTER_LIMIT):
+    """Rings of users and accounts that hedge each other repeatedly, most profitable first"""
+    if not len(hedge_pairs):
+        return []
+    
+    return hedge_clusters(pair_columns(hedge_pairs), min_pairs, limit)
+
+def pair_columns(hedge_pairs):
+    """Column view of hedge pairs, so they are walked once for statistics and patterns"""
+    if isinstance(hedge_pairs, PairColumns):
+        return hedge_pairs
+    with stage('pair_columns', rows_in=len(hedge_pairs)):
+        return PairColumns(hedge_pairs)
@@ -0,0 +1,6 @@
+class InvalidInput(ValueError):
+    """Raised for uploads and parameters that cannot be analyzed as given.
+
+    These are the client's errors and are answered with 400; any other
+    exception from an analysis is a server error.
+    """
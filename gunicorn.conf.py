@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from admission import total_memory_bytes
+
+# Production settings for `gunicorn -c gunicorn.conf.py app:app`
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Memory one worker may use: the interpreter and libraries, its share of the
+# memory cache and the analysis it runs
+worker_memory = int(os.environ.get('HEDGE_WORKER_MEMORY', 512 * 1024 * 1024))
+
+
+def default_workers():
+    """One worker per core, but no more than the host's memory holds"""
+    memory = total_memory_bytes()
+    fit = memory // worker_memory if memory else multiprocessing.cpu_count()
+    return max(1, min(multiprocessing.cpu_count(), fit))
+
+
+# Analyses are CPU-bound and hold the GIL, so one worker process per core
+# does the work; a few threads per worker keep status, paging and metrics
+# requests answered while an analysis runs. How many analyses run at once
+# is decided by admission control (HEDGE_MAX_ANALYSES), not by these.
+workers = int(os.environ.get('WEB_CONCURRENCY', 0)) or default_workers()
+worker_class = 'gthread'
+# Workers split the memory cache budget by this, and their matching runs in
+# the worker itself rather than a process pool per worker
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ.setdefault('HEDGE_WORKERS', '0')
+threads = int(os.environ.get('HEDGE_WEB_THREADS', 4))
+
+# Every worker writes its metrics here and /metrics adds them all up
+metrics_dir = os.environ.setdefault('HEDGE_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'hedge-metrics'))
+
+
+def on_starting(server):
+    # Counters start from zero with each server, as they would in one process
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+# Synchronous analyses of large uploads outlast the 30 s default
+timeout = int(os.environ.get('HEDGE_REQUEST_TIMEOUT', 300))
+graceful_timeout = 30
+keepalive = 5
+
+# No max_requests: restarting a worker would kill the analysis jobs running in its threads
+
+# Worker heartbeats on tmpfs, so a disk busy with spooled uploads cannot stall them
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Request lines and headers only; bodies are limited by HEDGE_MAX_UPLOAD_BYTES in the app
+limit_request_line = 8190
+limit_request_fields = 100
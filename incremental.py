@@ -0,0 +1,202 @@
+import heapq
+import math
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from errors import InvalidInput
+from matching import PriceBucketIndex, _valid_trades, direction_codes
+from scoring import build_hedge_pairs, score_candidates
+
+# Bump when the pickled detector layout changes
+CHECKPOINT_VERSION = 1
+
+# Columns of a prepared trade frame the detector keeps for live trades
+TRADE_COLUMNS = ['tradehash', 'short_long', 'entry_time', 'close_time', 'avg_market_entry',
+                 'avg_market_close', 'net_profit', 'user_id', 'account_id', 'total_contracts']
+
+
+class AssetState:
+    """Live trades of one normalized asset with their open-interval indexes"""
+
+    def __init__(self, price_threshold):
+        self.index = PriceBucketIndex(price_threshold)
+        self.expiry = []  # heap of (last time the trade is open, key)
+        self.trades = {}  # key -> row tuple in TRADE_COLUMNS order
+        self.sides = {}
+
+    def __len__(self):
+        return len(self.trades)
+
+    def add(self, key, row, side):
+        self.trades[key] = row
+        self.sides[key] = side
+        self.index.add(key, side, row[4])
+        heapq.heappush(self.expiry, (max(row[2], row[3]), key))
+
+    def evict(self, watermark):
+        """Drop trades that closed before the watermark; returns how many"""
+        evicted = 0
+        while self.expiry and self.expiry[0][0] < watermark:
+            _, key = heapq.heappop(self.expiry)
+            row = self.trades.pop(key)
+            self.index.remove(key, self.sides.pop(key), row[4])
+            evicted += 1
+        return evicted
+
+
+class IncrementalDetector:
+    """Find hedge pairs in trade batches as they arrive during the day.
+
+    Each trade is compared only with live trades of the same normalized asset
+    and opposite direction whose entry price is within the threshold, using
+    the same price, overlap and confidence criteria as find_hedge_pairs, so
+    the work per batch follows the batch size and the number of live trades.
+
+    The watermark promises that no later trade enters before it. Trades that
+    closed before the watermark can never overlap a later trade and are
+    evicted. It is advanced explicitly, or to the latest entry seen minus
+    allowed_lateness (milliseconds) after every batch when that is set.
+    Trades entering behind the watermark are still matched against the live
+    trades but counted as late, since pairs with evicted trades are missed.
+    """
+
+    def __init__(self, price_threshold, confidence_threshold, include_close_price,
+                 allowed_lateness=None):
+        if not price_threshold > 0:
+            raise InvalidInput("price_threshold must be greater than 0")
+        self.price_threshold = price_threshold
+        self.confidence_threshold = confidence_threshold
+        self.include_close_price = include_close_price
+        self.allowed_lateness = allowed_lateness
+        self.assets = {}
+        self.watermark = -math.inf
+        self.max_entry = -math.inf
+        self.next_key = 0
+        self.next_id = 1
+        self.rows = 0
+        self.evicted = 0
+        self.late_trades = 0
+
+    @property
+    def live_trades(self):
+        return sum(len(state) for state in self.assets.values())
+
+    def status(self):
+        return {
+            'watermark': self.watermark if math.isfinite(self.watermark) else None,
+            'live_trades': self.live_trades,
+            'rows': self.rows,
+            'pairs': self.next_id - 1,
+            'evicted': self.evicted,
+            'late_trades': self.late_trades
+        }
+
+    def add_batch(self, trades, watermark=None):
+        """Add prepared trades (see prepare_trades) and return the new hedge pairs.
+
+        Pairs are emitted once, when their later-arriving trade is added;
+        trade1 is the trade that arrived first.
+        """
+        self.rows += len(trades)
+        hedge_pairs = []
+        for asset, group in trades.groupby('normalized_asset', sort=True):
+            hedge_pairs.extend(self._add_asset(asset, group))
+
+        if watermark is not None:
+            self.advance(watermark)
+        elif self.allowed_lateness is not None and math.isfinite(self.max_entry):
+            self.advance(self.max_entry - self.allowed_lateness)
+        return hedge_pairs
+
+    def advance(self, watermark):
+        """Move the watermark forward and evict trades that closed before it"""
+        if watermark <= self.watermark:
+            return
+        self.watermark = float(watermark)
+        for asset in list(self.assets):
+            self.evicted += self.assets[asset].evict(watermark)
+            if not self.assets[asset]:
+                del self.assets[asset]
+
+    def _add_asset(self, asset, group):
+        entry_time = group['entry_time'].to_numpy(dtype=float)
+        close_time = group['close_time'].to_numpy(dtype=float)
+        side = direction_codes(group['short_long'])
+        entry_price = group['avg_market_entry'].to_numpy(dtype=float)
+        valid = _valid_trades(entry_time, close_time, side, entry_price)
+        if not valid.any():
+            return []
+
+        state = self.assets.get(asset)
+        if state is None:
+            state = self.assets[asset] = AssetState(self.price_threshold)
+
+        rows = list(group[TRADE_COLUMNS][valid].itertuples(index=False, name=None))
+        pairs_i, pairs_j = [], []
+        for row, trade_side in zip(rows, side[valid].tolist()):
+            key = self.next_key
+            self.next_key += 1
+            entry, close, price = row[2], row[3], row[4]
+            if entry < self.watermark:
+                self.late_trades += 1
+            self.max_entry = max(self.max_entry, entry)
+
+            for m in state.index.query(-trade_side, price):
+                other = state.trades[m]
+                if not abs(price - other[4]) <= self.price_threshold:
+                    continue
+                if ((entry >= other[2] and entry <= other[3]) or
+                        (other[2] >= entry and other[2] <= close)):
+                    pairs_i.append(m)
+                    pairs_j.append(key)
+            state.add(key, row, trade_side)
+
+        if not pairs_i:
+            return []
+        return self._score(asset, state, pairs_i, pairs_j)
+
+    def _score(self, asset, state, pairs_i, pairs_j):
+        """Score new candidate pairs and build the accepted ones"""
+        pairs_i = np.asarray(pairs_i, dtype=np.int64)
+        pairs_j = np.asarray(pairs_j, dtype=np.int64)
+        order = np.lexsort((pairs_j, pairs_i))
+        keys, inverse = np.unique(np.concatenate([pairs_i[order], pairs_j[order]]), return_inverse=True)
+        local_i = inverse[:len(order)]
+        local_j = inverse[len(order):]
+        involved = pd.DataFrame([state.trades[key] for key in keys.tolist()], columns=TRADE_COLUMNS)
+
+        price_diff, confidence = score_candidates(
+            involved['avg_market_entry'].to_numpy(dtype=float),
+            involved['avg_market_close'].to_numpy(dtype=float),
+            involved['total_contracts'].to_numpy(dtype=float),
+            local_i, local_j, self.price_threshold, self.include_close_price
+        )
+
+        accepted = confidence >= self.confidence_threshold
+        hedge_pairs = build_hedge_pairs(
+            asset, involved, local_i[accepted], local_j[accepted],
+            price_diff[accepted], confidence[accepted], start_id=self.next_id
+        )
+        self.next_id += len(hedge_pairs)
+        return hedge_pairs
+
+    def checkpoint(self, path):
+        """Atomically write the detector state to path"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((CHECKPOINT_VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path):
+        """Load a detector written by checkpoint"""
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {version}")
+        detector = cls.__new__(cls)
+        detector.__dict__.update(state)
+        return detector
@@ -0,0 +1,209 @@
+import os
+import pickle
+import warnings
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+LIST_COLUMNS = ('entry_datetimes', 'market_entries', 'close_datetimes', 'market_closes')
+
+
+class ListColumn(NamedTuple):
+    """A column of numeric lists stored as flat values plus row offsets"""
+    values: np.ndarray
+    offsets: np.ndarray
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def first(self):
+        """First element of every row (NaN for empty rows)"""
+        return self._pick(self.offsets[:-1])
+
+    def last(self):
+        """Last element of every row (NaN for empty rows)"""
+        return self._pick(self.offsets[1:] - 1)
+
+    def row(self, k):
+        return self.values[self.offsets[k]:self.offsets[k + 1]].tolist()
+
+    def _pick(self, positions):
+        result = np.full(len(self.offsets) - 1, np.nan)
+        present = self.counts > 0
+        result[present] = self.values[positions[present]]
+        return result
+
+
+def _offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def parse_list_column(column):
+    """Parse a column of list strings such as '[1745000000000, 1745000060000]'.
+
+    All rows are joined and handed to NumPy's C parser in one call. If that
+    fails (empty lists, stray commas, non-numeric tokens) the column is
+    tokenized instead, dropping empty tokens and coercing malformed ones to
+    NaN. Plain numeric values are treated as one-element lists.
+    """
+    column = pd.Series(column)
+    n = len(column)
+    if n == 0:
+        return ListColumn(np.empty(0), np.zeros(1, dtype=np.int64))
+
+    if pd.api.types.is_numeric_dtype(column):
+        values = column.to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        return ListColumn(values[present], _offsets(present.astype(np.int64)))
+
+    texts = column.astype(str)
+    counts = texts.str.count(',').to_numpy(dtype=np.int64) + 1
+    joined = ','.join(texts.tolist()).replace('[', '').replace(']', '')
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            values = np.fromstring(joined, dtype=float, sep=',')
+        if len(values) == counts.sum():
+            return ListColumn(values, _offsets(counts))
+    except (ValueError, DeprecationWarning):
+        pass
+
+    # Slow path: tokenize, dropping empty tokens
+    tokens = pd.Series(joined.split(','), dtype=object).str.strip()
+    rows = np.repeat(np.arange(n), counts)
+    keep = (tokens != '').to_numpy()
+    values = pd.to_numeric(tokens[keep], errors='coerce').to_numpy(dtype=float)
+    return ListColumn(values, _offsets(np.bincount(rows[keep], minlength=n)))
+
+
+def parse_trade_lists(df, columns=LIST_COLUMNS):
+    """Parse the list-encoded trade columns of df into ListColumns"""
+    return {column: parse_list_column(df[column]) for column in columns}
+
+
+def trade_time_columns(lists):
+    """Flat per-trade time columns derived from the parsed datetime lists"""
+    entries = lists['entry_datetimes']
+    closes = lists['close_datetimes']
+    return {
+        'entry_time': entries.first(),
+        'last_entry_time': entries.last(),
+        'close_time': closes.first(),
+        'entry_count': entries.counts,
+        'close_count': closes.counts
+    }
+
+
+DEFAULT_CHUNKSIZE = 100_000
+
+# Compact dtypes for chunked reads; other columns keep pandas' inference so
+# ids and values come out the same as with a plain read_csv
+CHUNK_DTYPES = {
+    'asset': 'category',
+    'short_long': 'category'
+}
+
+
+@contextmanager
+def open_source(source):
+    """Yield (stream, size) for a CSV path or an already open file object
+
+    size is the byte size of a path, or None when it is unknown.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as stream:
+            yield stream, os.path.getsize(source)
+    else:
+        yield source, None
+
+
+def read_trade_chunks(source, columns, chunksize=DEFAULT_CHUNKSIZE, dtype=None):
+    """Read only the given columns of a trade CSV, chunksize rows at a time
+
+    Header names are matched ignoring surrounding whitespace and case.
+    dtype adds to or overrides CHUNK_DTYPES.
+    """
+    wanted = set(columns)
+    return pd.read_csv(source, usecols=lambda column: column.strip().lower() in wanted,
+                       dtype={**CHUNK_DTYPES, **(dtype or {})}, chunksize=chunksize)
+
+
+class TradePartitions:
+    """Prepared trades spilled to one file per normalized asset.
+
+    Each append pickles a frame onto the end of the asset's file, so only
+    the current chunk is ever held in memory while spilling. The distinct
+    users and accounts of the raw input are tracked for summary statistics.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = {}
+        self.sizes = {}
+        self.rows = 0
+        self.user_ids = set()
+        self.account_ids = set()
+
+    def observe(self, chunk):
+        """Record the population of a raw input chunk"""
+        self.rows += len(chunk)
+        self.user_ids.update(chunk['user_id'].dropna().unique().tolist())
+        self.account_ids.update(chunk['account_id'].dropna().unique().tolist())
+
+    def append(self, key, frame):
+        path = self.paths.get(key)
+        if path is None:
+            path = os.path.join(self.directory, f'partition-{len(self.paths)}.pkl')
+            self.paths[key] = path
+            self.sizes[key] = 0
+        self.sizes[key] += len(frame)
+        with open(path, 'ab') as f:
+            pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @property
+    def total_users(self):
+        return len(self.user_ids)
+
+    @property
+    def total_accounts(self):
+        return len(self.account_ids)
+
+    def keys(self):
+        return sorted(self.paths)
+
+    def load(self, key):
+        """Load every chunk spilled for key as one frame, in input order"""
+        frames = []
+        with open(self.paths[key], 'rb') as f:
+            while True:
+                try:
+                    frames.append(pickle.load(f))
+                except EOFError:
+                    break
+        return pd.concat(frames, ignore_index=True)
+
+
+class TradeGroups:
+    """Prepared trades held in memory, grouped by normalized asset.
+
+    Offers the same keys/load interface as TradePartitions.
+    """
+
+    def __init__(self, groups, rows, total_users, total_accounts):
+        self.groups = groups
+        self.sizes = {key: len(group) for key, group in groups.items()}
+        self.rows = rows
+        self.total_users = total_users
+        self.total_accounts = total_accounts
+
+    def keys(self):
+        return sorted(self.groups)
+
+    def load(self, key):
+        return self.groups[key]
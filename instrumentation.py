@@ -0,0 +1,398 @@
+import cProfile
+import contextvars
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+log = logging.getLogger('hedge.timings')
+
+# Upper bounds of the stage duration histogram in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+_current = contextvars.ContextVar('hedge_timings', default=None)
+
+
+def process_peak_rss_bytes():
+    """Peak resident set size of this process over its whole lifetime"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mb(value):
+    return round(value / (1024 * 1024), 1)
+
+
+class StageRecord:
+    """Totals of one pipeline stage within an instrumented run.
+
+    cpu_seconds includes the CPU time of process pool tasks the stage waited
+    for. peak_rss_growth_bytes is how far the stage raised the process's peak
+    RSS: zero when it stayed below an earlier peak, and shared with whatever
+    other threads of the process ran at the same time.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.peak_rss_growth_bytes = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_rss_growth_mb': _mb(self.peak_rss_growth_bytes)
+        }
+
+
+class StageCall:
+    """Handle for one call of a stage; set rows_out once it is known"""
+
+    def __init__(self, rows_in=None):
+        self.rows_in = rows_in
+        self.rows_out = None
+
+
+class Timings:
+    """Stage timings and counters of one instrumented request or job"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.request_id = uuid.uuid4().hex
+        self.stages = {}
+        self.counters = {}
+        self.status = 'ok'
+        self.failed_stage = None
+        self.profile = None
+        self.started = time.perf_counter()
+        self.started_cpu = time.thread_time()
+        self.started_peak_rss = process_peak_rss_bytes()
+        # CPU time of process pool tasks run on behalf of this run
+        self.child_cpu_seconds = 0.0
+        self.wall_seconds = None
+        self.cpu_seconds = None
+
+    def record(self, name, call, wall_seconds, cpu_seconds, peak_rss_growth):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageRecord()
+        stage.calls += 1
+        stage.wall_seconds += wall_seconds
+        stage.cpu_seconds += cpu_seconds
+        stage.rows_in += call.rows_in or 0
+        stage.rows_out += call.rows_out or 0
+        stage.peak_rss_growth_bytes += peak_rss_growth
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def _cpu_seconds(self):
+        return time.thread_time() - self.started_cpu + self.child_cpu_seconds
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self.started
+        self.cpu_seconds = self._cpu_seconds()
+
+    def as_dict(self):
+        wall_seconds = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self.started
+        cpu_seconds = self.cpu_seconds if self.cpu_seconds is not None else self._cpu_seconds()
+        process_peak = process_peak_rss_bytes()
+        timings = {
+            'request_id': self.request_id,
+            'kind': self.kind,
+            'status': self.status,
+            'wall_seconds': round(wall_seconds, 6),
+            'cpu_seconds': round(cpu_seconds, 6),
+            'peak_rss_growth_mb': _mb(process_peak - self.started_peak_rss),
+            'process_peak_rss_mb': _mb(process_peak),
+            'stages': {name: stage.as_dict() for name, stage in self.stages.items()},
+            'counters': dict(self.counters)
+        }
+        if self.failed_stage:
+            timings['failed_stage'] = self.failed_stage
+        if self.profile:
+            timings['profile'] = self.profile
+        return timings
+
+
+class Metrics:
+    """Counters exposed in the Prometheus text format.
+
+    With a directory, every process writes its totals to a file of its own
+    there after each run, and render adds up the files of all processes,
+    including ones that have exited, so counters served by any gunicorn
+    worker cover the whole server and never go backwards.
+    """
+
+    FIELDS = ('runs', 'stage_seconds', 'stage_cpu_seconds', 'stage_calls', 'stage_rows', 'stage_runs',
+              'stage_buckets', 'counters')
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._file = None
+        self._lock = threading.Lock()
+        self.runs = {}
+        self.stage_seconds = {}
+        self.stage_cpu_seconds = {}
+        self.stage_calls = {}
+        self.stage_rows = {}
+        self.stage_runs = {}
+        self.stage_buckets = {}
+        self.counters = {}
+
+    def observe(self, timings):
+        with self._lock:
+            key = (timings.kind, timings.status)
+            self.runs[key] = self.runs.get(key, 0) + 1
+            for name, stage in timings.stages.items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + stage.wall_seconds
+                self.stage_cpu_seconds[name] = self.stage_cpu_seconds.get(name, 0.0) + stage.cpu_seconds
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + stage.calls
+                for direction, rows in (('in', stage.rows_in), ('out', stage.rows_out)):
+                    self.stage_rows[name, direction] = self.stage_rows.get((name, direction), 0) + rows
+                self.stage_runs[name] = self.stage_runs.get(name, 0) + 1
+                buckets = self.stage_buckets.setdefault(name, [0] * len(DURATION_BUCKETS))
+                for k, bound in enumerate(DURATION_BUCKETS):
+                    if stage.wall_seconds <= bound:
+                        buckets[k] += 1
+            for name, value in timings.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            if self.directory:
+                self._save()
+
+    def _path(self):
+        """This process's file; a forked child gets a new one"""
+        if self._file is None or self._file[0] != os.getpid():
+            name = f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+            self._file = (os.getpid(), os.path.join(self.directory, name))
+        return self._file[1]
+
+    def _save(self):
+        state = {field: [[list(key) if isinstance(key, tuple) else key, value]
+                         for key, value in getattr(self, field).items()] for field in self.FIELDS}
+        state['pid'] = os.getpid()
+        state['peak_rss_bytes'] = process_peak_rss_bytes()
+        path = self._path()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{path}.tmp', path)
+
+    def _merged(self):
+        """Totals over the files of every process, and the peak RSS of the live ones"""
+        total = Metrics()
+        peaks = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for field in self.FIELDS:
+                merged = getattr(total, field)
+                for key, value in state[field]:
+                    key = tuple(key) if isinstance(key, list) else key
+                    if isinstance(value, list):
+                        merged[key] = [a + b for a, b in zip(merged.get(key, [0] * len(value)), value)]
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+            if _alive(state['pid']):
+                peaks[state['pid']] = state['peak_rss_bytes']
+        peaks[os.getpid()] = process_peak_rss_bytes()
+        return total, peaks
+
+    def render(self):
+        lines = []
+
+        def sample(name, labels, value):
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                sample(name, labels, value)
+
+        if self.directory:
+            source, peaks = self._merged()
+        else:
+            source, peaks = self, {os.getpid(): process_peak_rss_bytes()}
+
+        with source._lock:
+            metric('hedge_runs_total', 'counter', 'Instrumented analyses by kind and status',
+                   [((('kind', kind), ('status', status)), count)
+                    for (kind, status), count in sorted(source.runs.items())])
+            metric('hedge_stage_seconds_total', 'counter', 'Wall time spent in each pipeline stage',
+                   [((('stage', name),), round(value, 6)) for name, value in sorted(source.stage_seconds.items())])
+            metric('hedge_stage_cpu_seconds_total', 'counter', 'CPU time spent in each pipeline stage',
+                   [((('stage', name),), round(value, 6))
+                    for name, value in sorted(source.stage_cpu_seconds.items())])
+            metric('hedge_stage_calls_total', 'counter', 'Calls of each pipeline stage',
+                   [((('stage', name),), value) for name, value in sorted(source.stage_calls.items())])
+            metric('hedge_stage_rows_total', 'counter', 'Rows into and out of each pipeline stage',
+                   [((('stage', name), ('direction', direction)), value)
+                    for (name, direction), value in sorted(source.stage_rows.items())])
+
+            lines.append('# HELP hedge_stage_run_seconds Wall time of each pipeline stage per analysis')
+            lines.append('# TYPE hedge_stage_run_seconds histogram')
+            for name, buckets in sorted(source.stage_buckets.items()):
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    sample('hedge_stage_run_seconds_bucket', (('stage', name), ('le', bound)), count)
+                sample('hedge_stage_run_seconds_bucket', (('stage', name), ('le', '+Inf')),
+                       source.stage_runs[name])
+                sample('hedge_stage_run_seconds_sum', (('stage', name),), round(source.stage_seconds[name], 6))
+                sample('hedge_stage_run_seconds_count', (('stage', name),), source.stage_runs[name])
+
+            metric('hedge_pipeline_events_total', 'counter',
+                   'Pipeline counters such as candidates examined and accepted',
+                   [((('event', name),), value) for name, value in sorted(source.counters.items())])
+            metric('hedge_process_peak_rss_bytes', 'gauge', 'Lifetime peak resident set size of each live process',
+                   [((('pid', pid),), peak) for pid, peak in sorted(peaks.items())])
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# Shared by all gunicorn workers when HEDGE_METRICS_DIR is set (gunicorn.conf.py sets it)
+metrics = Metrics(os.environ.get('HEDGE_METRICS_DIR'))
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Time a pipeline stage of the current instrumented run, if there is one"""
+    call = StageCall(rows_in)
+    timings = _current.get()
+    if timings is None:
+        yield call
+        return
+
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    child_cpu = timings.child_cpu_seconds
+    peak_rss = process_peak_rss_bytes()
+    try:
+        yield call
+    except Exception:
+        if timings.failed_stage is None:
+            timings.failed_stage = name
+        raise
+    finally:
+        timings.record(name, call, time.perf_counter() - wall,
+                       time.thread_time() - cpu + timings.child_cpu_seconds - child_cpu,
+                       process_peak_rss_bytes() - peak_rss)
+
+
+def timed_stage(name, rows_in=len, rows_out=len):
+    """Decorator recording a function as a stage; rows are counted from its
+    first argument and its result"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, rows_in(args[0]) if rows_in else None) as call:
+                result = func(*args, **kwargs)
+                if rows_out:
+                    call.rows_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable):
+    """Yield from iterable, timing the production of every item as a stage"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as call:
+            item = next(iterator, None)
+            call.rows_out = len(item) if item is not None else 0
+        if item is None:
+            return
+        yield item
+
+
+def child_cpu(seconds):
+    """Add CPU time spent in a worker process to the current instrumented run"""
+    timings = _current.get()
+    if timings is not None:
+        timings.child_cpu_seconds += seconds
+
+
+def count(name, value):
+    """Add to a counter of the current instrumented run, if there is one"""
+    timings = _current.get()
+    if timings is not None:
+        timings.count(name, value)
+
+
+@contextmanager
+def instrument(kind, profile_dir=None):
+    """Collect stage timings for everything run inside the block.
+
+    On exit the timings are added to the process metrics and logged as one
+    JSON line (with the traceback if the block failed). With profile_dir a
+    cProfile dump of the block is written there.
+    """
+    timings = Timings(kind)
+    token = _current.set(timings)
+    profiler = None
+    if profile_dir:
+        timings.profile = os.path.join(profile_dir, f'{kind}-{timings.request_id}.prof')
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield timings
+    except Exception:
+        timings.status = 'error'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(timings.profile)
+        timings.finish()
+        _current.reset(token)
+        metrics.observe(timings)
+        log.log(logging.ERROR if timings.status == 'error' else logging.INFO,
+                json.dumps({'event': 'timings', **timings.as_dict()}),
+                exc_info=timings.status == 'error')
+
+
+def configure_logging(level='INFO'):
+    """Send timing logs to stderr as bare JSON lines"""
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(level)
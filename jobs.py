@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock (Windows) jobs of a stopped worker cannot be told apart from running ones
+    fcntl = None
+
+# Share of overall progress covered by each stage; matching and scoring
+# alternate per asset, so they advance one span together
+STAGE_SPANS = {
+    'queued': (0, 0),
+    'parsing': (0, 40),
+    'matching': (40, 95),
+    'scoring': (40, 95),
+    'summarizing': (95, 100)
+}
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class JobQueueFull(Exception):
+    """Raised when a new job would exceed the number of pending jobs allowed"""
+
+
+class JobManager:
+    """Run analyses as background jobs on a bounded local thread pool.
+
+    Every job gets a directory holding the stored upload, a status.json that
+    is rewritten as the job progresses and, once done, the result saved by
+    the runner's return value (anything with a save(path) method). Status and
+    results are read back from disk, so any worker process serving the app
+    can report on a job started by another one.
+
+    The process running a job holds a lock on the job's lock file until it
+    finishes. A queued or running job whose lock is free belonged to a
+    worker that stopped, and is marked failed when any JobManager starts.
+    """
+
+    def __init__(self, directory, runner, max_workers=2, max_pending=8,
+                 ttl=24 * 3600, update_interval=0.5):
+        self.directory = directory
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.update_interval = update_interval
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.recover()
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def result_path(self, job_id):
+        return os.path.join(self._job_dir(job_id), 'result.pkl')
+
+    def _lock_job(self, job_id, blocking=True):
+        """Open and lock a job's lock file; None if another process holds it"""
+        owner = open(os.path.join(self._job_dir(job_id), 'lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(owner, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                owner.close()
+                return None
+        return owner
+
+    def recover(self):
+        """Mark jobs left queued or running by a stopped worker as failed"""
+        if fcntl is None or not os.path.isdir(self.directory):
+            return
+        for job_id in os.listdir(self.directory):
+            job = self.status(job_id)
+            if not job or job['status'] not in ('queued', 'running'):
+                continue
+            owner = self._lock_job(job_id, blocking=False)
+            if owner is None:
+                continue
+            with owner:
+                # Read again: the job may have finished before the lock was taken
+                job = self.status(job_id)
+                if job and job['status'] in ('queued', 'running'):
+                    job.update(status='failed', error='The worker running this job stopped; submit it again',
+                               finished=time.time())
+                    self._write_status(job)
+
+    def submit(self, upload, params):
+        """Store the upload and queue its analysis; returns the job status"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull('Too many analyses in progress, try again later')
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='hedge-job')
+
+        owner = None
+        try:
+            self.prune()
+            job_id = uuid.uuid4().hex
+            job_dir = self._job_dir(job_id)
+            os.makedirs(job_dir)
+            # Held until the job finishes, so other processes know it is alive
+            owner = self._lock_job(job_id)
+            upload_path = os.path.join(job_dir, 'upload.csv')
+            upload.save(upload_path)
+
+            job = {
+                'id': job_id,
+                'status': 'queued',
+                'stage': 'queued',
+                'percent': 0,
+                'rows_processed': 0,
+                'rows_per_second': 0,
+                'params': params,
+                'created': time.time(),
+                'error': None
+            }
+            self._write_status(job)
+            snapshot = dict(job)
+            self._executor.submit(self._run, job, upload_path, owner)
+        except Exception:
+            if owner is not None:
+                owner.close()
+            with self._lock:
+                self._pending -= 1
+            raise
+        return snapshot
+
+    def status(self, job_id):
+        """Current status of a job, or None if it does not exist"""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self._job_dir(job_id), 'status.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def prune(self):
+        """Remove finished jobs older than the time to live"""
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - self.ttl
+        for job_id in os.listdir(self.directory):
+            job = self.status(job_id)
+            if job and job['status'] in ('done', 'failed') and job['created'] < cutoff:
+                shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def _write_status(self, job):
+        path = os.path.join(self._job_dir(job['id']), 'status.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def _run(self, job, upload_path, owner):
+        stage_started = {}
+        last_write = [0.0]
+
+        def progress(stage, rows, fraction=None):
+            now = time.time()
+            started = stage_started.setdefault(stage, now)
+            lo, hi = STAGE_SPANS.get(stage, (job['percent'], job['percent']))
+            if fraction is not None:
+                job['percent'] = max(job['percent'], round(lo + (hi - lo) * min(fraction, 1.0), 1))
+            else:
+                job['percent'] = max(job['percent'], lo)
+            changed = stage != job['stage']
+            job['stage'] = stage
+            job['rows_processed'] = rows
+            job['rows_per_second'] = round(rows / (now - started), 1) if now > started else 0
+            if changed or now - last_write[0] >= self.update_interval:
+                last_write[0] = now
+                self._write_status(job)
+
+        job['status'] = 'running'
+        job['started'] = time.time()
+        self._write_status(job)
+
+        try:
+            result = self.runner(upload_path, job['params'], progress)
+            tmp_path = self.result_path(job['id']) + '.tmp'
+            result.save(tmp_path)
+            os.replace(tmp_path, self.result_path(job['id']))
+            job.update(status='done', stage='done', percent=100)
+        except Exception as e:
+            job.update(status='failed', error=str(e))
+        finally:
+            job['finished'] = time.time()
+            self._write_status(job)
+            owner.close()
+            with self._lock:
+                self._pending -= 1
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
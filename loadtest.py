@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmark import generate_trades
+
+DEFAULT_URL = 'http://127.0.0.1:8000'
+DEFAULT_CONCURRENCY = [1, 2, 4, 8]
+
+
+def multipart_body(fields, filename, data):
+    """Encode form fields and one CSV file as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: text/csv\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def post(url, body, content_type, timeout):
+    """POST one upload; returns (status, seconds, response bytes)"""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, size = response.status, len(response.read())
+    except urllib.error.HTTPError as e:
+        status, size = e.code, len(e.read())
+    except OSError:
+        # Refused, reset or timed out connections
+        status, size = None, 0
+    return status, time.perf_counter() - start, size
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    p50, p90, p99 = np.percentile(seconds, [50, 90, 99]).tolist()
+    return {
+        'p50': round(p50, 4),
+        'p90': round(p90, 4),
+        'p99': round(p99, 4),
+        'mean': round(float(np.mean(seconds)), 4),
+        'max': round(max(seconds), 4)
+    }
+
+
+def run_level(url, body, content_type, rows, concurrency, requests, timeout):
+    """Send requests uploads from concurrency clients at once and summarize the responses"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: post(url, body, content_type, timeout), range(requests)))
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [seconds for status, seconds, _ in results if status == 200]
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'statuses': statuses,
+        'seconds': round(elapsed, 3),
+        # Throughput counts completed analyses only; rejections are in statuses
+        'requests_per_second': round(len(ok) / elapsed, 3),
+        'rows_per_second': round(len(ok) * rows / elapsed, 1),
+        'latency': percentiles(ok),
+        'rejected_latency': percentiles([seconds for status, seconds, _ in results if status == 503]),
+        'response_bytes': int(np.mean([size for status, _, size in results if status == 200])) if ok else 0
+    }
+
+
+def wait_for_server(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}')
+        try:
+            with urllib.request.urlopen(f'{url}/admission/stats', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not answer at {url} within {timeout} s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test /analyze with concurrent uploads')
+    parser.add_argument('--url', default=DEFAULT_URL, help='base URL of a running server')
+    parser.add_argument('--serve', action='store_true',
+                        help='start gunicorn with gunicorn.conf.py for the test and stop it afterwards')
+    parser.add_argument('--port', type=int, default=8000, help='port for --serve')
+    parser.add_argument('--file', help='CSV to upload (default: a generated one)')
+    parser.add_argument('--rows', type=int, default=20000, help='rows of the generated CSV')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--requests', type=int, default=20, help='uploads per concurrency level')
+    parser.add_argument('--timeout', type=float, default=600.0, help='seconds before a request is abandoned')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help="extra form field, e.g. 'price_threshold=2.5' (repeatable)")
+    parser.add_argument('--cache', action='store_true',
+                        help="let the server reuse cached results; by default every upload is analyzed")
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    fields = {'cache': 'true' if args.cache else 'false'}
+    for param in args.param:
+        name, _, value = param.partition('=')
+        fields[name] = value
+
+    if args.file:
+        with open(args.file, 'rb') as f:
+            data = f.read()
+        rows = sum(1 for _ in data.splitlines()) - 1
+        filename = os.path.basename(args.file)
+    else:
+        data = generate_trades(args.rows, seed=args.seed).to_csv(index=False).encode()
+        rows, filename = args.rows, f'trades-{args.rows}.csv'
+    body, content_type = multipart_body(fields, filename, data)
+
+    server = None
+    url = args.url.rstrip('/')
+    if args.serve:
+        url = f'http://127.0.0.1:{args.port}'
+        log = tempfile.TemporaryFile()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, 'PORT': str(args.port)},
+            stdout=log, stderr=log
+        )
+    try:
+        if server is not None:
+            wait_for_server(url, server)
+        # One upload first, so imports and worker start-up are not measured
+        post(f'{url}/analyze', body, content_type, args.timeout)
+        levels = []
+        for concurrency in args.concurrency:
+            level = run_level(f'{url}/analyze', body, content_type, rows, concurrency, args.requests,
+                              args.timeout)
+            levels.append(level)
+            latency = level['latency']
+            print(f"{concurrency:>4} clients: p50 {latency.get('p50', 0):.3f}s, p99 {latency.get('p99', 0):.3f}s, "
+                  f"{level['requests_per_second']:.2f} req/s, statuses {level['statuses']}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'url': url,
+        'rows': rows,
+        'upload_bytes': len(data),
+        'fields': fields,
+        'levels': levels
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import heapq
+import math
+import time
+
+import numpy as np
+
+from instrumentation import child_cpu
+
+LONG = 1
+SHORT = -1
+
+ENGINES = ('sweep', 'reference')
+
+
+def direction_codes(short_long):
+    """Encode short_long values as LONG/SHORT codes (0 for anything else)"""
+    values = np.asarray(short_long, dtype=object)
+    codes = np.zeros(len(values), dtype=np.int8)
+    codes[values == 'LONG'] = LONG
+    codes[values == 'SHORT'] = SHORT
+    return codes
+
+
+class PriceBucketIndex:
+    """Open trades bucketed by direction and entry price.
+
+    Buckets are twice the price threshold wide, so every trade within the
+    threshold of a query price sits in the query bucket or one of its two
+    neighbours, with plenty of margin for floating point rounding.
+    """
+
+    def __init__(self, price_threshold):
+        self.width = 2 * price_threshold if price_threshold > 0 else None
+        self.buckets = {LONG: {}, SHORT: {}}
+
+    def _key(self, price):
+        if self.width is None:
+            return price
+        return math.floor(price / self.width)
+
+    def _keys(self, price):
+        if self.width is None:
+            return (price,)
+        key = self._key(price)
+        return (key - 1, key, key + 1)
+
+    def add(self, idx, side, price):
+        self.buckets[side].setdefault(self._key(price), set()).add(idx)
+
+    def remove(self, idx, side, price):
+        key = self._key(price)
+        bucket = self.buckets[side][key]
+        bucket.discard(idx)
+        if not bucket:
+            del self.buckets[side][key]
+
+    def query(self, side, price):
+        """Yield open trades of the given direction near price"""
+        buckets = self.buckets[side]
+        for key in self._keys(price):
+            bucket = buckets.get(key)
+            if bucket:
+                yield from bucket
+
+    def __len__(self):
+        return sum(len(b) for side in self.buckets.values() for b in side.values())
+
+
+def _as_pairs(pairs_i, pairs_j):
+    """Return candidate pairs as (i, j) index arrays sorted like the nested loop"""
+    i_idx = np.asarray(pairs_i, dtype=np.int64)
+    j_idx = np.asarray(pairs_j, dtype=np.int64)
+    order = np.lexsort((j_idx, i_idx))
+    return i_idx[order], j_idx[order]
+
+
+def _valid_trades(entry_time, close_time, side, entry_price):
+    return (~np.isnan(entry_time) & ~np.isnan(close_time)
+            & np.isfinite(entry_price) & (side != 0))
+
+
+def sweep_candidates(entry_time, close_time, side, entry_price, price_threshold):
+    """Find LONG/SHORT candidate pairs with a sort-and-sweep over entry time.
+
+    Trades are visited in entry time order while an index of open intervals
+    is kept, so each trade is only compared with opposite-direction trades
+    that are still open and whose entry price lies within the threshold.
+    Returns (i, j) position arrays with i < j, ordered as the reference loop
+    would emit them.
+    """
+    entry_time = np.asarray(entry_time, dtype=float)
+    close_time = np.asarray(close_time, dtype=float)
+    entry_price = np.asarray(entry_price, dtype=float)
+    side = np.asarray(side)
+
+    pairs_i, pairs_j = [], []
+    if not price_threshold >= 0:
+        return _as_pairs(pairs_i, pairs_j)
+
+    positions = np.flatnonzero(_valid_trades(entry_time, close_time, side, entry_price))
+    order = positions[np.argsort(entry_time[positions], kind='stable')]
+
+    entries = entry_time.tolist()
+    closes = close_time.tolist()
+    prices = entry_price.tolist()
+    sides = side.tolist()
+
+    index = PriceBucketIndex(price_threshold)
+    expiry = []  # heap of (close_time, position) for open trades
+    tie_entry = None
+    tie = []  # trades sharing the current entry time
+
+    def emit(a, b):
+        if a < b:
+            pairs_i.append(a)
+            pairs_j.append(b)
+        else:
+            pairs_i.append(b)
+            pairs_j.append(a)
+
+    for k in order.tolist():
+        entry = entries[k]
+        price = prices[k]
+        opposite = -sides[k]
+
+        # Trades that closed before this entry can never overlap again
+        while expiry and expiry[0][0] < entry:
+            _, m = heapq.heappop(expiry)
+            index.remove(m, sides[m], prices[m])
+
+        if entry != tie_entry:
+            tie_entry = entry
+            tie = []
+
+        for m in index.query(opposite, price):
+            if abs(price - prices[m]) <= price_threshold:
+                emit(k, m)
+
+        # Trades with the same entry time also overlap when this one is open
+        if closes[k] >= entry:
+            for m in tie:
+                if (closes[m] < entry and sides[m] == opposite
+                        and abs(price - prices[m]) <= price_threshold):
+                    emit(k, m)
+            index.add(k, sides[k], price)
+            heapq.heappush(expiry, (closes[k], k))
+        tie.append(k)
+
+    return _as_pairs(pairs_i, pairs_j)
+
+
+def reference_candidates(trades, price_threshold):
+    """Find candidate pairs with the original O(n²) nested loop.
+
+    Kept as a reference mode so results of the sweep engine can be diffed.
+    Takes the asset group as a list of record dicts.
+    """
+    pairs_i, pairs_j = [], []
+
+    for i in range(len(trades)):
+        trade1 = trades[i]
+
+        # Skip if entry or close time is missing
+        if _isnan(trade1['entry_time']) or _isnan(trade1['close_time']):
+            continue
+
+        for j in range(i + 1, len(trades)):
+            trade2 = trades[j]
+
+            # Skip if entry or close time is missing
+            if _isnan(trade2['entry_time']) or _isnan(trade2['close_time']):
+                continue
+
+            # Check if one is LONG and the other is SHORT
+            if set([trade1['short_long'], trade2['short_long']]) != set(['LONG', 'SHORT']):
+                continue
+
+            # Check if entry prices are within threshold
+            price_diff = abs(float(trade1['avg_market_entry']) - float(trade2['avg_market_entry']))
+            if not price_diff <= price_threshold:
+                continue
+
+            # Check if timeframes overlap
+            time_overlap = ((trade2['entry_time'] >= trade1['entry_time'] and
+                             trade2['entry_time'] <= trade1['close_time']) or
+                            (trade1['entry_time'] >= trade2['entry_time'] and
+                             trade1['entry_time'] <= trade2['close_time']))
+
+            if time_overlap:
+                pairs_i.append(i)
+                pairs_j.append(j)
+
+    return _as_pairs(pairs_i, pairs_j)
+
+
+def _isnan(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+DEFAULT_SHARD_SIZE = 200_000
+
+
+def time_shards(entry_time, close_time, valid, shard_size=DEFAULT_SHARD_SIZE):
+    """Split trades into entry time ranges of about shard_size trades each.
+
+    Returns (lo, hi, positions) per shard. A shard owns the pairs whose later
+    entry falls in [lo, hi), and its positions also cover every trade that
+    entered up to the longest trade duration before lo, since those can still
+    overlap trades the shard owns.
+    """
+    positions = np.flatnonzero(valid)
+    if len(positions) <= shard_size:
+        return [(-np.inf, np.inf, positions)]
+
+    entries = entry_time[positions]
+    max_duration = max(float(np.max(close_time[positions] - entries)), 0.0)
+    bounds = np.unique(np.sort(entries)[shard_size::shard_size])
+    edges = [-np.inf] + bounds.tolist() + [np.inf]
+
+    shards = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        in_shard = (entries >= lo - max_duration) & (entries < hi)
+        shards.append((lo, hi, positions[in_shard]))
+    return shards
+
+
+def _sweep_shard(task):
+    """Process pool task: sweep one shard and keep the pairs it owns, with
+    the CPU time it took"""
+    cpu = time.process_time()
+    key, lo, positions, entry_time, close_time, side, entry_price, price_threshold = task
+    pairs_i, pairs_j = sweep_candidates(entry_time, close_time, side, entry_price, price_threshold)
+    owned = np.maximum(entry_time[pairs_i], entry_time[pairs_j]) >= lo
+    return key, positions[pairs_i[owned]], positions[pairs_j[owned]], time.process_time() - cpu
+
+
+def parallel_sweep_candidates(groups, price_threshold, executor, shard_size=DEFAULT_SHARD_SIZE):
+    """Run sweep_candidates for many groups across a process pool.
+
+    groups maps a key (normalized asset) to its (entry_time, close_time,
+    side, entry_price) arrays. Large groups are split into overlapping time
+    shards. Workers receive only the compact arrays of their shard, and the
+    merged result per key equals sweep_candidates on the whole group.
+    """
+    tasks = []
+    for key, (entry_time, close_time, side, entry_price) in groups.items():
+        entry_time = np.asarray(entry_time, dtype=float)
+        close_time = np.asarray(close_time, dtype=float)
+        entry_price = np.asarray(entry_price, dtype=float)
+        side = np.asarray(side)
+        valid = _valid_trades(entry_time, close_time, side, entry_price)
+        for lo, _, positions in time_shards(entry_time, close_time, valid, shard_size):
+            tasks.append((key, lo, positions, entry_time[positions], close_time[positions],
+                          side[positions], entry_price[positions], price_threshold))
+
+    found = {key: ([], []) for key in groups}
+    for key, pairs_i, pairs_j, cpu_seconds in executor.map(_sweep_shard, tasks):
+        # Worker CPU is not in this thread's CPU time, so it is reported explicitly
+        child_cpu(cpu_seconds)
+        found[key][0].append(pairs_i)
+        found[key][1].append(pairs_j)
+
+    return {
+        key: _as_pairs(np.concatenate(pairs_i) if pairs_i else [],
+                       np.concatenate(pairs_j) if pairs_j else [])
+        for key, (pairs_i, pairs_j) in found.items()
+    }
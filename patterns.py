@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+# Users, accounts and price bands need this many hedge pairs to be reported
+FREQUENT_MIN_PAIRS = 3
+# A user hedging in the same hour on this many days is a repeat pattern
+REPEAT_MIN_DAYS = 3
+# Longest list reported for each repeat pattern
+PATTERN_LIMIT = 50
+# Price bands are 10 ** (digits of the asset's median absolute price - PRICE_BAND_DIGITS) wide,
+# e.g. 100 points for NQ near 18000 and 0.1 for CL near 75
+PRICE_BAND_DIGITS = 2
+
+TIME_TEXT_WIDTH = len('2025-01-01 00:00:00')
+
+
+class PairColumns:
+    """The fields of hedge pairs that statistics and patterns use, as arrays.
+
+    Built in one pass over the pair dicts. Hours and days come from the
+    fixed-width entry time of trade1, which is already the epoch value in
+    local time, so no timestamp is parsed again.
+    """
+
+    def __init__(self, hedge_pairs):
+        rows = [
+            (pair['type'] == 'self_hedge', pair['asset'], pair['confidence'], pair['net_profit'],
+             trade1['user_id'], trade2['user_id'], trade1['account_id'], trade2['account_id'],
+             trade1['entry_time'], trade1['entry_price'])
+            for pair in hedge_pairs
+            for trade1, trade2 in ((pair['trade1'], pair['trade2']),)
+        ]
+        (self_hedge, asset, confidence, net_profit, user1, user2, account1, account2,
+         entry_time, entry_price) = zip(*rows) if rows else ((),) * 10
+
+        self.self_hedge = np.array(self_hedge, dtype=bool)
+        self.asset = np.array(asset, dtype=object)
+        # Kept as a list: summing it in pair order keeps avg_confidence exact
+        self.confidence = list(confidence)
+        self.net_profit = np.array(net_profit, dtype=float)
+        self.user1 = np.array(user1, dtype=object)
+        self.user2 = np.array(user2, dtype=object)
+        self.account1 = np.array(account1, dtype=object)
+        self.account2 = np.array(account2, dtype=object)
+        self.entry_price = np.array(entry_price, dtype=float)
+
+        digits = np.array(entry_time, dtype=f'S{TIME_TEXT_WIDTH}').view(np.uint8)
+        digits = digits.reshape(-1, TIME_TEXT_WIDTH).astype(np.int64) - ord('0')
+        self.hour = digits[:, 11] * 10 + digits[:, 12]
+        # Calendar day as YYYYMMDD
+        self.day = digits[:, [0, 1, 2, 3, 5, 6, 8, 9]] @ (10 ** np.arange(7, -1, -1))
+
+    @classmethod
+    def concat(cls, parts):
+        """One PairColumns holding the pairs of several, in order"""
+        merged = cls([])
+        for name, value in vars(merged).items():
+            if isinstance(value, list):
+                setattr(merged, name, [item for part in parts for item in getattr(part, name)])
+            else:
+                setattr(merged, name, np.concatenate([value, *(getattr(part, name) for part in parts)]))
+        return merged
+
+    def __len__(self):
+        return len(self.self_hedge)
+
+
+def ordered_counts(values):
+    """Distinct values in order of first appearance, and how often each occurs"""
+    codes, uniques = pd.factorize(values)
+    return uniques, np.bincount(codes, minlength=len(uniques)), codes
+
+
+def participants(first, second):
+    """Both sides of every pair interleaved, with the second side dropped
+    when it is the same as the first; returns the values and pair positions"""
+    values = np.empty(2 * len(first), dtype=object)
+    values[0::2] = first
+    values[1::2] = second
+    keep = np.ones(len(values), dtype=bool)
+    keep[1::2] = first != second
+    return values[keep], np.repeat(np.arange(len(first)), 2)[keep]
+
+
+def frequent(values, field):
+    """Values occurring at least FREQUENT_MIN_PAIRS times, most frequent first"""
+    uniques, counts, _ = ordered_counts(values)
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] >= FREQUENT_MIN_PAIRS]
+    return [{field: value, 'count': count}
+            for value, count in zip(uniques[order].tolist(), counts[order].tolist())]
+
+
+def distribution(values, field, total, share=0.0):
+    """Count of each value with its percentage of total, most frequent first;
+    with share, only values reaching that share of the largest count"""
+    uniques, counts, _ = ordered_counts(values)
+    order = np.argsort(-counts, kind='stable')
+    if share and len(counts):
+        order = order[counts[order] >= counts.max() * share]
+    return [{field: value, 'count': count, 'percentage': count / total * 100}
+            for value, count in zip(uniques[order].tolist(), counts[order].tolist())]
+
+
+def pair_summary(pairs, total_users, total_accounts):
+    """Hedge type counts, average confidence and share of users and accounts involved"""
+    n = len(pairs)
+    self_hedges = int(pairs.self_hedge.sum())
+    users_involved = len(pd.unique(np.concatenate([pairs.user1, pairs.user2])))
+    accounts_involved = len(pd.unique(np.concatenate([pairs.account1, pairs.account2])))
+    return {
+        'total_hedges': n,
+        'self_hedges': self_hedges,
+        'inter_user_hedges': n - self_hedges,
+        'avg_confidence': sum(pairs.confidence) / n,
+        'users_involved': users_involved,
+        'accounts_involved': accounts_involved,
+        'users_percentage': (users_involved / total_users * 100) if total_users > 0 else 0,
+        'accounts_percentage': (accounts_involved / total_accounts * 100) if total_accounts > 0 else 0
+    }
+
+
+def repeat_hours(pairs):
+    """Users hedging in the same hour of the day on REPEAT_MIN_DAYS or more days"""
+    users, positions = participants(pairs.user1, pairs.user2)
+    uniques, _, user_codes = ordered_counts(users)
+    slots = user_codes * 24 + pairs.hour[positions]
+    # Days are YYYYMMDD, so slot and day fit one int64 key
+    days_seen = np.unique(slots * 10 ** 8 + pairs.day[positions]) // 10 ** 8
+
+    slot_values, first_seen, counts = np.unique(slots, return_index=True, return_counts=True)
+    days = np.bincount(np.searchsorted(slot_values, days_seen), minlength=len(slot_values))
+    order = np.lexsort((first_seen, -counts, -days))
+    order = order[days[order] >= REPEAT_MIN_DAYS][:PATTERN_LIMIT]
+    return [
+        {'user_id': user_id, 'hour': int(slot % 24), 'days': day_count, 'count': count}
+        for user_id, slot, day_count, count in zip(
+            uniques[slot_values[order] // 24].tolist(), slot_values[order].tolist(),
+            days[order].tolist(), counts[order].tolist()
+        )
+    ]
+
+
+def price_bands(pairs):
+    """Entry price ranges of each asset that hedges keep recurring in"""
+    # Bands are sized by the magnitude of an asset's prices, so instruments
+    # priced around or below zero (spreads) get bands as wide as their moves
+    magnitude = pd.Series(pairs.entry_price).abs().groupby(pairs.asset)
+    scale = magnitude.transform('median').to_numpy()
+    scale = np.where(scale > 0, scale, magnitude.transform('max').to_numpy())
+    scale = np.where(scale > 0, scale, 1.0)
+    width = 10.0 ** (np.floor(np.log10(scale)) - PRICE_BAND_DIGITS)
+    bands = pd.DataFrame({
+        'asset': pairs.asset,
+        'low': np.round(np.floor(pairs.entry_price / width) * width, 9),
+        'width': width
+    })
+    counts = bands.groupby(['asset', 'low', 'width'], sort=False).size()
+    counts = counts[counts >= FREQUENT_MIN_PAIRS].sort_values(ascending=False, kind='stable')
+    return [
+        {'asset': asset, 'low': low, 'high': round(low + width, 9), 'count': count,
+         'percentage': count / len(pairs) * 100}
+        for (asset, low, width), count in zip(counts.index.tolist()[:PATTERN_LIMIT],
+                                              counts.tolist()[:PATTERN_LIMIT])
+    ]
+
+
+def pair_patterns(pairs):
+    """Frequent users and accounts, peak hours, asset distribution and repeat patterns"""
+    users, _ = participants(pairs.user1, pairs.user2)
+    accounts, _ = participants(pairs.account1, pairs.account2)
+    return {
+        'frequent_users': frequent(users, 'user_id'),
+        'frequent_accounts': frequent(accounts, 'account_id'),
+        # Hours with at least 80% of the busiest hour's count
+        'peak_hours': distribution(pairs.hour, 'hour', len(pairs), share=0.8),
+        'asset_distribution': distribution(pairs.asset, 'asset', len(pairs)),
+        'repeat_hours': repeat_hours(pairs),
+        'price_bands': price_bands(pairs)
+    }
@@ -0,0 +1,273 @@
+import base64
+import csv
+import io
+import json
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from errors import InvalidInput
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+# Sort options: (pairs column, ascending); ties are broken by pair id
+SORTS = {
+    'id': ('id', True),
+    'confidence-desc': ('confidence', False),
+    'confidence-asc': ('confidence', True),
+    'time-desc': ('entry_time', False),
+    'time-asc': ('entry_time', True),
+    'profit-desc': ('net_profit', False),
+    'profit-asc': ('net_profit', True)
+}
+
+PAIR_FIELDS = ['id', 'type', 'asset', 'trade1', 'trade2', 'entry_price_diff', 'confidence', 'net_profit']
+
+CSV_HEADER = ['Pair ID', 'Type', 'Asset', 'Entry Time 1', 'Entry Time 2', 'Entry Price 1',
+              'Entry Price 2', 'Confidence', 'Net Profit', 'User ID 1', 'User ID 2',
+              'Account ID 1', 'Account ID 2']
+
+CONFIDENCE_BINS = [0, 0.2, 0.4, 0.6, 0.8, 1]
+
+
+class ResultTable:
+    """Hedge pairs of one analysis stored as columns.
+
+    Trades are deduplicated into their own table and pairs refer to them by
+    index, so a trade that takes part in many pairs is stored once. Pages and
+    exports are produced from the columns without materializing every pair.
+    """
+
+    def __init__(self, trades, pairs, summary_stats, notable_patterns, hedge_clusters=None):
+        self.trades = trades
+        self.pairs = pairs
+        self.summary_stats = summary_stats
+        self.notable_patterns = notable_patterns
+        # Results saved before clustering existed have none
+        self.hedge_clusters = hedge_clusters or []
+        self._orders = {}
+
+    @classmethod
+    def from_analysis(cls, result):
+        """Build the table from a run_analysis payload"""
+        trade_index = {}
+        trades = []
+        first = []
+        second = []
+        for pair in result['hedge_pairs']:
+            for column, trade in ((first, pair['trade1']), (second, pair['trade2'])):
+                key = tuple(trade.values())
+                position = trade_index.get(key)
+                if position is None:
+                    position = trade_index[key] = len(trades)
+                    trades.append(trade)
+                column.append(position)
+
+        hedge_pairs = result['hedge_pairs']
+        trades = pd.DataFrame(trades)
+        pairs = pd.DataFrame({
+            'id': np.array([pair['id'] for pair in hedge_pairs], dtype=np.int64),
+            'type': pd.Categorical([pair['type'] for pair in hedge_pairs]),
+            'asset': pd.Categorical([pair['asset'] for pair in hedge_pairs]),
+            'trade1': np.array(first, dtype=np.int64),
+            'trade2': np.array(second, dtype=np.int64),
+            'entry_price_diff': np.array([pair['entry_price_diff'] for pair in hedge_pairs], dtype=float),
+            'confidence': np.array([pair['confidence'] for pair in hedge_pairs], dtype=float),
+            'net_profit': np.array([pair['net_profit'] for pair in hedge_pairs], dtype=float)
+        })
+        pairs['entry_time'] = (trades['entry_time'].to_numpy()[pairs['trade1'].to_numpy()]
+                               if len(trades) else np.array([], dtype=object))
+        return cls(trades, pairs, result['summary_stats'], result['notable_patterns'],
+                   result.get('hedge_clusters'))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump((self.trades, self.pairs, self.summary_stats, self.notable_patterns,
+                         self.hedge_clusters), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(*pickle.load(f))
+
+    def _trade_records(self, positions):
+        return self.trades.iloc[positions].to_dict('records')
+
+    def _pair_records(self, rows, trade_refs):
+        """Pair dicts for rows of the pairs table, with trades given by trade_refs"""
+        return [
+            {
+                'id': pair_id,
+                'type': hedge_type,
+                'asset': asset,
+                'trade1': trade_refs[trade1],
+                'trade2': trade_refs[trade2],
+                'entry_price_diff': diff,
+                'confidence': confidence,
+                'net_profit': net_profit
+            }
+            for pair_id, hedge_type, asset, trade1, trade2, diff, confidence, net_profit in zip(
+                *(rows[field].tolist() for field in PAIR_FIELDS)
+            )
+        ]
+
+    def full(self):
+        """The original response payload with nested trades in every pair"""
+        trades = self._trade_records(np.arange(len(self.trades)))
+        return {
+            'hedge_pairs': self._pair_records(self.pairs, trades),
+            'summary_stats': self.summary_stats,
+            'notable_patterns': self.notable_patterns,
+            'hedge_clusters': self.hedge_clusters
+        }
+
+    def compact(self):
+        """Response payload with a deduplicated trades table referenced by index"""
+        return {
+            'trades': self._trade_records(np.arange(len(self.trades))),
+            'hedge_pairs': self._pair_records(self.pairs, range(len(self.trades))),
+            'summary_stats': self.summary_stats,
+            'notable_patterns': self.notable_patterns,
+            'hedge_clusters': self.hedge_clusters
+        }
+
+    def distributions(self):
+        """Counts behind the result charts: hedge types, confidence bins and entry hours"""
+        confidence = self.pairs['confidence'].to_numpy()
+        confidence_counts = np.histogram(np.clip(confidence, 0, 1), bins=CONFIDENCE_BINS)[0]
+        hours = pd.to_numeric(self.pairs['entry_time'].str.slice(11, 13), errors='coerce')
+        hour_counts = np.bincount(hours.dropna().astype(int), minlength=24)[:24]
+        return {
+            'types': self.pairs['type'].value_counts().to_dict(),
+            'confidence': confidence_counts.tolist(),
+            'hours': hour_counts.tolist()
+        }
+
+    def summary(self):
+        return {
+            'total_pairs': len(self.pairs),
+            'summary_stats': self.summary_stats,
+            'notable_patterns': self.notable_patterns,
+            'hedge_clusters': self.hedge_clusters,
+            'distributions': self.distributions()
+        }
+
+    def _order(self, sort):
+        """Pair positions in sort order, computed once per sort option"""
+        if sort not in SORTS:
+            raise InvalidInput(f"Unknown sort '{sort}'")
+        order = self._orders.get(sort)
+        if order is None:
+            column, ascending = SORTS[sort]
+            ordered = self.pairs.sort_values([column, 'id'], ascending=[ascending, True], kind='stable')
+            order = self._orders[sort] = self.pairs.index.get_indexer(ordered.index)
+        return order
+
+    def _mask(self, min_confidence=None, hedge_type=None, asset=None):
+        mask = np.ones(len(self.pairs), dtype=bool)
+        if min_confidence is not None:
+            mask &= self.pairs['confidence'].to_numpy() >= min_confidence
+        if hedge_type:
+            mask &= (self.pairs['type'] == hedge_type).to_numpy()
+        if asset:
+            mask &= (self.pairs['asset'] == asset).to_numpy()
+        return mask
+
+    def page(self, sort='id', cursor=None, limit=DEFAULT_PAGE_SIZE, **filters):
+        """One page of filtered, sorted pairs plus the trades they reference.
+
+        The cursor is the rank in the sorted order after which the page
+        starts; next_cursor is None on the last page.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        order = self._order(sort)
+        start = decode_cursor(cursor, sort) if cursor else 0
+
+        matching = self._mask(**filters)[order]
+        ranks = np.flatnonzero(matching[start:])[:limit + 1] + start
+        more = len(ranks) > limit
+        ranks = ranks[:limit]
+
+        rows = self.pairs.iloc[order[ranks]]
+        positions, inverse = np.unique(
+            np.concatenate([rows['trade1'].to_numpy(), rows['trade2'].to_numpy()]), return_inverse=True
+        )
+        rows = rows.assign(trade1=inverse[:len(rows)], trade2=inverse[len(rows):])
+
+        return {
+            'trades': self._trade_records(positions),
+            'hedge_pairs': self._pair_records(rows, range(len(positions))),
+            'total': int(matching.sum()),
+            'next_cursor': encode_cursor(int(ranks[-1]) + 1, sort) if more else None
+        }
+
+    def _stream_rows(self, sort, filters):
+        order = self._order(sort)
+        selected = order[self._mask(**filters)[order]]
+        for start in range(0, len(selected), STREAM_BATCH_SIZE):
+            rows = self.pairs.iloc[selected[start:start + STREAM_BATCH_SIZE]]
+            positions, inverse = np.unique(
+                np.concatenate([rows['trade1'].to_numpy(), rows['trade2'].to_numpy()]),
+                return_inverse=True
+            )
+            trades = self._trade_records(positions)
+            yield self._pair_records(rows.assign(trade1=inverse[:len(rows)], trade2=inverse[len(rows):]),
+                                     trades)
+
+    def iter_ndjson(self, sort='id', **filters):
+        """Yield every matching pair as one JSON line with its trades nested"""
+        for batch in self._stream_rows(sort, filters):
+            yield ''.join(json.dumps(pair) + '\n' for pair in batch)
+
+    def iter_csv(self, sort='id', **filters):
+        """Yield every matching pair as CSV rows, header first"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+        for batch in self._stream_rows(sort, filters):
+            for pair in batch:
+                trade1, trade2 = pair['trade1'], pair['trade2']
+                writer.writerow([
+                    pair['id'], pair['type'], pair['asset'], trade1['entry_time'], trade2['entry_time'],
+                    trade1['entry_price'], trade2['entry_price'], f"{pair['confidence']:.2f}",
+                    f"{pair['net_profit']:.2f}", trade1['user_id'], trade2['user_id'],
+                    trade1['account_id'], trade2['account_id']
+                ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+def encode_cursor(rank, sort):
+    return base64.urlsafe_b64encode(json.dumps([sort, rank]).encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+    """Rank encoded in a cursor; it must come from a page with the same sort"""
+    try:
+        cursor_sort, rank = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidInput('Invalid cursor')
+    if cursor_sort != sort or not isinstance(rank, int) or rank < 0:
+        raise InvalidInput('Cursor does not match the requested sort')
+    return rank
+
+
+def page_filters(args):
+    """Filter and sort options of a pairs request"""
+    min_confidence = args.get('min_confidence')
+    try:
+        min_confidence = float(min_confidence) if min_confidence not in (None, '') else None
+    except ValueError:
+        raise InvalidInput(f"min_confidence must be a number, got '{min_confidence}'")
+    return {
+        'sort': args.get('sort', 'id'),
+        'min_confidence': min_confidence,
+        'hedge_type': args.get('type') or None,
+        'asset': args.get('asset') or None
+    }
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def score_candidates(entry_price, close_price, quantity, pairs_i, pairs_j,
+                     price_threshold, include_close_price):
+    """Score candidate pairs as column operations.
+
+    Price similarity weighs 0.4, time overlap 0.3, close price similarity
+    0.3 (a flat 0.15 without include_close_price) and equal quantities add
+    0.1, clipped to [0, 1].
+    Returns (price_diff, confidence) arrays aligned with pairs_i/pairs_j.
+    """
+    entry_price = np.asarray(entry_price, dtype=float)
+    close_price = np.asarray(close_price, dtype=float)
+    quantity = np.asarray(quantity, dtype=float)
+
+    price_diff = np.abs(entry_price[pairs_i] - entry_price[pairs_j])
+
+    # Price similarity (closer prices = higher score)
+    score = 0.4 * (1 - price_diff / price_threshold)
+
+    # Time overlap
+    score += 0.3
+
+    # If including close prices in matching
+    if include_close_price:
+        close_price_diff = np.abs(close_price[pairs_i] - close_price[pairs_j])
+        score += 0.3 * (1 - np.minimum(close_price_diff / price_threshold, 1))
+    else:
+        score += 0.15
+
+    # Quantity similarity (optional bonus)
+    score += np.where(quantity[pairs_i] == quantity[pairs_j], 0.1, 0.0)
+
+    return price_diff, np.clip(score, 0, 1)
+
+
+def format_timestamps(values):
+    """Format epoch millisecond values for display, once per distinct value"""
+    formatted = {}
+    result = []
+    for value in values:
+        text = formatted.get(value)
+        if text is None:
+            text = datetime.fromtimestamp(value / 1000).strftime(TIME_FORMAT)
+            formatted[value] = text
+        result.append(text)
+    return result
+
+
+def build_trade_records(group, positions):
+    """Build the display dict for each trade at the given group positions"""
+    rows = group.iloc[positions]
+    columns = zip(
+        rows['tradehash'].tolist(),
+        rows['short_long'].tolist(),
+        format_timestamps(rows['entry_time'].tolist()),
+        format_timestamps(rows['close_time'].tolist()),
+        rows['avg_market_entry'].to_numpy(dtype=float).tolist(),
+        rows['avg_market_close'].to_numpy(dtype=float).tolist(),
+        rows['net_profit'].to_numpy(dtype=float).tolist(),
+        rows['user_id'].tolist(),
+        rows['account_id'].tolist(),
+        rows['total_contracts'].to_numpy(dtype=float).tolist(),
+    )
+    return [
+        {
+            'tradehash': tradehash,
+            'direction': direction,
+            'entry_time': entry_time,
+            'close_time': close_time,
+            'entry_price': entry_price,
+            'close_price': close_price,
+            'net_profit': net_profit,
+            'user_id': user_id,
+            'account_id': account_id,
+            'quantity': quantity
+        }
+        for (tradehash, direction, entry_time, close_time, entry_price,
+             close_price, net_profit, user_id, account_id, quantity) in columns
+    ]
+
+
+def build_hedge_pairs(asset, group, pairs_i, pairs_j, price_diff, confidence, start_id=1):
+    """Materialize accepted pairs of one asset group as hedge pair dicts.
+
+    Trade dicts are built once per trade and shared by every pair it is in.
+    """
+    if len(pairs_i) == 0:
+        return []
+
+    positions, inverse = np.unique(np.concatenate([pairs_i, pairs_j]), return_inverse=True)
+    records = build_trade_records(group, positions)
+    first = inverse[:len(pairs_i)].tolist()
+    second = inverse[len(pairs_i):].tolist()
+
+    # Determine hedge type
+    user_codes = pd.factorize(group['user_id'])[0]
+    same_user = (user_codes[pairs_i] == user_codes[pairs_j]).tolist()
+
+    net_profit = group['net_profit'].to_numpy(dtype=float)
+    pair_profit = (net_profit[pairs_i] + net_profit[pairs_j]).tolist()
+
+    return [
+        {
+            'id': start_id + k,
+            'type': 'self_hedge' if same_user[k] else 'inter_user_hedge',
+            'asset': asset,
+            'trade1': records[first[k]],
+            'trade2': records[second[k]],
+            'entry_price_diff': diff,
+            'confidence': score,
+            'net_profit': pair_profit[k]
+        }
+        for k, (diff, score) in enumerate(zip(price_diff.tolist(), confidence.tolist()))
+    ]
@@ -1,7 +1,15 @@
 // Global variables
-let uploadedData = null;
+let selectedFile = null;
+let jobId = null;
 let hedgePairs = [];
+let totalPairs = 0;
+let summaryStats = null;
+let notablePatterns = null;
+let hedgeClusters = [];
+let distributions = null;
 let currentPage = 1;
+let totalPages = 1;
+let pageCursors = [null];
 const pageSize = 10;
 
 // DOM Elements
@@ -21,6 +29,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Results sections
     const loadingSection = document.getElementById('loading-section');
+    const loadingStatus = document.getElementById('loading-status');
     const resultsSection = document.getElementById('results-section');
     
     // Filters
@@ -94,16 +103,7 @@ document.addEventListener('DOMContentLoaded', function() {
             fileName.textContent = file.name;
             fileInfo.style.display = 'flex';
             analyzeBtn.disabled = false;
-            
-            // Parse the CSV file
-            Papa.parse(file, {
-                header: true,
-                dynamicTyping: true,
-                complete: function(results) {
-                    uploadedData = results.data;
-                    console.log('CSV data loaded:', uploadedData.length, 'rows');
-                }
-            });
+            selectedFile = file;
         } else {
             alert('Please upload a CSV file.');
         }
@@ -114,7 +114,7 @@ document.addEventListener('DOMContentLoaded', function() {
         fileInput.value = '';
         fileInfo.style.display = 'none';
         analyzeBtn.disabled = true;
-        uploadedData = null;
+        selectedFile = null;
     });
     
     // Update confidence value display
@@ -124,7 +124,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Analyze button
     analyzeBtn.addEventListener('click', function() {
-        if (!uploadedData) {
+        if (!selectedFile) {
             alert('Please upload a CSV file first.');
             return;
         }
@@ -132,29 +132,45 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show loading section
         loadingSection.style.display = 'block';
         resultsSection.style.display = 'none';
+        analyzeBtn.disabled = true;
         
-        // Get parameters
-        const priceThresholdValue = parseFloat(priceThreshold.value);
-        const confidenceThresholdValue = parseFloat(confidenceThreshold.value);
-        const includeClosePriceValue = includeClosePrice.checked;
+        // Send the file and parameters to the server as an analysis job
+        const formData = new FormData();
+        formData.append('file', selectedFile);
+        formData.append('price_threshold', priceThreshold.value);
+        formData.append('confidence_threshold', confidenceThreshold.value);
+        formData.append('include_close_price', includeClosePrice.checked ? 'true' : 'false');
         
-        // Process data (this would normally be done on the backend)
-        setTimeout(() => {
-            processData(uploadedData, priceThresholdValue, confidenceThresholdValue, includeClosePriceValue);
-            
-            // Hide loading, show results
-            loadingSection.style.display = 'none';
-            resultsSection.style.display = 'block';
-            
-            // Scroll to results
-            resultsSection.scrollIntoView({ behavior: 'smooth' });
-        }, 1500); // Simulating processing time
+        runAnalysisJob(formData, status => {
+            loadingStatus.textContent = describeJobStatus(status);
+        })
+            .then(id => showResults(id))
+            .then(() => {
+                // Hide loading, show results
+                loadingSection.style.display = 'none';
+                resultsSection.style.display = 'block';
+                
+                // Scroll to results
+                resultsSection.scrollIntoView({ behavior: 'smooth' });
+            })
+            .catch(error => {
+                loadingSection.style.display = 'none';
+                alert(`Analysis failed: ${error.message}`);
+            })
+            .finally(() => {
+                analyzeBtn.disabled = !selectedFile;
+            });
     });
     
-    // Filter and sort event listeners
-    filterType.addEventListener('change', updateResults);
-    filterConfidence.addEventListener('change', updateResults);
-    sortBy.addEventListener('change', updateResults);
+    // Filter and sort changes restart from the first page
+    const restartResults = () => {
+        currentPage = 1;
+        pageCursors = [null];
+        updateResults();
+    };
+    filterType.addEventListener('change', restartResults);
+    filterConfidence.addEventListener('change', restartResults);
+    sortBy.addEventListener('change', restartResults);
     
     // Pagination event listeners
     prevPageBtn.addEventListener('click', () => {
@@ -165,8 +181,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     nextPageBtn.addEventListener('click', () => {
-        const totalPages = Math.ceil(getFilteredHedgePairs().length / pageSize);
-        if (currentPage < totalPages) {
+        if (currentPage < totalPages && pageCursors[currentPage]) {
             currentPage++;
             updateResults();
         }
@@ -190,206 +205,121 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
-// Process the uploaded data to find hedge pairs
-function processData(data, priceThreshold, confidenceThreshold, includeClosePrice) {
-    // Reset results
-    hedgePairs = [];
-    
-    // Clean data - remove any rows with missing essential values
-    const cleanData = data.filter(row => 
-        row && row.tradehash && row.short_long && row.asset && 
-        row.entry_datetimes && row.market_entries && 
-        row.close_datetimes && row.market_closes &&
-        row.account_id && row.user_id
-    );
-    
-    // Group trades by asset (treating equivalent assets as the same)
-    const assetGroups = {};
-    cleanData.forEach(trade => {
-        // Normalize asset name (e.g., treat NQM5 and MNQM5 as equivalent)
-        const normalizedAsset = normalizeAssetName(trade.asset);
-        
-        if (!assetGroups[normalizedAsset]) {
-            assetGroups[normalizedAsset] = [];
-        }
-        assetGroups[normalizedAsset].push(trade);
-    });
+// Submit an analysis job and poll it until it is done; resolves to the job id
+async function runAnalysisJob(formData, onProgress) {
+    const response = await fetch('/jobs', { method: 'POST', body: formData });
+    let status = await response.json();
+    if (!response.ok) {
+        throw new Error(status.error || response.statusText);
+    }
     
-    // Find potential hedge pairs
-    let pairId = 1;
-    Object.keys(assetGroups).forEach(asset => {
-        const trades = assetGroups[asset];
+    while (status.status !== 'done') {
+        if (status.status === 'failed') {
+            throw new Error(status.error);
+        }
+        onProgress(status);
+        await new Promise(resolve => setTimeout(resolve, 1000));
         
-        for (let i = 0; i < trades.length; i++) {
-            const trade1 = trades[i];
-            
-            // Parse entry and close times
-            const entry1 = parseFloat(trade1.entry_datetimes.replace('[', '').replace(']', ''));
-            const close1 = parseFloat(trade1.close_datetimes.replace('[', '').replace(']', ''));
-            
-            for (let j = i + 1; j < trades.length; j++) {
-                const trade2 = trades[j];
-                
-                // Check if trades have opposite directions
-                if (trade1.short_long !== trade2.short_long) {
-                    // Parse entry and close times
-                    const entry2 = parseFloat(trade2.entry_datetimes.replace('[', '').replace(']', ''));
-                    const close2 = parseFloat(trade2.close_datetimes.replace('[', '').replace(']', ''));
-                    
-                    // Parse entry prices
-                    const price1 = parseFloat(trade1.avg_market_entry);
-                    const price2 = parseFloat(trade2.avg_market_entry);
-                    
-                    // Check if entry prices are within threshold
-                    const priceDiff = Math.abs(price1 - price2);
-                    if (priceDiff <= priceThreshold) {
-                        // Check if timeframes overlap
-                        const timeOverlap = (entry2 >= entry1 && entry2 <= close1) || 
-                                           (entry1 >= entry2 && entry1 <= close2);
-                        
-                        if (timeOverlap) {
-                            // Calculate confidence score
-                            let confidenceScore = calculateConfidenceScore(
-                                trade1, trade2, priceDiff, priceThreshold, 
-                                timeOverlap, includeClosePrice
-                            );
-                            
-                            // Only include pairs with confidence above threshold
-                            if (confidenceScore >= confidenceThreshold) {
-                                // Determine hedge type
-                                const hedgeType = trade1.user_id === trade2.user_id ? 
-                                    'self_hedge' : 'inter_user_hedge';
-                                
-                                // Create hedge pair object
-                                const hedgePair = {
-                                    id: pairId++,
-                                    type: hedgeType,
-                                    asset: asset,
-                                    trade1: trade1,
-                                    trade2: trade2,
-                                    entryTimeDiff: Math.abs(entry1 - entry2),
-                                    entryPriceDiff: priceDiff,
-                                    confidence: confidenceScore,
-                                    netProfit: parseFloat(trade1.net_profit) + parseFloat(trade2.net_profit)
-                                };
-                                
-                                hedgePairs.push(hedgePair);
-                            }
-                        }
-                    }
-                }
-            }
+        const poll = await fetch(`/jobs/${status.id}`);
+        status = await poll.json();
+        if (!poll.ok) {
+            throw new Error(status.error || poll.statusText);
         }
-    });
-    
-    // Update results display
-    updateSummaryStats();
-    createCharts();
-    updateResults();
-    findNotablePatterns();
+    }
+    onProgress(status);
+    return status.id;
 }
 
-// Normalize asset names (e.g., treat NQM5 and MNQM5 as equivalent)
-function normalizeAssetName(asset) {
-    // This is a simplified example - in a real application, you would have more comprehensive rules
-    if (asset.includes('NQ')) {
-        return 'NQ';
+// Fetch JSON from the server, throwing the server's error message on failure
+async function fetchJson(url) {
+    const response = await fetch(url);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || response.statusText);
     }
-    return asset;
+    return data;
 }
 
-// Calculate confidence score based on how well the pair matches hedging criteria
-function calculateConfidenceScore(trade1, trade2, priceDiff, priceThreshold, timeOverlap, includeClosePrice) {
-    let score = 0;
-    
-    // Price similarity (closer prices = higher score)
-    score += 0.4 * (1 - priceDiff / priceThreshold);
-    
-    // Time overlap
-    score += 0.3;
-    
-    // If including close prices in matching
-    if (includeClosePrice) {
-        const closePrice1 = parseFloat(trade1.avg_market_close);
-        const closePrice2 = parseFloat(trade2.avg_market_close);
-        const closePriceDiff = Math.abs(closePrice1 - closePrice2);
-        
-        // Close price similarity (closer prices = higher score)
-        score += 0.3 * (1 - Math.min(closePriceDiff / priceThreshold, 1));
-    } else {
-        // If not considering close prices, distribute the weight elsewhere
-        score += 0.15; // Add half of the potential close price score as a baseline
+// Describe the progress of an analysis job for the loading section
+function describeJobStatus(status) {
+    if (status.status === 'queued') {
+        return 'Waiting for an analysis slot...';
     }
-    
-    // Quantity similarity (optional bonus)
-    const qty1 = parseFloat(trade1.total_contracts);
-    const qty2 = parseFloat(trade2.total_contracts);
-    if (qty1 === qty2) {
-        score += 0.1;
-    }
-    
-    return Math.min(Math.max(score, 0), 1); // Ensure score is between 0 and 1
+    const rate = status.rows_per_second ? `, ${Math.round(status.rows_per_second).toLocaleString()} rows/s` : '';
+    return `Analyzing data: ${status.stage} (${Math.round(status.percent)}%${rate})`;
 }
 
-// Get filtered hedge pairs based on current filter settings
-function getFilteredHedgePairs() {
-    const typeFilter = document.getElementById('filter-type').value;
-    const confidenceFilter = parseFloat(document.getElementById('filter-confidence').value);
+// Display the results of a finished job; pairs are fetched a page at a time
+async function showResults(id) {
+    const summary = await fetchJson(`/jobs/${id}/summary`);
+    jobId = id;
+    totalPairs = summary.total_pairs;
+    summaryStats = summary.summary_stats;
+    notablePatterns = summary.notable_patterns;
+    hedgeClusters = summary.hedge_clusters || [];
+    distributions = summary.distributions;
+    currentPage = 1;
+    pageCursors = [null];
     
-    return hedgePairs.filter(pair => {
-        // Filter by type
-        if (typeFilter !== 'all' && pair.type !== typeFilter) {
-            return false;
-        }
-        
-        // Filter by confidence
-        if (pair.confidence < confidenceFilter) {
-            return false;
-        }
-        
-        return true;
-    });
+    updateSummaryStats();
+    createCharts();
+    findNotablePatterns();
+    await updateResults();
 }
 
-// Sort hedge pairs based on current sort settings
-function getSortedHedgePairs(pairs) {
-    const sortOption = document.getElementById('sort-by').value;
-    
-    return [...pairs].sort((a, b) => {
-        switch (sortOption) {
-            case 'confidence-desc':
-                return b.confidence - a.confidence;
-            case 'confidence-asc':
-                return a.confidence - b.confidence;
-            case 'time-desc':
-                return parseFloat(b.trade1.entry_datetimes.replace('[', '').replace(']', '')) - 
-                       parseFloat(a.trade1.entry_datetimes.replace('[', '').replace(']', ''));
-            case 'time-asc':
-                return parseFloat(a.trade1.entry_datetimes.replace('[', '').replace(']', '')) - 
-                       parseFloat(b.trade1.entry_datetimes.replace('[', '').replace(']', ''));
-            default:
-                return 0;
-        }
+// Parse a 'YYYY-MM-DD HH:MM:SS' time from the server
+function parseServerTime(time) {
+    return new Date(time.replace(' ', 'T'));
+}
+
+// Query string for the current filter and sort settings
+function pairsQuery() {
+    const query = new URLSearchParams({
+        sort: document.getElementById('sort-by').value,
+        min_confidence: document.getElementById('filter-confidence').value
     });
+    const typeFilter = document.getElementById('filter-type').value;
+    if (typeFilter !== 'all') {
+        query.set('type', typeFilter);
+    }
+    return query;
 }
 
-// Update the results table based on current filters and sorting
-function updateResults() {
-    const filteredPairs = getFilteredHedgePairs();
-    const sortedPairs = getSortedHedgePairs(filteredPairs);
+// Fetch the current page of hedge pairs, with their trades resolved
+async function fetchPairsPage() {
+    const query = pairsQuery();
+    query.set('limit', pageSize);
+    const cursor = pageCursors[currentPage - 1];
+    if (cursor) {
+        query.set('cursor', cursor);
+    }
     
-    // Calculate pagination
-    const totalPages = Math.ceil(sortedPairs.length / pageSize);
-    currentPage = Math.min(currentPage, totalPages || 1);
+    const page = await fetchJson(`/jobs/${jobId}/pairs?${query}`);
+    pageCursors[currentPage] = page.next_cursor;
+    totalPages = Math.max(Math.ceil(page.total / pageSize), 1);
     
-    const startIndex = (currentPage - 1) * pageSize;
-    const endIndex = Math.min(startIndex + pageSize, sortedPairs.length);
-    const pairsToShow = sortedPairs.slice(startIndex, endIndex);
+    return page.hedge_pairs.map(pair => ({
+        ...pair,
+        trade1: page.trades[pair.trade1],
+        trade2: page.trades[pair.trade2]
+    }));
+}
+
+// Update the results table based on current filters and sorting
+async function updateResults() {
+    let pairsToShow;
+    try {
+        pairsToShow = await fetchPairsPage();
+    } catch (error) {
+        alert(`Could not load hedge pairs: ${error.message}`);
+        return;
+    }
+    hedgePairs = pairsToShow;
     
     // Update pagination controls
     document.getElementById('prev-page').disabled = currentPage <= 1;
-    document.getElementById('next-page').disabled = currentPage >= totalPages;
-    document.getElementById('page-info').textContent = `Page ${currentPage} of ${totalPages || 1}`;
+    document.getElementById('next-page').disabled = !pageCursors[currentPage];
+    document.getElementById('page-info').textContent = `Page ${currentPage} of ${totalPages}`;
     
     // Update table
     const tableBody = document.getElementById('hedge-pairs-body');
@@ -398,18 +328,14 @@ function updateResults() {
     pairsToShow.forEach(pair => {
         const row = document.createElement('tr');
         
-        // Format entry times for display
-        const entryTime1 = new Date(parseInt(pair.trade1.entry_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-        const entryTime2 = new Date(parseInt(pair.trade2.entry_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-        
         row.innerHTML = `
             <td>${pair.id}</td>
             <td>${pair.type === 'self_hedge' ? 'Self-Hedge' : 'Inter-User Hedge'}</td>
             <td>${pair.asset}</td>
-            <td>${entryTime1}<br>${entryTime2}</td>
-            <td>${pair.trade1.avg_market_entry}<br>${pair.trade2.avg_market_entry}</td>
+            <td>${pair.trade1.entry_time}<br>${pair.trade2.entry_time}</td>
+            <td>${pair.trade1.entry_price}<br>${pair.trade2.entry_price}</td>
             <td>${pair.confidence.toFixed(2)}</td>
-            <td>${pair.netProfit.toFixed(2)}</td>
+            <td>${pair.net_profit.toFixed(2)}</td>
             <td><button class="view-details" data-pair-id="${pair.id}">View</button></td>
         `;
         
@@ -427,39 +353,19 @@ function updateResults() {
 
 // Update summary statistics
 function updateSummaryStats() {
-    // Count hedge types
-    const selfHedges = hedgePairs.filter(pair => pair.type === 'self_hedge').length;
-    const interUserHedges = hedgePairs.filter(pair => pair.type === 'inter_user_hedge').length;
-    
-    // Calculate average confidence
-    const avgConfidence = hedgePairs.length > 0 ? 
-        hedgePairs.reduce((sum, pair) => sum + pair.confidence, 0) / hedgePairs.length : 0;
-    
-    // Count unique users and accounts involved
-    const uniqueUsers = new Set();
-    const uniqueAccounts = new Set();
-    
-    hedgePairs.forEach(pair => {
-        uniqueUsers.add(pair.trade1.user_id);
-        uniqueUsers.add(pair.trade2.user_id);
-        uniqueAccounts.add(pair.trade1.account_id);
-        uniqueAccounts.add(pair.trade2.account_id);
-    });
-    
-    // Update DOM elements
-    document.getElementById('total-hedges').textContent = hedgePairs.length;
-    document.getElementById('self-hedges').textContent = selfHedges;
-    document.getElementById('inter-user-hedges').textContent = interUserHedges;
-    document.getElementById('avg-confidence').textContent = avgConfidence.toFixed(2);
-    document.getElementById('users-involved').textContent = uniqueUsers.size;
-    document.getElementById('accounts-involved').textContent = uniqueAccounts.size;
+    document.getElementById('total-hedges').textContent = summaryStats.total_hedges;
+    document.getElementById('self-hedges').textContent = summaryStats.self_hedges;
+    document.getElementById('inter-user-hedges').textContent = summaryStats.inter_user_hedges;
+    document.getElementById('avg-confidence').textContent = summaryStats.avg_confidence.toFixed(2);
+    document.getElementById('users-involved').textContent = summaryStats.users_involved;
+    document.getElementById('accounts-involved').textContent = summaryStats.accounts_involved;
 }
 
 // Create charts for visualizations
 function createCharts() {
     // Hedge Types Chart
-    const selfHedges = hedgePairs.filter(pair => pair.type === 'self_hedge').length;
-    const interUserHedges = hedgePairs.filter(pair => pair.type === 'inter_user_hedge').length;
+    const selfHedges = distributions.types.self_hedge || 0;
+    const interUserHedges = distributions.types.inter_user_hedge || 0;
     
     const hedgeTypesCtx = document.getElementById('hedge-types-chart').getContext('2d');
     new Chart(hedgeTypesCtx, {
@@ -482,22 +388,7 @@ function createCharts() {
     });
     
     // Confidence Distribution Chart
-    const confidenceBins = [0, 0.2, 0.4, 0.6, 0.8, 1];
-    const confidenceCounts = Array(5).fill(0);
-    
-    hedgePairs.forEach(pair => {
-        for (let i = 0; i < confidenceBins.length - 1; i++) {
-            if (pair.confidence >= confidenceBins[i] && pair.confidence < confidenceBins[i + 1]) {
-                confidenceCounts[i]++;
-                break;
-            }
-        }
-        // Handle the case where confidence is exactly 1
-        if (pair.confidence === 1) {
-            confidenceCounts[4]++;
-        }
-    });
-    
+    const confidenceCounts = distributions.confidence;
     const confidenceLabels = ['0.0-0.2', '0.2-0.4', '0.4-0.6', '0.6-0.8', '0.8-1.0'];
     
     const confidenceCtx = document.getElementById('confidence-distribution-chart').getContext('2d');
@@ -527,14 +418,7 @@ function createCharts() {
     });
     
     // Time Distribution Chart (by hour of day)
-    const hourCounts = Array(24).fill(0);
-    
-    hedgePairs.forEach(pair => {
-        const entryTime = new Date(parseInt(pair.trade1.entry_datetimes.replace('[', '').replace(']', '')));
-        const hour = entryTime.getHours();
-        hourCounts[hour]++;
-    });
-    
+    const hourCounts = distributions.hours;
     const hourLabels = Array.from({length: 24}, (_, i) => `${i}:00`);
     
     const timeCtx = document.getElementById('time-distribution-chart').getContext('2d');
@@ -566,84 +450,102 @@ function createCharts() {
     });
 }
 
-// Find notable patterns in the hedge pairs
+// Show the notable patterns found by the server
 function findNotablePatterns() {
     const notableFindings = document.getElementById('notable-findings-content');
     notableFindings.innerHTML = '';
     
-    if (hedgePairs.length === 0) {
+    if (totalPairs === 0) {
         notableFindings.innerHTML = '<p>No hedge pairs detected.</p>';
         return;
     }
     
-    // Find users with multiple hedge pairs
-    const userHedgeCounts = {};
-    hedgePairs.forEach(pair => {
-        const user1 = pair.trade1.user_id;
-        const user2 = pair.trade2.user_id;
-        
-        userHedgeCounts[user1] = (userHedgeCounts[user1] || 0) + 1;
-        if (user1 !== user2) {
-            userHedgeCounts[user2] = (userHedgeCounts[user2] || 0) + 1;
-        }
-    });
-    
-    // Find users with high hedge counts
-    const frequentUsers = Object.entries(userHedgeCounts)
-        .filter(([_, count]) => count >= 3)
-        .sort((a, b) => b[1] - a[1]);
-    
-    if (frequentUsers.length > 0) {
+    // Users with multiple hedge pairs
+    if (notablePatterns.frequent_users.length > 0) {
         const usersList = document.createElement('div');
         usersList.innerHTML = '<h4>Users with Multiple Hedge Pairs:</h4><ul>';
         
-        frequentUsers.forEach(([userId, count]) => {
-            usersList.innerHTML += `<li>User ${userId}: ${count} hedge pairs</li>`;
+        notablePatterns.frequent_users.forEach(({ user_id, count }) => {
+            usersList.innerHTML += `<li>User ${user_id}: ${count} hedge pairs</li>`;
         });
         
         usersList.innerHTML += '</ul>';
         notableFindings.appendChild(usersList);
     }
     
-    // Check for time patterns (e.g., same time of day)
-    const hourPatterns = {};
-    hedgePairs.forEach(pair => {
-        const entryTime = new Date(parseInt(pair.trade1.entry_datetimes.replace('[', '').replace(']', '')));
-        const hour = entryTime.getHours();
-        
-        hourPatterns[hour] = (hourPatterns[hour] || 0) + 1;
-    });
-    
-    const peakHours = Object.entries(hourPatterns)
-        .filter(([_, count]) => count >= Math.max(...Object.values(hourPatterns)) * 0.8)
-        .sort((a, b) => b[1] - a[1]);
-    
-    if (peakHours.length > 0) {
+    // Time patterns (e.g., same time of day)
+    if (notablePatterns.peak_hours.length > 0) {
         const timePatternDiv = document.createElement('div');
         timePatternDiv.innerHTML = '<h4>Peak Hedging Hours:</h4><ul>';
         
-        peakHours.forEach(([hour, count]) => {
-            timePatternDiv.innerHTML += `<li>${hour}:00 - ${hour}:59: ${count} hedge pairs (${(count / hedgePairs.length * 100).toFixed(1)}% of total)</li>`;
+        notablePatterns.peak_hours.forEach(({ hour, count, percentage }) => {
+            timePatternDiv.innerHTML += `<li>${hour}:00 - ${hour}:59: ${count} hedge pairs (${percentage.toFixed(1)}% of total)</li>`;
         });
         
         timePatternDiv.innerHTML += '</ul>';
         notableFindings.appendChild(timePatternDiv);
     }
     
-    // Check for asset patterns
-    const assetPatterns = {};
-    hedgePairs.forEach(pair => {
-        assetPatterns[pair.asset] = (assetPatterns[pair.asset] || 0) + 1;
-    });
+    // Accounts with multiple hedge pairs
+    if (notablePatterns.frequent_accounts.length > 0) {
+        const accountsList = document.createElement('div');
+        accountsList.innerHTML = '<h4>Accounts with Multiple Hedge Pairs:</h4><ul>';
+        
+        notablePatterns.frequent_accounts.forEach(({ account_id, count }) => {
+            accountsList.innerHTML += `<li>Account ${account_id}: ${count} hedge pairs</li>`;
+        });
+        
+        accountsList.innerHTML += '</ul>';
+        notableFindings.appendChild(accountsList);
+    }
+    
+    // Repeat patterns: same hour on several days
+    if (notablePatterns.repeat_hours.length > 0) {
+        const repeatDiv = document.createElement('div');
+        repeatDiv.innerHTML = '<h4>Same Hour on Several Days:</h4><ul>';
+        
+        notablePatterns.repeat_hours.forEach(({ user_id, hour, days, count }) => {
+            repeatDiv.innerHTML += `<li>User ${user_id}: ${hour}:00 - ${hour}:59 on ${days} days (${count} hedge pairs)</li>`;
+        });
+        
+        repeatDiv.innerHTML += '</ul>';
+        notableFindings.appendChild(repeatDiv);
+    }
     
+    // Repeat patterns: same price range
+    if (notablePatterns.price_bands.length > 0) {
+        const bandsDiv = document.createElement('div');
+        bandsDiv.innerHTML = '<h4>Recurring Price Ranges:</h4><ul>';
+        
+        notablePatterns.price_bands.forEach(({ asset, low, high, count, percentage }) => {
+            bandsDiv.innerHTML += `<li>${asset} ${low} - ${high}: ${count} hedge pairs (${percentage.toFixed(1)}% of total)</li>`;
+        });
+        
+        bandsDiv.innerHTML += '</ul>';
+        notableFindings.appendChild(bandsDiv);
+    }
+    
+    // Rings of users and accounts hedging each other repeatedly
+    if (hedgeClusters.length > 0) {
+        const clustersDiv = document.createElement('div');
+        clustersDiv.innerHTML = '<h4>Hedge Clusters:</h4><ul>';
+        
+        hedgeClusters.forEach(({ rank, user_count, account_count, pair_count, net_profit, users }) => {
+            const shownUsers = users.slice(0, 10).join(', ') + (user_count > 10 ? ', ...' : '');
+            clustersDiv.innerHTML += `<li>#${rank}: ${user_count} users, ${account_count} accounts, ${pair_count} hedge pairs, net profit ${net_profit.toFixed(2)} (users ${shownUsers})</li>`;
+        });
+        
+        clustersDiv.innerHTML += '</ul>';
+        notableFindings.appendChild(clustersDiv);
+    }
+    
+    // Asset patterns
     const assetList = document.createElement('div');
     assetList.innerHTML = '<h4>Hedge Pairs by Asset:</h4><ul>';
     
-    Object.entries(assetPatterns)
-        .sort((a, b) => b[1] - a[1])
-        .forEach(([asset, count]) => {
-            assetList.innerHTML += `<li>${asset}: ${count} hedge pairs (${(count / hedgePairs.length * 100).toFixed(1)}% of total)</li>`;
-        });
+    notablePatterns.asset_distribution.forEach(({ asset, count, percentage }) => {
+        assetList.innerHTML += `<li>${asset}: ${count} hedge pairs (${percentage.toFixed(1)}% of total)</li>`;
+    });
     
     assetList.innerHTML += '</ul>';
     notableFindings.appendChild(assetList);
@@ -657,11 +559,9 @@ function showPairDetails(pairId) {
     const modal = document.getElementById('pair-details-modal');
     const content = document.getElementById('pair-details-content');
     
-    // Format dates for display
-    const entryTime1 = new Date(parseInt(pair.trade1.entry_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-    const closeTime1 = new Date(parseInt(pair.trade1.close_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-    const entryTime2 = new Date(parseInt(pair.trade2.entry_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-    const closeTime2 = new Date(parseInt(pair.trade2.close_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
+    // Durations in seconds
+    const duration1 = (parseServerTime(pair.trade1.close_time) - parseServerTime(pair.trade1.entry_time)) / 1000;
+    const duration2 = (parseServerTime(pair.trade2.close_time) - parseServerTime(pair.trade2.entry_time)) / 1000;
     
     content.innerHTML = `
         <div class="pair-details">
@@ -669,7 +569,7 @@ function showPairDetails(pairId) {
                 <h3>Hedge Pair #${pair.id} - ${pair.asset}</h3>
                 <p><strong>Type:</strong> ${pair.type === 'self_hedge' ? 'Self-Hedge' : 'Inter-User Hedge'}</p>
                 <p><strong>Confidence Score:</strong> ${pair.confidence.toFixed(2)}</p>
-                <p><strong>Net Profit:</strong> $${pair.netProfit.toFixed(2)}</p>
+                <p><strong>Net Profit:</strong> $${pair.net_profit.toFixed(2)}</p>
             </div>
             
             <div class="trade-comparison">
@@ -685,43 +585,43 @@ function showPairDetails(pairId) {
                     <tbody>
                         <tr>
                             <td>Direction</td>
-                            <td>${pair.trade1.short_long}</td>
-                            <td>${pair.trade2.short_long}</td>
+                            <td>${pair.trade1.direction}</td>
+                            <td>${pair.trade2.direction}</td>
                         </tr>
                         <tr>
                             <td>Entry Time</td>
-                            <td>${entryTime1}</td>
-                            <td>${entryTime2}</td>
+                            <td>${pair.trade1.entry_time}</td>
+                            <td>${pair.trade2.entry_time}</td>
                         </tr>
                         <tr>
                             <td>Close Time</td>
-                            <td>${closeTime1}</td>
-                            <td>${closeTime2}</td>
+                            <td>${pair.trade1.close_time}</td>
+                            <td>${pair.trade2.close_time}</td>
                         </tr>
                         <tr>
                             <td>Duration (seconds)</td>
-                            <td>${pair.trade1.seconds_held}</td>
-                            <td>${pair.trade2.seconds_held}</td>
+                            <td>${duration1}</td>
+                            <td>${duration2}</td>
                         </tr>
                         <tr>
                             <td>Entry Price</td>
-                            <td>${pair.trade1.avg_market_entry}</td>
-                            <td>${pair.trade2.avg_market_entry}</td>
+                            <td>${pair.trade1.entry_price}</td>
+                            <td>${pair.trade2.entry_price}</td>
                         </tr>
                         <tr>
                             <td>Close Price</td>
-                            <td>${pair.trade1.avg_market_close}</td>
-                            <td>${pair.trade2.avg_market_close}</td>
+                            <td>${pair.trade1.close_price}</td>
+                            <td>${pair.trade2.close_price}</td>
                         </tr>
                         <tr>
                             <td>Quantity</td>
-                            <td>${pair.trade1.total_contracts}</td>
-                            <td>${pair.trade2.total_contracts}</td>
+                            <td>${pair.trade1.quantity}</td>
+                            <td>${pair.trade2.quantity}</td>
                         </tr>
                         <tr>
                             <td>Profit/Loss</td>
-                            <td>$${parseFloat(pair.trade1.net_profit).toFixed(2)}</td>
-                            <td>$${parseFloat(pair.trade2.net_profit).toFixed(2)}</td>
+                            <td>$${pair.trade1.net_profit.toFixed(2)}</td>
+                            <td>$${pair.trade2.net_profit.toFixed(2)}</td>
                         </tr>
                         <tr>
                             <td>User ID</td>
@@ -741,8 +641,8 @@ function showPairDetails(pairId) {
                 <h3>Confidence Score Breakdown</h3>
                 <p>The confidence score is calculated based on how well this pair matches the hedging criteria:</p>
                 <ul>
-                    <li>Opposite directions: ${pair.trade1.short_long !== pair.trade2.short_long ? 'Yes' : 'No'}</li>
-                    <li>Entry price difference: $${pair.entryPriceDiff.toFixed(2)}</li>
+                    <li>Opposite directions: ${pair.trade1.direction !== pair.trade2.direction ? 'Yes' : 'No'}</li>
+                    <li>Entry price difference: $${pair.entry_price_diff.toFixed(2)}</li>
                     <li>Time overlap: Yes</li>
                     <li>Same asset: Yes</li>
                 </ul>
@@ -753,44 +653,24 @@ function showPairDetails(pairId) {
     modal.style.display = 'block';
 }
 
-// Export functions
+// Export functions stream every pair from the server
 function exportToCsv() {
-    if (hedgePairs.length === 0) {
-        alert('No data to export.');
-        return;
-    }
-    
-    let csvContent = 'data:text/csv;charset=utf-8,';
-    csvContent += 'Pair ID,Type,Asset,Entry Time 1,Entry Time 2,Entry Price 1,Entry Price 2,Confidence,Net Profit,User ID 1,User ID 2,Account ID 1,Account ID 2\n';
-    
-    hedgePairs.forEach(pair => {
-        const entryTime1 = new Date(parseInt(pair.trade1.entry_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-        const entryTime2 = new Date(parseInt(pair.trade2.entry_datetimes.replace('[', '').replace(']', ''))).toLocaleString();
-        
-        csvContent += `${pair.id},${pair.type},${pair.asset},${entryTime1},${entryTime2},${pair.trade1.avg_market_entry},${pair.trade2.avg_market_entry},${pair.confidence.toFixed(2)},${pair.netProfit.toFixed(2)},${pair.trade1.user_id},${pair.trade2.user_id},${pair.trade1.account_id},${pair.trade2.account_id}\n`;
-    });
-    
-    const encodedUri = encodeURI(csvContent);
-    const link = document.createElement('a');
-    link.setAttribute('href', encodedUri);
-    link.setAttribute('download', 'hedge_pairs_export.csv');
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
+    downloadExport('csv');
 }
 
 function exportToJson() {
-    if (hedgePairs.length === 0) {
+    downloadExport('ndjson');
+}
+
+function downloadExport(format) {
+    if (totalPairs === 0) {
         alert('No data to export.');
         return;
     }
     
-    const jsonData = JSON.stringify(hedgePairs, null, 2);
-    const dataStr = 'data:text/json;charset=utf-8,' + encodeURIComponent(jsonData);
-    
     const link = document.createElement('a');
-    link.setAttribute('href', dataStr);
-    link.setAttribute('download', 'hedge_pairs_export.json');
+    link.setAttribute('href', `/jobs/${jobId}/pairs.${format}`);
+    link.setAttribute('download', `hedge_pairs_export.${format}`);
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
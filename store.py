@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ingest import DEFAULT_CHUNKSIZE, LIST_COLUMNS, parse_trade_lists
+from symbols import entry_years
+
+# Bump when the on-disk layout changes; older stores must be ingested again
+STORE_VERSION = 4
+
+STORE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+# Columns stored as small integer codes into a per-store dictionary
+DICTIONARY_COLUMNS = ('asset', 'short_long', 'user_id', 'account_id')
+# Columns read as text from every chunk, so the type of their values is decided
+# once for the whole store instead of by what each chunk happens to hold
+TEXT_COLUMNS = ('tradehash', 'user_id', 'account_id')
+TEXT_DTYPES = {column: str for column in TEXT_COLUMNS}
+# Trade ids that are all integer literals of this many digits or fewer load as int64,
+# as read_csv would parse them; any other id makes every id of the store load as str
+INTEGER_TRADEHASH = re.compile(r'^-?\d{1,18}$')
+
+
+def typed_ids(texts):
+    """User or account ids read as text, typed as read_csv would type the whole
+    column: int when all are integers, else float when all are numbers, else str"""
+    if all(map(INTEGER_TRADEHASH.match, texts)):
+        return [int(text) for text in texts]
+    try:
+        return [float(text) for text in texts]
+    except ValueError:
+        return list(texts)
+
+# Columns stored as float64 arrays
+NUMERIC_COLUMNS = ('avg_market_entry', 'avg_market_close', 'net_profit', 'total_contracts')
+
+
+class TradeStoreWriter:
+    """Write cleaned trades chunk by chunk into a columnar trade store.
+
+    Every column is appended to its own raw binary file as chunks arrive, so
+    memory stays bounded by the chunk size plus the dictionaries. The store
+    is built in a temporary directory and moved into place on close.
+    """
+
+    def __init__(self, path, source_hash=None):
+        self.path = path
+        self.source_hash = source_hash
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='.ingest-', dir=parent)
+        self.files = {name: open(os.path.join(self.directory, f'{name}.bin'), 'wb') for name in (
+            *(f'{column}.codes' for column in DICTIONARY_COLUMNS), *NUMERIC_COLUMNS,
+            *(f'{column}.{part}' for column in (*LIST_COLUMNS, 'tradehash') for part in ('values', 'offsets'))
+        )}
+        self.dictionaries = {column: {} for column in DICTIONARY_COLUMNS}
+        self.list_lengths = {column: 0 for column in LIST_COLUMNS}
+        self.tradehash_bytes = 0
+        self.integer_tradehash = True
+        self.trades = 0
+        self.rows = 0
+        self.user_ids = set()
+        self.account_ids = set()
+        for column in (*LIST_COLUMNS, 'tradehash'):
+            self._write(f'{column}.offsets', np.zeros(1, dtype=np.int64))
+
+    def _write(self, name, values):
+        np.ascontiguousarray(values).tofile(self.files[name])
+
+    def observe(self, chunk):
+        """Record the population of a raw input chunk"""
+        self.rows += len(chunk)
+        self.user_ids.update(chunk['user_id'].dropna().unique().tolist())
+        self.account_ids.update(chunk['account_id'].dropna().unique().tolist())
+
+    def append(self, trades):
+        """Append trades that have been through detection.clean_trades, read with TEXT_DTYPES"""
+        for column in DICTIONARY_COLUMNS:
+            codes, uniques = pd.factorize(trades[column])
+            dictionary = self.dictionaries[column]
+            for value in uniques.tolist():
+                dictionary.setdefault(value, len(dictionary))
+            mapping = np.array([dictionary[value] for value in uniques.tolist()], dtype=np.int32)
+            self._write(f'{column}.codes', mapping[codes])
+
+        for column in NUMERIC_COLUMNS:
+            self._write(column, pd.to_numeric(trades[column], errors='coerce').to_numpy(dtype=np.float64))
+
+        for column, values in parse_trade_lists(trades).items():
+            self._write(f'{column}.values', values.values.astype(np.float64))
+            self._write(f'{column}.offsets', values.offsets[1:] + self.list_lengths[column])
+            self.list_lengths[column] += len(values.values)
+
+        # Trade ids are kept as UTF-8 text plus offsets
+        texts = [str(value) for value in trades['tradehash'].tolist()]
+        self.integer_tradehash = self.integer_tradehash and all(map(INTEGER_TRADEHASH.match, texts))
+        encoded = [text.encode() for text in texts]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        self._write('tradehash.values', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        self._write('tradehash.offsets', np.cumsum(lengths) + self.tradehash_bytes)
+        self.tradehash_bytes += int(lengths.sum())
+
+        self.trades += len(trades)
+
+    def close(self):
+        """Finish the store and move it into place, replacing any older one"""
+        for f in self.files.values():
+            f.close()
+
+        # Row order grouped by asset and entry year, so the rows of one asset
+        # traded in one year are one slice of it; the year resolves short
+        # contract years such as 'NQM5'
+        asset_codes = np.fromfile(os.path.join(self.directory, 'asset.codes.bin'), dtype=np.int32)
+        years = entry_years(self._first_entry_times())
+        order = np.lexsort((years, asset_codes))
+        order.astype(np.int64).tofile(os.path.join(self.directory, 'asset.order.bin'))
+        codes, years = asset_codes[order], years[order]
+        starts = np.flatnonzero(np.concatenate([[True], (np.diff(codes) != 0) | (np.diff(years) != 0)]))
+        counts = np.diff(np.append(starts, len(order)))
+        asset_groups = [[code, year if year >= 0 else None, count] for code, year, count in
+                        zip(codes[starts].tolist(), years[starts].tolist(), counts.tolist())]
+
+        meta = {
+            'version': STORE_VERSION,
+            'source_hash': self.source_hash,
+            'rows': self.rows,
+            'trades': self.trades,
+            # '5' and '05' are one user once typed
+            'total_users': len(set(typed_ids(list(self.user_ids)))),
+            'total_accounts': len(set(typed_ids(list(self.account_ids)))),
+            'tradehash_dtype': 'int64' if self.integer_tradehash and self.trades else 'str',
+            'dictionaries': {column: typed_ids(list(values)) if column in TEXT_COLUMNS else list(values)
+                             for column, values in self.dictionaries.items()},
+            'asset_groups': asset_groups
+        }
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.directory, self.path)
+
+    def _first_entry_times(self):
+        offsets = np.fromfile(os.path.join(self.directory, 'entry_datetimes.offsets.bin'), dtype=np.int64)
+        values = np.fromfile(os.path.join(self.directory, 'entry_datetimes.values.bin'), dtype=np.float64)
+        result = np.full(len(offsets) - 1, np.nan)
+        present = offsets[1:] > offsets[:-1]
+        result[present] = values[offsets[:-1][present]]
+        return result
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def is_trade_store(path):
+    return isinstance(path, (str, os.PathLike)) and os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+class TradeStore:
+    """A columnar trade store opened as memory-mapped arrays.
+
+    Offers the keys/load interface of the other trade sets: trades are
+    grouped by normalize(asset, entry year), and loading a group reads only
+    the pages of the columns matching needs for that group's rows. The mappings are read
+    only, so every process opening the same store shares the page cache.
+    """
+
+    def __init__(self, path, normalize=lambda asset, year: asset):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f"Trade store '{path}' has version {meta['version']}, "
+                             f"expected {STORE_VERSION}; ingest the CSV again")
+        self.meta = meta
+        self.source_hash = meta['source_hash']
+        self.rows = meta['rows']
+        self.total_users = meta['total_users']
+        self.total_accounts = meta['total_accounts']
+        self.dictionaries = {column: np.array(values, dtype=object)
+                             for column, values in meta['dictionaries'].items()}
+        self.arrays = {}
+
+        # Slices of (asset, entry year) grouped under the key they are matched in
+        assets = meta['dictionaries']['asset']
+        start = 0
+        self.slices = {}
+        self.sizes = {}
+        for code, year, count in meta['asset_groups']:
+            key = normalize(assets[code], year)
+            self.slices.setdefault(key, []).append((start, start + count))
+            self.sizes[key] = self.sizes.get(key, 0) + count
+            start += count
+
+    def _array(self, name, dtype):
+        array = self.arrays.get(name)
+        if array is None:
+            path = os.path.join(self.path, f'{name}.bin')
+            array = np.memmap(path, dtype=dtype, mode='r') if os.path.getsize(path) else np.empty(0, dtype)
+            self.arrays[name] = array
+        return array
+
+    def keys(self):
+        return sorted(self.sizes)
+
+    def _first(self, column, rows):
+        """First element of the list column in each row (NaN for empty lists)"""
+        offsets = self._array(f'{column}.offsets', np.int64)
+        starts = offsets[rows]
+        present = offsets[rows + 1] > starts
+        result = np.full(len(rows), np.nan)
+        result[present] = self._array(f'{column}.values', np.float64)[starts[present]]
+        return result
+
+    def _tradehash(self, rows):
+        offsets = self._array('tradehash.offsets', np.int64)
+        # Slicing the raw mapping is much cheaper per row than slicing a memmap
+        values = memoryview(self._array('tradehash.values', np.uint8))
+        texts = [str(values[start:end], 'utf-8')
+                 for start, end in zip(offsets[rows].tolist(), offsets[rows + 1].tolist())]
+        if self.meta['tradehash_dtype'] == 'int64':
+            return np.array(texts, dtype=np.int64)
+        return np.array(texts, dtype=object)
+
+    def load(self, key):
+        """Prepared trades of one group, in input order, with the columns matching uses"""
+        order = self._array('asset.order', np.int64)
+        rows = np.sort(np.concatenate([order[start:end] for start, end in self.slices[key]]))
+        columns = {
+            'tradehash': self._tradehash(rows),
+            'short_long': self._decode('short_long', rows),
+            'normalized_asset': np.full(len(rows), key, dtype=object),
+            'entry_time': self._first('entry_datetimes', rows),
+            'close_time': self._first('close_datetimes', rows)
+        }
+        for column in ('avg_market_entry', 'avg_market_close', 'net_profit'):
+            columns[column] = np.asarray(self._array(column, np.float64)[rows])
+        columns['user_id'] = self._decode('user_id', rows)
+        columns['account_id'] = self._decode('account_id', rows)
+        columns['total_contracts'] = np.asarray(self._array('total_contracts', np.float64)[rows])
+        return pd.DataFrame(columns, index=rows)
+
+    def _decode(self, column, rows):
+        return self.dictionaries[column][self._array(f'{column}.codes', np.int32)[rows]]
+
+    def describe(self):
+        return {
+            'source_hash': self.source_hash,
+            'rows': self.rows,
+            'trades': self.meta['trades'],
+            'total_users': self.total_users,
+            'total_accounts': self.total_accounts,
+            'assets': dict(sorted(self.sizes.items()))
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert trade CSVs into columnar trade stores')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='convert a trade CSV into a trade store')
+    ingest.add_argument('csv')
+    ingest.add_argument('--name', help='store name (default: the CSV file name without extension)')
+    ingest.add_argument('--stores-dir', default=os.environ.get(
+        'HEDGE_STORES_DIR', os.path.join(tempfile.gettempdir(), 'hedge-stores')
+    ))
+    ingest.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+
+    describe = commands.add_parser('describe', help='print the contents of a trade store')
+    describe.add_argument('path')
+
+    args = parser.parse_args(argv)
+
+    # The detection core imports this module, so it is only loaded here
+    from detection import ingest_trade_store, open_trade_store
+
+    if args.command == 'ingest':
+        name = args.name or os.path.splitext(os.path.basename(args.csv))[0]
+        if not STORE_NAME_PATTERN.match(name):
+            parser.error(f"invalid store name '{name}'")
+        store = ingest_trade_store(args.csv, os.path.join(args.stores_dir, name), args.chunksize)
+    else:
+        store = open_trade_store(args.path)
+    json.dump({'name': os.path.basename(store.path), 'path': store.path, **store.describe()}, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
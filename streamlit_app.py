@@ -1,77 +1,69 @@
+import io
+import os
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+
+from detection import run_analysis
 
 st.set_page_config(page_title="Hedge Detection", layout="wide")
 st.title("🔍 Hedge Trade Detection & Analysis")
 
+
+@st.cache_data(max_entries=8, show_spinner="Detecting hedge pairs...")
+def analyze(data, price_threshold, confidence_threshold, include_close_price):
+    """Run the shared detection core once per upload and parameter set"""
+    result = run_analysis(io.BytesIO(data), price_threshold, confidence_threshold, include_close_price,
+                          workers=int(os.environ.get('HEDGE_WORKERS', 0)))
+    return (pairs_frame(result['hedge_pairs']), result['summary_stats'], result['notable_patterns'],
+            pd.DataFrame(result['hedge_clusters']))
+
+
+def pairs_frame(hedge_pairs):
+    """Flatten hedge pair dicts into one row per pair"""
+    return pd.DataFrame({
+        'id': [pair['id'] for pair in hedge_pairs],
+        'type': [pair['type'] for pair in hedge_pairs],
+        'asset': [pair['asset'] for pair in hedge_pairs],
+        'confidence': [pair['confidence'] for pair in hedge_pairs],
+        'net_profit': [pair['net_profit'] for pair in hedge_pairs],
+        'user_1': [pair['trade1']['user_id'] for pair in hedge_pairs],
+        'user_2': [pair['trade2']['user_id'] for pair in hedge_pairs],
+        'account_1': [pair['trade1']['account_id'] for pair in hedge_pairs],
+        'account_2': [pair['trade2']['account_id'] for pair in hedge_pairs],
+        'direction_1': [pair['trade1']['direction'] for pair in hedge_pairs],
+        'direction_2': [pair['trade2']['direction'] for pair in hedge_pairs],
+        'entry_1': [pair['trade1']['entry_price'] for pair in hedge_pairs],
+        'entry_2': [pair['trade2']['entry_price'] for pair in hedge_pairs],
+        'open_1': [pair['trade1']['entry_time'] for pair in hedge_pairs],
+        'open_2': [pair['trade2']['entry_time'] for pair in hedge_pairs],
+        'close_1': [pair['trade1']['close_time'] for pair in hedge_pairs],
+        'close_2': [pair['trade2']['close_time'] for pair in hedge_pairs],
+        'profit_1': [pair['trade1']['net_profit'] for pair in hedge_pairs],
+        'profit_2': [pair['trade2']['net_profit'] for pair in hedge_pairs],
+    })
+
+
+# Detection parameters
+price_threshold = st.sidebar.number_input("Price threshold", min_value=0.01, value=5.0, step=0.25)
+confidence_threshold = st.sidebar.slider("Confidence threshold", 0.0, 1.0, 0.7, 0.05)
+include_close_price = st.sidebar.checkbox("Include close price in scoring", value=True)
+
 # Upload file
 uploaded_file = st.file_uploader("Upload CSV Trade Dataset", type=["csv"])
 
 if uploaded_file is not None:
     try:
-        df = pd.read_csv(uploaded_file, low_memory=False)
-
-        # Normalize column names
-        df.columns = df.columns.str.strip().str.lower()
-
-        # Parse datetime columns
-        df['open_datetime'] = pd.to_datetime(df['open_datetime'], errors='coerce')
-        df['close_datetime'] = pd.to_datetime(df['close_datetime'], errors='coerce')
-
-        # Drop rows with invalid datetime parsing
-        df = df.dropna(subset=['open_datetime', 'close_datetime'])
-
-        # Normalize asset types (e.g. MNQH5 → NQH5)
-        def normalize_asset(asset):
-            if isinstance(asset, str) and asset.startswith("MNQ"):
-                return "NQ" + asset[3:]
-            return asset
-
-        df['normalized_asset'] = df['asset'].apply(normalize_asset)
-
-        # Prepare candidate trades to compare
-        hedges = []
-        grouped = df.groupby('normalized_asset')
-
-        for asset, group in grouped:
-            group = group.sort_values('open_datetime')
-            for i, trade in group.iterrows():
-                for j, candidate in group.iterrows():
-                    if trade['account_id'] == candidate['account_id']:
-                        continue  # same account
-                    if abs(trade['avg_market_entry'] - candidate['avg_market_entry']) > 5:
-                        continue  # entry price difference too large
-                    if trade['short_long'] == candidate['short_long']:
-                        continue  # same direction, not a hedge
-                    if candidate['open_datetime'] > trade['close_datetime']:
-                        continue  # no overlap
-                    if candidate['close_datetime'] < trade['open_datetime']:
-                        continue  # no overlap
-                    hedges.append({
-                        'account_1': trade['account_id'],
-                        'account_2': candidate['account_id'],
-                        'user_1': trade['user_id'],
-                        'user_2': candidate['user_id'],
-                        'asset': asset,
-                        'entry_1': trade['avg_market_entry'],
-                        'entry_2': candidate['avg_market_entry'],
-                        'open_1': trade['open_datetime'],
-                        'open_2': candidate['open_datetime'],
-                        'close_1': trade['close_datetime'],
-                        'close_2': candidate['close_datetime'],
-                        'direction_1': trade['short_long'],
-                        'direction_2': candidate['short_long'],
-                        'profit_1': trade['market_profit'],
-                        'profit_2': candidate['market_profit'],
-                    })
-
-        hedge_df = pd.DataFrame(hedges)
+        hedge_df, summary_stats, notable_patterns, clusters_df = analyze(
+            uploaded_file.getvalue(), price_threshold, confidence_threshold, include_close_price
+        )
 
         st.subheader("🔗 Potential Hedge Trades")
         st.write(f"Total Hedge Pairs Detected: {len(hedge_df)}")
-        st.dataframe(hedge_df)
+
+        hedge_types = st.multiselect("Hedge types", ['self_hedge', 'inter_user_hedge'],
+                                     default=['self_hedge', 'inter_user_hedge'])
+        st.dataframe(hedge_df[hedge_df['type'].isin(hedge_types)] if not hedge_df.empty else hedge_df)
 
         st.subheader("📊 Summary Statistics")
         if not hedge_df.empty:
@@ -84,17 +76,34 @@ if uploaded_file is not None:
             st.write("**Accounts Involved in Hedging**")
             st.dataframe(account_hedge_stats)
 
-            unique_users = set(hedge_df['user_1']).union(set(hedge_df['user_2']))
-            hedge_user_percentage = (len(unique_users) / df['user_id'].nunique()) * 100
-            hedge_account_percentage = (len(set(hedge_df['account_1']).union(set(hedge_df['account_2']))) / df['account_id'].nunique()) * 100
+            st.metric(label="% of Users Involved in Hedging", value=f"{summary_stats['users_percentage']:.2f}%")
+            st.metric(label="% of Accounts Involved in Hedging",
+                      value=f"{summary_stats['accounts_percentage']:.2f}%")
+            st.metric(label="Average Confidence", value=f"{summary_stats['avg_confidence']:.2f}")
+
+            st.write("**Hedge Pairs by Asset**")
+            st.dataframe(pd.DataFrame(notable_patterns['asset_distribution']))
+
+            st.subheader("🔁 Repeat Patterns")
+            st.write("**Same Hour on Several Days**")
+            st.dataframe(pd.DataFrame(notable_patterns['repeat_hours']))
+
+            st.write("**Recurring Price Ranges**")
+            st.dataframe(pd.DataFrame(notable_patterns['price_bands']))
+
+            st.write("**Accounts with Multiple Hedge Pairs**")
+            st.dataframe(pd.DataFrame(notable_patterns['frequent_accounts']))
 
-            st.metric(label="% of Users Involved in Hedging", value=f"{hedge_user_percentage:.2f}%")
-            st.metric(label="% of Accounts Involved in Hedging", value=f"{hedge_account_percentage:.2f}%")
+            st.subheader("🕸️ Hedge Clusters")
+            st.write("Users and accounts joined by repeated hedges, most profitable first")
+            st.dataframe(clusters_df)
         else:
             st.warning("No hedging activity detected with current parameters.")
 
     except pd.errors.EmptyDataError:
         st.error("❌ The uploaded file is empty or malformed. Please upload a valid CSV.")
+    except ValueError as e:
+        st.error(f"❌ {e}")
     except Exception as e:
         st.error(f"❌ An unexpected error occurred: {e}")
 else:
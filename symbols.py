@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Futures month codes, January to December
+MONTH_CODES = 'FGHJKMNQUVXZ'
+
+# Contract roots mapped to their canonical root. Mini and micro contracts
+# trade the same underlying as their full-size root
+DEFAULT_ROOT_EQUIVALENCE = {
+    'NQ': 'NQ',
+    'MNQ': 'NQ',
+    'ES': 'ES',
+    'MES': 'ES',
+    'YM': 'YM',
+    'MYM': 'YM',
+    'RTY': 'RTY',
+    'M2K': 'RTY',
+    'CL': 'CL',
+    'QM': 'CL',
+    'MCL': 'CL',
+    'GC': 'GC',
+    'MGC': 'GC',
+    'SI': 'SI',
+    'SIL': 'SI'
+}
+
+# Part of the fingerprint; bump when the same settings start normalizing differently
+NORMALIZATION_VERSION = 2
+
+_EXPIRY = rf'(?P<month>[{MONTH_CODES}])(?P<year>\d{{4}}|\d{{1,2}})'
+_GENERIC_PATTERN = re.compile(rf'^(?P<root>[A-Z0-9][A-Z0-9]{{0,3}}?){_EXPIRY}$')
+
+
+class ContractSymbol(NamedTuple):
+    """A futures symbol parsed into its parts; month and year are None
+    when the symbol carries no expiry, and year alone is None when a short
+    year could not be resolved for want of a trade date"""
+    symbol: str
+    root: str
+    canonical_root: str
+    month: Optional[int]
+    year: Optional[int]
+
+    def key(self, match_expiry=True):
+        """Name of the asset group trades of this contract are matched in"""
+        if match_expiry and self.month is not None:
+            month = MONTH_CODES[self.month - 1]
+            if self.year is None:
+                return f'{self.canonical_root}{month}'
+            return f'{self.canonical_root}{month}{self.year % 100:02d}'
+        return self.canonical_root
+
+
+def _full_year(digits, reference_year=None):
+    """Expand a 1, 2 or 4 digit contract year to the matching year closest to
+    reference_year, the year the trade was entered. Short years without a
+    reference year stay unresolved (None)."""
+    year = int(digits)
+    if len(digits) == 4:
+        return year
+    if reference_year is None:
+        return None
+    period = 10 ** len(digits)
+    base = reference_year - reference_year % period + year
+    return min((base - period, base, base + period), key=lambda y: abs(y - reference_year))
+
+
+def entry_years(entry_time):
+    """UTC calendar year of epoch-millisecond entry times, -1 where missing"""
+    times = pd.to_datetime(pd.Series(entry_time, dtype=float), unit='ms', utc=True, errors='coerce')
+    return times.dt.year.fillna(-1).to_numpy(dtype=np.int64)
+
+
+class SymbolNormalizer:
+    """Map raw asset symbols to matching groups through a root-equivalence table.
+
+    Symbols are parsed once per distinct symbol and trade year and memoized,
+    so normalizing a column costs one parse per distinct pair. With
+    match_expiry, contracts of the same canonical root but different expiries
+    are kept apart. One and two digit years ('NQM5', 'ESZ24') are resolved
+    against the year each trade was entered, never the date of the analysis,
+    so a file always normalizes the same way.
+    """
+
+    def __init__(self, equivalence=None, match_expiry=True):
+        self.equivalence = dict(DEFAULT_ROOT_EQUIVALENCE if equivalence is None else equivalence)
+        self.match_expiry = match_expiry
+        roots = '|'.join(sorted(map(re.escape, self.equivalence), key=len, reverse=True))
+        self._known = re.compile(rf'^(?P<root>{roots})(?:{_EXPIRY})?$')
+        self._parsed = {}
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Normalizer configured by HEDGE_ROOT_EQUIVALENCE and HEDGE_MATCH_EXPIRY
+
+        HEDGE_ROOT_EQUIVALENCE names a JSON file mapping roots to a canonical
+        root; entries extend the defaults.
+        """
+        equivalence = dict(DEFAULT_ROOT_EQUIVALENCE)
+        path = environ.get('HEDGE_ROOT_EQUIVALENCE')
+        if path:
+            with open(path) as f:
+                for root, canonical in json.load(f).items():
+                    equivalence[root.upper()] = canonical.upper()
+        match_expiry = environ.get('HEDGE_MATCH_EXPIRY', 'true').lower() == 'true'
+        return cls(equivalence, match_expiry)
+
+    @property
+    def fingerprint(self):
+        """Short hash of the settings, for keying anything derived from them"""
+        settings = json.dumps([NORMALIZATION_VERSION, sorted(self.equivalence.items()), self.match_expiry])
+        return hashlib.sha256(settings.encode()).hexdigest()[:12]
+
+    def parse(self, symbol, reference_year=None):
+        """Parse a raw symbol such as 'MNQM5', '/ESZ24' or 'CLN2025.NYMEX',
+        resolving short years against reference_year"""
+        parsed = self._parsed.get((symbol, reference_year))
+        if parsed is None:
+            parsed = self._parsed[symbol, reference_year] = self._parse(symbol, reference_year)
+        return parsed
+
+    def _parse(self, symbol, reference_year):
+        tokens = [token for token in re.split(r'[^A-Z0-9]+', str(symbol).upper()) if token]
+        for token in tokens:
+            match = self._known.match(token)
+            if match:
+                return self._contract(symbol, match, self.equivalence[match['root']], reference_year)
+        for token in tokens:
+            match = _GENERIC_PATTERN.match(token)
+            if match:
+                return self._contract(symbol, match, match['root'], reference_year)
+        cleaned = ''.join(tokens)
+        return ContractSymbol(symbol, cleaned, cleaned, None, None)
+
+    def _contract(self, symbol, match, canonical, reference_year):
+        month = match['month']
+        return ContractSymbol(
+            symbol, match['root'], canonical,
+            MONTH_CODES.index(month) + 1 if month else None,
+            _full_year(match['year'], reference_year) if month else None
+        )
+
+    def normalize(self, symbol, reference_year=None):
+        """Matching group of one symbol traded in reference_year"""
+        return self.parse(symbol, reference_year).key(self.match_expiry)
+
+    def normalize_column(self, symbols, entry_time=None):
+        """Matching group of every symbol in a column, given each trade's
+        epoch-millisecond entry time, parsing each distinct pair once"""
+        codes, uniques = pd.factorize(pd.Series(symbols).astype(object))
+        if entry_time is None:
+            years = np.full(len(codes), -1, dtype=np.int64)
+        else:
+            years = entry_years(entry_time)
+        # One code per distinct (symbol, year); years fit well below 10000
+        pairs, distinct = pd.factorize(codes.astype(np.int64) * 10000 + (years + 1))
+        keys = []
+        for pair in distinct.tolist():
+            code, year = divmod(pair, 10000)
+            if code < 0:
+                keys.append(None)
+            else:
+                keys.append(self.normalize(uniques[code], year - 1 if year else None))
+        return np.array(keys, dtype=object)[pairs]
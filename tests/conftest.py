@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The application modules live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_trades  # noqa: E402
+from detection import run_analysis  # noqa: E402
+
+ROWS = 3000
+
+
+@pytest.fixture(scope='session')
+def trades():
+    """Synthetic trades with deliberate hedges, as generated for the benchmarks"""
+    return generate_trades(ROWS, seed=7)
+
+
+@pytest.fixture(scope='session')
+def trades_csv(trades, tmp_path_factory):
+    path = tmp_path_factory.mktemp('trades') / 'trades.csv'
+    trades.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def reference(trades_csv):
+    """Analysis of trades_csv by the original nested-loop matcher, which every engine must reproduce"""
+    return run_analysis(trades_csv, 5.0, 0.7, True, engine='reference')
+
@@ -0,0 +1,117 @@
+import math
+import shutil
+import threading
+import time
+
+import pytest
+
+import admission
+import app
+from admission import AdmissionControl, Overloaded, TooLarge
+from jobs import JobManager
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def host(monkeypatch):
+    """A host with 8 GB of memory, the given amount free and an idle CPU"""
+    readings = {'total': 8 * GB, 'available': 4 * GB}
+    monkeypatch.setattr(admission, 'total_memory_bytes', lambda: readings['total'])
+    monkeypatch.setattr(admission, 'available_memory_bytes', lambda: readings['available'])
+    monkeypatch.setattr(admission, 'load_per_cpu', lambda: 0.0)
+    return readings
+
+
+def control(tmp_path, slots=1, queue_timeout=0.3):
+    return AdmissionControl(str(tmp_path / 'slots'), slots, queue_timeout=queue_timeout, min_free_memory=GB)
+
+
+def test_analysis_under_the_budget_is_admitted(host, tmp_path):
+    gate = control(tmp_path)
+    with gate.admit(2 * GB):
+        assert gate.admitted == 1
+    # The slot is free again
+    with gate.admit(2 * GB):
+        assert gate.admitted == 2
+    assert gate.rejected == {}
+
+
+def test_analysis_over_free_memory_is_rejected_after_queueing(host, tmp_path):
+    gate = control(tmp_path)
+    start = time.monotonic()
+    with pytest.raises(Overloaded) as error:
+        with gate.admit(4 * GB):
+            pass
+    assert error.value.reason == 'memory'
+    assert time.monotonic() - start >= gate.queue_timeout
+    assert gate.rejected == {'memory': 1}
+    assert gate.waiting == 0
+
+
+def test_queued_analysis_starts_once_a_slot_is_free(host, tmp_path):
+    gate = control(tmp_path, queue_timeout=5)
+
+    def queued():
+        with gate.admit():
+            pass
+
+    with gate.admit():
+        with pytest.raises(Overloaded) as error:
+            with gate.admit(timeout=0.2):
+                pass
+        assert error.value.reason == 'slots'
+        waiter = threading.Thread(target=queued)
+        waiter.start()
+        time.sleep(0.3)
+        assert gate.waiting == 1
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert gate.admitted == 2
+
+
+def test_analysis_larger_than_the_host_is_refused_without_waiting(host, tmp_path):
+    gate = control(tmp_path)
+    host['total'] = 2 * GB
+    start = time.monotonic()
+    with pytest.raises(TooLarge):
+        with gate.admit(1.5 * GB, timeout=math.inf):
+            pass
+    assert time.monotonic() - start < gate.queue_timeout
+    assert gate.waiting == 0
+
+
+class Upload:
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, destination):
+        shutil.copyfile(self.path, destination)
+
+
+def wait_for(manager, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.status(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'Job {job_id} did not finish')
+
+
+def test_job_the_host_can_never_admit_fails(host, tmp_path, trades_csv, monkeypatch):
+    monkeypatch.setattr(app, 'admission', control(tmp_path))
+    monkeypatch.setattr(app, 'memory_per_upload_byte', 10 * GB)
+    manager = JobManager(str(tmp_path / 'jobs'), app.run_job)
+    job = manager.submit(Upload(trades_csv), app.analysis_params({'chunksize': '1000'}))
+    job = wait_for(manager, job['id'])
+    assert job['status'] == 'failed'
+    assert 'more than' in job['error']
+
+
+def test_job_the_host_can_never_admit_is_refused_on_submission(host, tmp_path, trades_csv, monkeypatch):
+    monkeypatch.setattr(app, 'admission', control(tmp_path))
+    monkeypatch.setattr(app, 'memory_per_upload_byte', 10 * GB)
+    with open(trades_csv, 'rb') as upload:
+        response = app.app.test_client().post('/jobs', data={'file': (upload, 'trades.csv')})
+    assert response.status_code == 413
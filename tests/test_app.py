@@ -0,0 +1,28 @@
+import pytest
+
+import app
+from errors import InvalidInput
+
+
+def test_requests_cannot_ask_for_more_workers_than_the_server(monkeypatch):
+    monkeypatch.setattr(app, 'max_workers', 2)
+    assert app.analysis_params({})['workers'] == 2
+    assert app.analysis_params({'workers': '1'})['workers'] == 1
+    for workers in ('3', '500', '-1'):
+        with pytest.raises(InvalidInput, match='workers'):
+            app.analysis_params({'workers': workers})
+
+
+def test_out_of_range_workers_are_a_bad_request(trades_csv):
+    with open(trades_csv, 'rb') as upload:
+        response = app.app.test_client().post('/analyze', data={
+            'file': (upload, 'trades.csv'), 'workers': str(app.max_workers + 500)
+        })
+    assert response.status_code == 400
+    assert 'workers' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('chunksize', ['-5', str(app.max_chunksize + 1)])
+def test_out_of_range_chunksizes_are_invalid(chunksize):
+    with pytest.raises(InvalidInput, match='chunksize'):
+        app.analysis_params({'chunksize': chunksize})
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import batch
+from benchmark import generate_trades
+from detection import run_analysis
+
+PARAMS = batch.analysis_params(5.0, 0.7, True)
+
+
+def pair_set(hedge_pairs):
+    """Pairs without ids or trade order, which depend on how the days were split"""
+    return sorted((tuple(sorted((pair['trade1']['tradehash'], pair['trade2']['tradehash']))), pair['asset'],
+                   pair['type'], round(pair['confidence'], 9)) for pair in hedge_pairs)
+
+
+def split_days(trades, directory):
+    """Write trades as one CSV per UTC day of their first entry"""
+    first_entry = trades['entry_datetimes'].str.strip('[]').str.split(',').str[0].astype('int64')
+    days = pd.to_datetime(first_entry, unit='ms').dt.strftime('%Y-%m-%d')
+    os.makedirs(directory, exist_ok=True)
+    for day, rows in trades.groupby(days):
+        rows.to_csv(os.path.join(directory, f'{day}.csv'), index=False)
+    return sorted(days.unique())
+
+
+def reference_pairs(trades, path):
+    trades.to_csv(path, index=False)
+    return pair_set(run_analysis(str(path), 5.0, 0.7, True, engine='reference')['hedge_pairs'])
+
+
+def merged(output):
+    with open(os.path.join(output, 'merged', 'summary.json')) as f:
+        summary = json.load(f)
+    return batch.read_pairs(os.path.join(output, 'merged', 'pairs.ndjson')), summary
+
+
+@pytest.fixture(scope='module')
+def daily(tmp_path_factory):
+    # Long trades over a few days, so some positions are held over midnight
+    trades = generate_trades(3000, seed=11, trades_per_day=800, duration=3600.0)
+    directory = tmp_path_factory.mktemp('daily')
+    days = split_days(trades, str(directory / 'inputs'))
+    return trades, directory, days
+
+
+def test_merged_days_equal_reference_analysis(daily):
+    trades, directory, days = daily
+    assert len(days) > 2
+    output = str(directory / 'reports')
+    report = batch.run_batch([str(directory / 'inputs')], output, PARAMS, workers=2, chunksize=500)
+    assert report['days'] == {day: 'processed' for day in days}
+    assert report['crossings'] == len(days) - 1
+
+    hedge_pairs, summary = merged(output)
+    assert pair_set(hedge_pairs) == reference_pairs(trades, directory / 'whole.csv')
+    assert report['total_pairs'] == summary['total_pairs'] == len(hedge_pairs)
+    assert [pair['id'] for pair in hedge_pairs] == list(range(1, len(hedge_pairs) + 1))
+    # Pairs of trades from two days are found by the crossings only
+    crossing = [pair for pair in hedge_pairs if len(pair['days']) == 2]
+    assert crossing
+    assert summary['cross_day_pairs'] == len(crossing)
+
+
+def test_rerun_skips_days_and_changed_day_is_rebuilt(daily):
+    trades, directory, days = daily
+    output = str(directory / 'rerun')
+    inputs = [str(directory / 'inputs')]
+    batch.run_batch(inputs, output, PARAMS, workers=2, chunksize=500)
+    with open(os.path.join(output, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    report = batch.run_batch(inputs, output, PARAMS, workers=2, chunksize=500)
+    assert report['days'] == {day: 'skipped' for day in days}
+    with open(os.path.join(output, 'manifest.json')) as f:
+        assert json.load(f) == manifest
+
+    # Drop the last trades of one day; only it, its crossings and the merged report change
+    changed = directory / 'changed'
+    split_days(trades, str(changed))
+    path = changed / f'{days[1]}.csv'
+    day = pd.read_csv(path, dtype=str)
+    day.iloc[:-50].to_csv(path, index=False)
+    report = batch.run_batch([str(changed)], output, PARAMS, workers=2, chunksize=500)
+    assert report['days'] == {name: 'processed' if name == days[1] else 'skipped' for name in days}
+
+    hedge_pairs, summary = merged(output)
+    remaining = trades[~trades['tradehash'].isin(day['tradehash'].iloc[-50:])]
+    assert pair_set(hedge_pairs) == reference_pairs(remaining, directory / 'remaining.csv')
+    with open(os.path.join(output, 'manifest.json')) as f:
+        rebuilt = json.load(f)
+    for key, entry in manifest['crossings'].items():
+        assert (rebuilt['crossings'][key] == entry) == (days[1] not in key)
+
+
+def test_other_params_rebuild_every_day(daily):
+    trades, directory, days = daily
+    output = str(directory / 'params')
+    inputs = [str(directory / 'inputs')]
+    batch.run_batch(inputs, output, PARAMS, workers=2, chunksize=500)
+    report = batch.run_batch(inputs, output, batch.analysis_params(2.0, 0.7, True), workers=2, chunksize=500)
+    assert report['days'] == {day: 'processed' for day in days}
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from benchmark import (DAY_MS, STAGES, START_TIME, compare_reports, generate_trades, parse_asset_mix,
+                       run_pipeline)
+from detection import REQUIRED_COLUMNS, prepare_trades
+
+
+def test_generated_trades_are_seeded_and_in_the_input_schema():
+    trades = generate_trades(2000, seed=3)
+    pd.testing.assert_frame_equal(trades, generate_trades(2000, seed=3))
+    assert not trades.equals(generate_trades(2000, seed=4))
+    assert len(trades) == 2000
+    assert set(REQUIRED_COLUMNS) <= set(trades.columns)
+    assert trades['tradehash'].is_unique
+    assert len(prepare_trades(trades)) == 2000
+
+
+def test_generator_parameters_shape_the_trades():
+    trades = generate_trades(4000, seed=1, asset_mix={'ES': 1.0}, trades_per_day=1000)
+    assert set(trades['asset']) == {'ESM5'}
+    entry = prepare_trades(trades)['entry_time']
+    assert entry.min() >= START_TIME
+    # 4000 trades at 1000 a day span four days
+    assert 3 * DAY_MS < entry.max() - START_TIME <= 4 * DAY_MS
+
+
+def test_hedge_density_sets_how_many_pairs_are_found(tmp_path):
+    found = []
+    for density in (0.0, 0.3):
+        path = tmp_path / f'{density}.csv'
+        # Sparse trading, so few pairs happen by chance
+        generate_trades(3000, seed=2, hedge_density=density, trades_per_day=200).to_csv(path, index=False)
+        found.append(run_pipeline(str(path))['pairs'])
+    assert found[1] > 3 * found[0]
+
+
+def test_pipeline_report_times_every_stage(trades_csv, reference):
+    report = run_pipeline(trades_csv)
+    assert list(report['stages']) == STAGES
+    assert report['rows'] == 3000
+    assert report['pairs'] == len(reference['hedge_pairs'])
+    assert report['candidates'] >= report['pairs']
+    assert all(stage['seconds'] >= 0 and stage['rows_in'] >= 0 for stage in report['stages'].values())
+
+
+def test_asset_mix_text_is_parsed_into_weights():
+    assert parse_asset_mix('nq=0.5, ES=0.5') == {'NQ': 0.5, 'ES': 0.5}
+    with pytest.raises(ValueError, match='Unknown asset'):
+        parse_asset_mix('BTC=1')
+
+
+def test_comparison_flags_stages_that_slowed_down():
+    def report(seconds):
+        return {'results': [{'rows': 1000, 'stages': {stage: {'seconds': seconds.get(stage, 1.0)}
+                                                      for stage in STAGES}}]}
+
+    comparison = compare_reports(report({}), report({'matching': 1.5, 'scoring': 1.1}), tolerance=0.2)
+    assert len(comparison) == len(STAGES)
+    assert [row['stage'] for row in comparison if row['regression']] == ['matching']
+    assert compare_reports(report({}), {'results': [{'rows': 5, 'stages': {}}]}) == []
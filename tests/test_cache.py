@@ -0,0 +1,51 @@
+import pytest
+
+from cache import AnalysisCache, DiskCache, MemoryCache, hash_source
+from detection import load_trade_set, run_analysis, symbol_normalizer
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return AnalysisCache(MemoryCache(1 << 30))
+    return AnalysisCache(DiskCache(str(tmp_path / 'cache'), 1 << 30))
+
+
+def test_cached_analyses_equal_reference_analysis(trades_csv, reference, cache):
+    assert run_analysis(trades_csv, 5.0, 0.7, True, cache=cache) == reference
+    assert run_analysis(trades_csv, 5.0, 0.7, True, cache=cache) == reference
+    stats = cache.stats.as_dict()
+    assert stats['trades'] == {'hits': 1, 'misses': 1}
+    assert stats['candidates']['hits'] > 0
+
+
+def test_rescoring_cached_candidates_equals_fresh_analysis(trades_csv, cache):
+    run_analysis(trades_csv, 5.0, 0.7, True, cache=cache)
+    for confidence_threshold, include_close_price in ((0.9, True), (0.5, False)):
+        expected = run_analysis(trades_csv, 5.0, confidence_threshold, include_close_price, engine='reference')
+        assert run_analysis(trades_csv, 5.0, confidence_threshold, include_close_price, cache=cache) == expected
+
+
+def test_trades_evicted_during_an_analysis_are_prepared_again(trades_csv, reference, tmp_path):
+    # A cache that just holds the prepared trades, so the candidates stored
+    # while matching evict trade groups the analysis has not loaded yet
+    file_hash = f'{hash_source(trades_csv)}:{symbol_normalizer.fingerprint}'
+    trades = load_trade_set(trades_csv, str(tmp_path))
+    sizing = AnalysisCache(MemoryCache(1 << 30))
+    sizing.put_trades(file_hash, trades)
+    cache = AnalysisCache(MemoryCache(sizing.backend.bytes + 1024))
+    assert cache.put_trades(file_hash, trades)
+
+    assert run_analysis(trades_csv, 5.0, 0.7, True, cache=cache) == reference
+    assert cache.stats.as_dict()['trades'] == {'hits': 1, 'misses': 0}
+    assert not all(cache.trades_key(file_hash, key) in cache.backend for key in trades.keys())
+
+
+def test_memory_cache_membership_refreshes_recency():
+    cache = MemoryCache(1 << 20)
+    cache.put('a', b'x' * 1000)
+    cache.put('b', b'x' * 1000)
+    assert 'a' in cache
+    cache.max_bytes = cache.bytes
+    cache.put('c', b'x' * 1000)
+    assert 'a' in cache and 'b' not in cache
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from detection import find_hedge_pairs_chunked, run_analysis
+
+
+@pytest.mark.parametrize('chunksize', [250, 1000, 10_000])
+def test_chunked_analysis_equals_reference_analysis(trades_csv, reference, chunksize):
+    assert run_analysis(trades_csv, 5.0, 0.7, True, chunksize=chunksize) == reference
+
+
+def test_chunked_analysis_of_an_open_upload(trades_csv, reference):
+    with open(trades_csv, 'rb') as upload:
+        assert run_analysis(upload, 5.0, 0.7, True, chunksize=300) == reference
+
+
+def test_spilled_partitions_are_removed(trades, trades_csv, reference, tmp_path):
+    hedge_pairs, partitions = find_hedge_pairs_chunked(trades_csv, 5.0, 0.7, True, chunksize=500,
+                                                       spill_dir=tmp_path)
+    assert hedge_pairs == reference['hedge_pairs']
+    assert partitions.rows == len(trades)
+    assert os.listdir(tmp_path) == []
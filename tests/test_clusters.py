@@ -0,0 +1,90 @@
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+import pytest
+
+from clusters import CLUSTER_MEMBER_LIMIT, connected_components, hedge_clusters
+from patterns import PairColumns
+
+
+def bfs_components(n, edges):
+    """Smallest node of each node's component, by breadth-first search"""
+    neighbours = defaultdict(list)
+    for a, b in edges:
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+    label = [None] * n
+    for start in range(n):
+        if label[start] is not None:
+            continue
+        label[start] = start
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for other in neighbours[node]:
+                if label[other] is None:
+                    label[other] = start
+                    queue.append(other)
+    return label
+
+
+def members(values, count):
+    """Sorted members, or only how many there are when a cluster lists just a part of them"""
+    return tuple(sorted(values)) if count <= CLUSTER_MEMBER_LIMIT else count
+
+
+def baseline_clusters(hedge_pairs, min_pairs):
+    """Clusters as (users, accounts, pairs, net_profit), grouping the pair dicts one at a time"""
+    links = Counter(frozenset((pair['trade1']['account_id'], pair['trade2']['account_id']))
+                    for pair in hedge_pairs)
+    kept = [pair for pair in hedge_pairs
+            if links[frozenset((pair['trade1']['account_id'], pair['trade2']['account_id']))] >= min_pairs]
+    nodes = {}
+    edges = []
+    for pair in kept:
+        trade1, trade2 = pair['trade1'], pair['trade2']
+        ids = [nodes.setdefault(node, len(nodes)) for node in (
+            ('user', trade1['user_id']), ('account', trade1['account_id']),
+            ('user', trade2['user_id']), ('account', trade2['account_id']))]
+        edges += [(ids[0], ids[1]), (ids[2], ids[3]), (ids[1], ids[3])]
+    label = bfs_components(len(nodes), edges)
+
+    clusters = defaultdict(lambda: [set(), set(), 0, 0.0])
+    for pair in kept:
+        cluster = clusters[label[nodes[('account', pair['trade1']['account_id'])]]]
+        for trade in (pair['trade1'], pair['trade2']):
+            cluster[0].add(trade['user_id'])
+            cluster[1].add(trade['account_id'])
+        cluster[2] += 1
+        cluster[3] += pair['net_profit']
+    return sorted((members(users, len(users)), members(accounts, len(accounts)), count, round(profit, 6))
+                  for users, accounts, count, profit in clusters.values())
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_components_equal_breadth_first_search(seed):
+    rng = np.random.default_rng(seed)
+    n = 300
+    u, v = rng.integers(0, n, 250), rng.integers(0, n, 250)
+    assert connected_components(n, u, v).tolist() == bfs_components(n, zip(u.tolist(), v.tolist()))
+
+
+def test_long_chains_are_joined():
+    # Edges listed from the far end take several hooking rounds
+    n = 1000
+    u = np.arange(n - 1)[::-1]
+    assert connected_components(n, u, u + 1).tolist() == [0] * n
+    assert connected_components(0, u[:0], u[:0]).tolist() == []
+
+
+@pytest.mark.parametrize('min_pairs', [1, 2, 3])
+def test_clusters_equal_baseline_of_reference_pairs(reference, min_pairs):
+    hedge_pairs = reference['hedge_pairs']
+    clusters = hedge_clusters(PairColumns(hedge_pairs), min_pairs, limit=len(hedge_pairs))
+    assert sorted((members(cluster['users'], cluster['user_count']),
+                   members(cluster['accounts'], cluster['account_count']),
+                   cluster['pair_count'], round(cluster['net_profit'], 6)) for cluster in clusters) \
+        == baseline_clusters(hedge_pairs, min_pairs)
+    assert [cluster['rank'] for cluster in clusters] == list(range(1, len(clusters) + 1))
+    ranking = [(-cluster['net_profit'], -cluster['pair_count']) for cluster in clusters]
+    assert ranking == sorted(ranking)
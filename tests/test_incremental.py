@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from detection import prepare_trades
+from incremental import IncrementalDetector
+
+
+def pair_set(hedge_pairs):
+    """Pairs without ids or trade order, which depend on how trades arrived"""
+    return sorted((tuple(sorted((pair['trade1']['tradehash'], pair['trade2']['tradehash']))), pair['asset'],
+                   pair['type'], round(pair['confidence'], 9), round(pair['entry_price_diff'], 9))
+                  for pair in hedge_pairs)
+
+
+@pytest.fixture(scope='module')
+def reference_pairs(reference):
+    return pair_set(reference['hedge_pairs'])
+
+
+@pytest.fixture(scope='module')
+def prepared(trades):
+    # A feed delivers trades in entry time order
+    return prepare_trades(trades.copy()).sort_values('entry_time', kind='stable')
+
+
+def feed(detector, prepared, batches):
+    hedge_pairs = []
+    for batch in np.array_split(np.arange(len(prepared)), batches):
+        hedge_pairs.extend(detector.add_batch(prepared.iloc[batch]))
+    return hedge_pairs
+
+
+@pytest.mark.parametrize('batches', [1, 7, 60])
+def test_batches_find_the_reference_pairs(prepared, reference_pairs, batches):
+    detector = IncrementalDetector(5.0, 0.7, True, allowed_lateness=0)
+    hedge_pairs = feed(detector, prepared, batches)
+    assert pair_set(hedge_pairs) == reference_pairs
+    assert [pair['id'] for pair in hedge_pairs] == list(range(1, len(hedge_pairs) + 1))
+    if batches > 1:
+        # Trades that closed behind the watermark were dropped along the way
+        assert detector.evicted > 0
+        assert detector.live_trades < len(prepared)
+    assert detector.late_trades == 0
+
+
+def test_restored_checkpoint_continues_the_stream(prepared, reference_pairs, tmp_path):
+    half = len(prepared) // 2
+    detector = IncrementalDetector(5.0, 0.7, True, allowed_lateness=0)
+    hedge_pairs = detector.add_batch(prepared.iloc[:half])
+    detector.checkpoint(str(tmp_path / 'stream.pkl'))
+    restored = IncrementalDetector.restore(str(tmp_path / 'stream.pkl'))
+    hedge_pairs += restored.add_batch(prepared.iloc[half:])
+    assert pair_set(hedge_pairs) == reference_pairs
+    assert restored.status()['pairs'] == len(hedge_pairs)
+
+
+def test_trades_entering_behind_the_watermark_are_late(prepared):
+    detector = IncrementalDetector(5.0, 0.7, True)
+    rows = prepared.iloc[:100]
+    detector.add_batch(rows, watermark=rows['entry_time'].max())
+    # Still open at the watermark, but it entered before it
+    late = rows.iloc[[0]].assign(tradehash='late', close_time=rows['entry_time'].max() + 1)
+    detector.add_batch(pd.DataFrame(late))
+    assert detector.late_trades == 1
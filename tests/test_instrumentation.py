@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+import app
+import instrumentation
+from admission import AdmissionControl
+from detection import run_analysis
+from instrumentation import Metrics, StageCall, Timings, child_cpu, count, instrument, stage, timed_stage
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'metrics', Metrics())
+    return instrumentation.metrics
+
+
+def test_stages_outside_a_run_do_nothing():
+    with stage('read_csv', rows_in=5) as call:
+        call.rows_out = 3
+    count('candidates', 10)
+    child_cpu(1.0)
+    assert instrumentation.current_timings() is None
+
+
+def test_stages_record_calls_rows_and_counters(fresh_metrics):
+    @timed_stage('double')
+    def double(values):
+        return values * 2
+
+    with instrument('test') as timings:
+        double([1, 2])
+        double([3])
+        with stage('sum', rows_in=6) as call:
+            call.rows_out = 1
+        count('candidates', 4)
+        count('candidates', 2)
+        child_cpu(0.5)
+
+    record = timings.as_dict()
+    assert record['status'] == 'ok'
+    assert {name: (s['calls'], s['rows_in'], s['rows_out']) for name, s in record['stages'].items()} \
+        == {'double': (2, 3, 6), 'sum': (1, 6, 1)}
+    assert record['counters'] == {'candidates': 6}
+    # CPU time of worker processes counts towards the run
+    assert record['cpu_seconds'] >= 0.5
+    assert fresh_metrics.runs == {('test', 'ok'): 1}
+    assert fresh_metrics.stage_calls == {'double': 2, 'sum': 1}
+
+
+def test_failed_run_names_its_stage(fresh_metrics):
+    with pytest.raises(ValueError):
+        with instrument('test') as timings:
+            with stage('prepare'):
+                raise ValueError('bad row')
+    assert (timings.status, timings.failed_stage) == ('error', 'prepare')
+    assert timings.as_dict()['failed_stage'] == 'prepare'
+    assert fresh_metrics.runs == {('test', 'error'): 1}
+
+
+def test_analysis_stages_are_timed(trades_csv, reference):
+    with instrument('analyze') as timings:
+        run_analysis(trades_csv, 5.0, 0.7, True, workers=2)
+    stages = timings.as_dict()['stages']
+    assert {'read_csv', 'prepare', 'matching', 'scoring', 'summary_stats', 'notable_patterns'} <= set(stages)
+    assert stages['prepare']['rows_in'] == 3000
+    assert timings.counters['candidates_accepted'] == len(reference['hedge_pairs'])
+    # Matching ran in worker processes, whose CPU time is added
+    assert timings.child_cpu_seconds > 0
+
+
+def test_metrics_of_every_process_are_added_up(tmp_path):
+    # Each Metrics writes a file of its own, as every gunicorn worker does
+    first, second = Metrics(str(tmp_path)), Metrics(str(tmp_path))
+    for metrics, runs in ((first, 2), (second, 3)):
+        for _ in range(runs):
+            timings = Timings('analyze')
+            timings.record('matching', StageCall(100), 0.01, 0.01, 0)
+            timings.count('candidates', 10)
+            metrics.observe(timings)
+
+    assert len(os.listdir(tmp_path)) == 2
+    text = Metrics(str(tmp_path)).render()
+    assert 'hedge_runs_total{kind="analyze",status="ok"} 5' in text
+    assert 'hedge_stage_calls_total{stage="matching"} 5' in text
+    assert 'hedge_stage_rows_total{stage="matching",direction="in"} 500' in text
+    assert 'hedge_pipeline_events_total{event="candidates"} 50' in text
+    assert f'hedge_process_peak_rss_bytes{{pid="{os.getpid()}"}}' in text
+
+
+def test_analyze_reports_timings_and_serves_metrics(trades_csv, tmp_path, monkeypatch, fresh_metrics):
+    monkeypatch.setattr(app, 'admission', AdmissionControl(str(tmp_path), 1, min_free_memory=0, max_load=0))
+    monkeypatch.setattr(app, 'metrics', fresh_metrics)
+    client = app.app.test_client()
+    with open(trades_csv, 'rb') as upload:
+        response = client.post('/analyze', data={'file': (upload, 'trades.csv'), 'timings': 'true',
+                                                 'cache': 'false'})
+    timings = response.get_json()['timings']
+    assert timings['kind'] == 'analyze'
+    assert {'read_csv', 'matching', 'scoring'} <= set(timings['stages'])
+
+    # Failures carry the request id and stage to find them in the logs
+    (tmp_path / 'bad.csv').write_text('tradehash,asset\n1,ESM5\n')
+    with open(tmp_path / 'bad.csv', 'rb') as upload:
+        response = client.post('/analyze', data={'file': (upload, 'bad.csv')})
+    error = response.get_json()
+    assert response.status_code == 400
+    assert error['type'] == 'InvalidInput' and error['request_id'] and error['stage'] == 'prepare'
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'hedge_runs_total{kind="analyze",status="ok"} 1' in text
+    assert 'hedge_runs_total{kind="analyze",status="error"} 1' in text
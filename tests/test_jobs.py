@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import app
+from admission import AdmissionControl
+from jobs import JobManager, JobQueueFull
+
+
+class Upload:
+    def __init__(self, text='tradehash\n'):
+        self.text = text
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(self.text)
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.value, f)
+
+
+def wait_for(manager, job_id, statuses=('done', 'failed'), timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.status(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'Job {job_id} did not reach {statuses}')
+
+
+def test_job_reports_its_stage_and_progress_until_done(tmp_path):
+    release = threading.Event()
+    reported = threading.Event()
+
+    def runner(source, params, progress):
+        progress('parsing', 500, 0.5)
+        progress('matching', 1000, 0.2)
+        reported.set()
+        release.wait(10)
+        return Result({'source': os.path.basename(source), **params})
+
+    manager = JobManager(str(tmp_path), runner, update_interval=0)
+    job = manager.submit(Upload(), {'chunksize': 10})
+    assert job['status'] == 'queued'
+    assert reported.wait(10)
+
+    running = manager.status(job['id'])
+    assert (running['status'], running['stage'], running['rows_processed']) == ('running', 'matching', 1000)
+    # Parsing covers 0-40 % and matching 40-95 %
+    assert running['percent'] == 51.0
+    release.set()
+
+    done = wait_for(manager, job['id'])
+    assert (done['status'], done['stage'], done['percent']) == ('done', 'done', 100)
+    with open(manager.result_path(job['id'])) as f:
+        assert json.load(f) == {'source': 'upload.csv', 'chunksize': 10}
+    # The stored upload is removed once the job finishes
+    upload = os.path.join(str(tmp_path), job['id'], 'upload.csv')
+    deadline = time.monotonic() + 10
+    while os.path.exists(upload) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not os.path.exists(upload)
+
+
+def test_failed_job_keeps_its_error(tmp_path):
+    def runner(source, params, progress):
+        raise ValueError('no trades')
+
+    manager = JobManager(str(tmp_path), runner)
+    job = wait_for(manager, manager.submit(Upload(), {})['id'])
+    assert (job['status'], job['error']) == ('failed', 'no trades')
+    assert manager.status('0' * 32) is None
+    assert manager.status('../escape') is None
+
+
+def test_pending_jobs_are_bounded(tmp_path):
+    release = threading.Event()
+    manager = JobManager(str(tmp_path), lambda source, params, progress: release.wait(10) and Result(None),
+                         max_workers=1, max_pending=2)
+    jobs = [manager.submit(Upload(), {}) for _ in range(2)]
+    with pytest.raises(JobQueueFull):
+        manager.submit(Upload(), {})
+    release.set()
+    for job in jobs:
+        assert wait_for(manager, job['id'])['status'] == 'done'
+    # Finished jobs free their place
+    assert wait_for(manager, manager.submit(Upload(), {})['id'])['status'] == 'done'
+
+
+def test_jobs_left_running_by_a_stopped_worker_fail_on_start(tmp_path):
+    manager = JobManager(str(tmp_path), lambda source, params, progress: Result(None))
+    job_id = 'a' * 32
+    os.makedirs(tmp_path / job_id)
+    manager._write_status({'id': job_id, 'status': 'running', 'created': time.time()})
+    JobManager(str(tmp_path), manager.runner)
+    job = manager.status(job_id)
+    assert job['status'] == 'failed'
+    assert 'stopped' in job['error']
+
+
+def test_finished_jobs_are_pruned_after_their_time_to_live(tmp_path):
+    manager = JobManager(str(tmp_path), lambda source, params, progress: Result(None), ttl=60)
+    old = wait_for(manager, manager.submit(Upload(), {})['id'])
+    old['created'] -= 120
+    manager._write_status(old)
+    new = manager.submit(Upload(), {})
+    assert manager.status(old['id']) is None
+    assert wait_for(manager, new['id'])['status'] == 'done'
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'jobs', JobManager(str(tmp_path / 'jobs'), app.run_job))
+    monkeypatch.setattr(app, 'admission', AdmissionControl(str(tmp_path / 'slots'), 2, min_free_memory=0,
+                                                           max_load=0))
+    return app.app.test_client()
+
+
+def test_job_over_http_gives_the_reference_result(server, trades_csv, reference):
+    with open(trades_csv, 'rb') as upload:
+        response = server.post('/jobs', data={'file': (upload, 'trades.csv'), 'chunksize': '700'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+
+    job = wait_for(app.jobs, job_id)
+    assert job['status'] == 'done', job['error']
+    status = server.get(f'/jobs/{job_id}').get_json()
+    assert (status['percent'], status['params']['chunksize']) == (100, 700)
+    result = server.get(f'/jobs/{job_id}/result').get_json()
+    assert result['hedge_pairs'] == json.loads(json.dumps(reference['hedge_pairs']))
+    assert result['summary_stats'] == reference['summary_stats']
+    assert server.get(f"/jobs/{'0' * 32}").status_code == 404
+
+
+def test_analyze_with_async_queues_a_job(server, trades_csv):
+    with open(trades_csv, 'rb') as upload:
+        response = server.post('/analyze', data={'file': (upload, 'trades.csv'), 'async': 'true'})
+    assert response.status_code == 202
+    assert wait_for(app.jobs, response.get_json()['id'])['status'] == 'done'
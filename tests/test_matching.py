@@ -0,0 +1,53 @@
+import math
+
+import numpy as np
+import pytest
+
+from detection import matching_arrays, prepare_trades, run_analysis
+from matching import reference_candidates, sweep_candidates
+
+
+def asset_groups(trades):
+    return dict(tuple(prepare_trades(trades.copy()).groupby('normalized_asset')))
+
+
+@pytest.mark.parametrize('price_threshold', [0.5, 5.0, 50.0])
+def test_sweep_finds_the_reference_candidates(trades, price_threshold):
+    for asset, group in asset_groups(trades).items():
+        expected = reference_candidates(group.to_dict('records'), price_threshold)
+        found = sweep_candidates(*matching_arrays(group), price_threshold)
+        assert len(expected[0]) > 0
+        np.testing.assert_array_equal(found[0], expected[0], err_msg=asset)
+        np.testing.assert_array_equal(found[1], expected[1], err_msg=asset)
+
+
+def test_sweep_handles_ties_touching_intervals_and_missing_times():
+    # Shared entry times, a close equal to another entry, zero-length and
+    # reversed intervals, missing times and an unknown direction
+    trades = [
+        {'entry_time': 0.0, 'close_time': 10.0, 'short_long': 'LONG', 'avg_market_entry': 100.0},
+        {'entry_time': 10.0, 'close_time': 20.0, 'short_long': 'SHORT', 'avg_market_entry': 101.0},
+        {'entry_time': 10.0, 'close_time': 10.0, 'short_long': 'LONG', 'avg_market_entry': 100.5},
+        {'entry_time': 10.0, 'close_time': 5.0, 'short_long': 'SHORT', 'avg_market_entry': 100.0},
+        {'entry_time': 15.0, 'close_time': math.nan, 'short_long': 'LONG', 'avg_market_entry': 100.0},
+        {'entry_time': 12.0, 'close_time': 30.0, 'short_long': 'FLAT', 'avg_market_entry': 100.0},
+        {'entry_time': 20.0, 'close_time': 25.0, 'short_long': 'LONG', 'avg_market_entry': 106.0},
+        {'entry_time': 5.0, 'close_time': 8.0, 'short_long': 'SHORT', 'avg_market_entry': 99.0},
+    ]
+    expected = reference_candidates(trades, 5.0)
+    found = sweep_candidates(
+        [t['entry_time'] for t in trades], [t['close_time'] for t in trades],
+        np.array([{'LONG': 1, 'SHORT': -1}.get(t['short_long'], 0) for t in trades]),
+        [t['avg_market_entry'] for t in trades], 5.0
+    )
+    assert len(expected[0]) > 0
+    np.testing.assert_array_equal(found[0], expected[0])
+    np.testing.assert_array_equal(found[1], expected[1])
+
+
+@pytest.mark.parametrize('include_close_price', [True, False])
+def test_sweep_analysis_equals_reference_analysis(trades_csv, include_close_price):
+    expected = run_analysis(trades_csv, 5.0, 0.7, include_close_price, engine='reference')
+    result = run_analysis(trades_csv, 5.0, 0.7, include_close_price, engine='sweep')
+    assert len(expected['hedge_pairs']) > 0
+    assert result == expected
@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from detection import matching_arrays, prepare_trades, run_analysis
+from matching import _valid_trades, parallel_sweep_candidates, sweep_candidates, time_shards
+
+
+@pytest.fixture(scope='module')
+def groups(trades):
+    prepared = prepare_trades(trades.copy())
+    return {asset: matching_arrays(group) for asset, group in prepared.groupby('normalized_asset')}
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+def test_time_shards_cover_every_valid_trade(groups):
+    for entry_time, close_time, side, entry_price in groups.values():
+        valid = _valid_trades(entry_time, close_time, side, entry_price)
+        shards = time_shards(entry_time, close_time, valid, shard_size=100)
+        assert len(shards) > 1
+        owned = np.concatenate([positions[(entry_time[positions] >= lo) & (entry_time[positions] < hi)]
+                                for lo, hi, positions in shards])
+        np.testing.assert_array_equal(np.sort(owned), np.flatnonzero(valid))
+
+
+@pytest.mark.parametrize('shard_size', [50, 300, 1_000_000])
+def test_sharded_sweep_equals_whole_group_sweep(groups, executor, shard_size):
+    found = parallel_sweep_candidates(groups, 5.0, executor, shard_size=shard_size)
+    for asset, arrays in groups.items():
+        expected = sweep_candidates(*arrays, 5.0)
+        np.testing.assert_array_equal(found[asset][0], expected[0], err_msg=asset)
+        np.testing.assert_array_equal(found[asset][1], expected[1], err_msg=asset)
+
+
+def test_parallel_analysis_equals_reference_analysis(trades_csv, reference):
+    assert run_analysis(trades_csv, 5.0, 0.7, True, workers=2) == reference
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from detection import find_notable_patterns, generate_summary_stats
+from patterns import PairColumns
+
+
+def baseline_summary_stats(hedge_pairs, total_users, total_accounts):
+    """Summary statistics as computed before the columnar rewrite, one pair at a time"""
+    self_hedges = sum(1 for pair in hedge_pairs if pair['type'] == 'self_hedge')
+    unique_users, unique_accounts = set(), set()
+    for pair in hedge_pairs:
+        unique_users.update((pair['trade1']['user_id'], pair['trade2']['user_id']))
+        unique_accounts.update((pair['trade1']['account_id'], pair['trade2']['account_id']))
+    return {
+        'total_hedges': len(hedge_pairs),
+        'self_hedges': self_hedges,
+        'inter_user_hedges': len(hedge_pairs) - self_hedges,
+        'avg_confidence': sum(pair['confidence'] for pair in hedge_pairs) / len(hedge_pairs),
+        'users_involved': len(unique_users),
+        'accounts_involved': len(unique_accounts),
+        'users_percentage': len(unique_users) / total_users * 100,
+        'accounts_percentage': len(unique_accounts) / total_accounts * 100
+    }
+
+
+def baseline_patterns(hedge_pairs):
+    """Frequent users, peak hours and asset distribution as computed before the columnar rewrite"""
+    user_hedge_counts = {}
+    for pair in hedge_pairs:
+        user1, user2 = pair['trade1']['user_id'], pair['trade2']['user_id']
+        user_hedge_counts[user1] = user_hedge_counts.get(user1, 0) + 1
+        if user1 != user2:
+            user_hedge_counts[user2] = user_hedge_counts.get(user2, 0) + 1
+    frequent_users = [{'user_id': user_id, 'count': count}
+                      for user_id, count in user_hedge_counts.items() if count >= 3]
+    frequent_users.sort(key=lambda x: x['count'], reverse=True)
+
+    hour_patterns = {}
+    for pair in hedge_pairs:
+        hour = datetime.strptime(pair['trade1']['entry_time'], '%Y-%m-%d %H:%M:%S').hour
+        hour_patterns[hour] = hour_patterns.get(hour, 0) + 1
+    max_hour_count = max(hour_patterns.values())
+    peak_hours = [{'hour': hour, 'count': count, 'percentage': count / len(hedge_pairs) * 100}
+                  for hour, count in hour_patterns.items() if count >= max_hour_count * 0.8]
+    peak_hours.sort(key=lambda x: x['count'], reverse=True)
+
+    asset_patterns = {}
+    for pair in hedge_pairs:
+        asset_patterns[pair['asset']] = asset_patterns.get(pair['asset'], 0) + 1
+    asset_distribution = [{'asset': asset, 'count': count, 'percentage': count / len(hedge_pairs) * 100}
+                          for asset, count in asset_patterns.items()]
+    asset_distribution.sort(key=lambda x: x['count'], reverse=True)
+    return {'frequent_users': frequent_users, 'peak_hours': peak_hours, 'asset_distribution': asset_distribution}
+
+
+def test_summary_stats_equal_baseline(reference, trades):
+    hedge_pairs = reference['hedge_pairs']
+    users, accounts = trades['user_id'].nunique(), trades['account_id'].nunique()
+    assert generate_summary_stats(hedge_pairs, total_users=users, total_accounts=accounts) \
+        == baseline_summary_stats(hedge_pairs, users, accounts)
+    assert reference['summary_stats'] == baseline_summary_stats(hedge_pairs, users, accounts)
+
+
+def test_patterns_equal_baseline(reference):
+    hedge_pairs = reference['hedge_pairs']
+    patterns = find_notable_patterns(hedge_pairs)
+    expected = baseline_patterns(hedge_pairs)
+    assert {name: patterns[name] for name in expected} == expected
+    # A list of pair dicts and their column view give the same patterns
+    assert find_notable_patterns(PairColumns(hedge_pairs)) == patterns
+
+
+def test_hours_and_days_read_from_the_time_text_equal_strptime(reference):
+    times = [pair['trade1']['entry_time'] for pair in reference['hedge_pairs']]
+    times += ['2024-02-29 00:00:00', '2025-12-31 23:59:59', '1999-01-01 09:30:00']
+    pairs = PairColumns([{'type': 'self_hedge', 'asset': 'ESM25', 'confidence': 1.0, 'net_profit': 0.0,
+                          'trade1': {'user_id': 1, 'account_id': 1, 'entry_time': time, 'entry_price': 1.0},
+                          'trade2': {'user_id': 1, 'account_id': 1}}
+                         for time in times])
+    parsed = [datetime.strptime(time, '%Y-%m-%d %H:%M:%S') for time in times]
+    np.testing.assert_array_equal(pairs.hour, [time.hour for time in parsed])
+    np.testing.assert_array_equal(pairs.day, [int(time.strftime('%Y%m%d')) for time in parsed])
+
+
+@pytest.mark.parametrize('hedge_pairs', [[], PairColumns([])])
+def test_no_pairs_give_empty_patterns(hedge_pairs):
+    assert all(value == [] for value in find_notable_patterns(hedge_pairs).values())
+    assert generate_summary_stats(hedge_pairs, total_users=3, total_accounts=3)['total_hedges'] == 0
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from errors import InvalidInput
+from results import ResultTable, SORTS
+
+
+@pytest.fixture(scope='module')
+def table(reference, tmp_path_factory):
+    # Pages are served from tables saved by jobs and loaded again
+    path = str(tmp_path_factory.mktemp('result') / 'result.pkl')
+    ResultTable.from_analysis(reference).save(path)
+    return ResultTable.load(path)
+
+
+def expected_pairs(reference, sort, min_confidence=None, hedge_type=None, asset=None):
+    """The reference pairs filtered and sorted as pages should return them"""
+    pairs = [pair for pair in reference['hedge_pairs']
+             if (min_confidence is None or pair['confidence'] >= min_confidence)
+             and (hedge_type is None or pair['type'] == hedge_type)
+             and (asset is None or pair['asset'] == asset)]
+    column, ascending = SORTS[sort]
+    value = {
+        'id': lambda pair: pair['id'],
+        'confidence': lambda pair: pair['confidence'],
+        'entry_time': lambda pair: pair['trade1']['entry_time'],
+        'net_profit': lambda pair: pair['net_profit']
+    }[column]
+    pairs = sorted(pairs, key=lambda pair: pair['id'])
+    return sorted(pairs, key=value, reverse=not ascending)
+
+
+def all_pages(table, limit, **options):
+    pairs, cursor, total = [], None, None
+    while True:
+        page = table.page(cursor=cursor, limit=limit, **options)
+        total = page['total']
+        pairs.extend({**pair, 'trade1': page['trades'][pair['trade1']], 'trade2': page['trades'][pair['trade2']]}
+                     for pair in page['hedge_pairs'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pairs, total
+
+
+def test_full_result_round_trips(table, reference):
+    assert table.full() == reference
+
+
+@pytest.mark.parametrize('sort', ['id', 'confidence-desc', 'profit-asc'])
+@pytest.mark.parametrize('filters', [{}, {'min_confidence': 0.9}, {'hedge_type': 'self_hedge'},
+                                     {'asset': 'ESM25', 'min_confidence': 0.8}])
+def test_following_cursors_returns_every_matching_pair_once(table, reference, sort, filters):
+    expected = expected_pairs(reference, sort, **filters)
+    pairs, total = all_pages(table, 97, sort=sort, **filters)
+    assert total == len(expected) > 0
+    assert [pair['id'] for pair in pairs] == [pair['id'] for pair in expected]
+    assert pairs == expected
+
+
+def test_exports_stream_the_same_pairs(table, reference):
+    lines = ''.join(table.iter_ndjson(sort='confidence-desc', min_confidence=0.9)).splitlines()
+    assert [json.loads(line) for line in lines] == expected_pairs(reference, 'confidence-desc', 0.9)
+    rows = ''.join(table.iter_csv(hedge_type='self_hedge')).splitlines()
+    assert len(rows) == len(expected_pairs(reference, 'id', hedge_type='self_hedge')) + 1
+
+
+def test_cursors_are_tied_to_their_sort(table):
+    cursor = table.page(sort='confidence-desc', limit=10)['next_cursor']
+    with pytest.raises(InvalidInput):
+        table.page(sort='id', cursor=cursor)
+    with pytest.raises(InvalidInput):
+        table.page(cursor='not-a-cursor')
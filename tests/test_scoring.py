@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from detection import match_asset_group, prepare_trades
+from matching import reference_candidates
+from scoring import score_candidates
+
+TRADE_FIELDS = ('tradehash', 'direction', 'entry_price', 'close_price', 'net_profit', 'user_id',
+                'account_id', 'quantity')
+
+
+def baseline_score(trade1, trade2, price_diff, price_threshold, include_close_price):
+    """Confidence as the original per-pair loop computed it"""
+    score = 0.4 * (1 - price_diff / price_threshold)
+    score += 0.3
+    if include_close_price:
+        close_price_diff = abs(float(trade1['avg_market_close']) - float(trade2['avg_market_close']))
+        score += 0.3 * (1 - min(close_price_diff / price_threshold, 1))
+    else:
+        score += 0.15
+    if float(trade1['total_contracts']) == float(trade2['total_contracts']):
+        score += 0.1
+    return min(max(score, 0), 1)
+
+
+def baseline_pairs(asset, group, price_threshold, confidence_threshold, include_close_price):
+    """Hedge pairs of one asset as the original loop scored and built them"""
+    trades = group.to_dict('records')
+    hedge_pairs = []
+    for i, j in zip(*reference_candidates(trades, price_threshold)):
+        trade1, trade2 = trades[i], trades[j]
+        price_diff = abs(float(trade1['avg_market_entry']) - float(trade2['avg_market_entry']))
+        confidence = baseline_score(trade1, trade2, price_diff, price_threshold, include_close_price)
+        if confidence < confidence_threshold:
+            continue
+        hedge_pairs.append({
+            'id': len(hedge_pairs) + 1,
+            'type': 'self_hedge' if trade1['user_id'] == trade2['user_id'] else 'inter_user_hedge',
+            'asset': asset,
+            'trade1': baseline_trade(trade1),
+            'trade2': baseline_trade(trade2),
+            'entry_price_diff': price_diff,
+            'confidence': confidence,
+            'net_profit': float(trade1['net_profit']) + float(trade2['net_profit'])
+        })
+    return hedge_pairs
+
+
+def baseline_trade(trade):
+    return {
+        'tradehash': trade['tradehash'],
+        'direction': trade['short_long'],
+        'entry_price': float(trade['avg_market_entry']),
+        'close_price': float(trade['avg_market_close']),
+        'net_profit': float(trade['net_profit']),
+        'user_id': trade['user_id'],
+        'account_id': trade['account_id'],
+        'quantity': float(trade['total_contracts'])
+    }
+
+
+def comparable(pair):
+    """A built pair without its display-formatted times"""
+    return {
+        **pair,
+        'trade1': {field: pair['trade1'][field] for field in TRADE_FIELDS},
+        'trade2': {field: pair['trade2'][field] for field in TRADE_FIELDS}
+    }
+
+
+@pytest.mark.parametrize('include_close_price', [True, False])
+@pytest.mark.parametrize('confidence_threshold', [0.0, 0.7, 0.9])
+def test_vectorized_pairs_equal_the_per_pair_loop(trades, include_close_price, confidence_threshold):
+    prepared = prepare_trades(trades.copy())
+    for asset, group in prepared.groupby('normalized_asset'):
+        expected = baseline_pairs(asset, group, 5.0, confidence_threshold, include_close_price)
+        hedge_pairs = match_asset_group(asset, group, 5.0, confidence_threshold, include_close_price)
+        assert len(hedge_pairs) == len(expected)
+        assert [comparable(pair) for pair in hedge_pairs] == expected
+
+
+def test_scores_are_clipped_and_reward_equal_quantities():
+    entry = np.array([100.0, 100.0, 100.0, 200.0])
+    close = np.array([100.0, 100.0, 110.0, 100.0])
+    quantity = np.array([1.0, 1.0, 2.0, 1.0])
+    pairs_i, pairs_j = np.array([0, 0, 0]), np.array([1, 2, 3])
+    price_diff, confidence = score_candidates(entry, close, quantity, pairs_i, pairs_j, 5.0, True)
+    np.testing.assert_allclose(price_diff, [0.0, 0.0, 100.0])
+    # Identical trades score 1.1 before clipping; a far-off close adds nothing
+    np.testing.assert_allclose(confidence, [1.0, 0.7, 0.0])
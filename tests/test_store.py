@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from detection import ingest_trade_store, run_analysis
+
+# Entry time in milliseconds of a day in July 2035
+ENTRY_2035 = 2_067_000_000_000
+
+
+@pytest.mark.parametrize('chunksize', [400, 10_000])
+def test_store_analysis_equals_reference_analysis(trades, trades_csv, reference, tmp_path, chunksize):
+    store = ingest_trade_store(trades_csv, str(tmp_path / 'trades.store'), chunksize=chunksize)
+    assert store.rows == len(trades)
+    assert sum(store.sizes.values()) == len(trades)
+    assert run_analysis(store, 5.0, 0.7, True) == reference
+
+
+@pytest.mark.parametrize('chunksize', [100, 10_000])
+def test_integer_trade_ids_load_as_integers_in_every_chunk(trades, tmp_path, chunksize):
+    # With small chunks some chunks of a column that is mostly text hold only digits
+    numbered = trades.assign(tradehash=np.arange(len(trades)).astype(str))
+    numbered.loc[len(trades) - 1, 'tradehash'] = 'x-1'
+    numbered.to_csv(tmp_path / 'numbered.csv', index=False)
+    numbered.iloc[:-1].to_csv(tmp_path / 'integers.csv', index=False)
+
+    mixed = ingest_trade_store(str(tmp_path / 'numbered.csv'), str(tmp_path / 'numbered.store'), chunksize)
+    integers = ingest_trade_store(str(tmp_path / 'integers.csv'), str(tmp_path / 'integers.store'), chunksize)
+    for key in mixed.keys():
+        assert mixed.load(key)['tradehash'].map(type).eq(str).all()
+    for key in integers.keys():
+        assert integers.load(key)['tradehash'].dtype == np.int64
+
+
+def test_short_contract_years_follow_each_trades_entry(trades, tmp_path):
+    later = trades.copy()
+    rows = later.index[later['asset'] == 'NQM5'][:3]
+    later.loc[rows, 'entry_datetimes'] = f'[{ENTRY_2035}]'
+    later.loc[rows, 'close_datetimes'] = f'[{ENTRY_2035 + 60_000}]'
+    later.to_csv(tmp_path / 'later.csv', index=False)
+
+    store = ingest_trade_store(str(tmp_path / 'later.csv'), str(tmp_path / 'later.store'))
+    assert store.sizes['NQM35'] == 3
+    # Micro contracts are matched with their full-size root
+    assert store.sizes['NQM25'] == trades['asset'].isin(['NQM5', 'MNQM5']).sum() - 3
+    assert set(store.load('NQM35')['tradehash']) == set(later.loc[rows, 'tradehash'])
+
+
+def test_ids_get_one_code_whatever_type_each_chunk_infers(trades, tmp_path):
+    # Read alone, one chunk's user ids would be float (a missing id) and
+    # another chunk's account ids text (a named account)
+    mixed = trades.astype({'user_id': object, 'account_id': object})
+    mixed.loc[5, 'user_id'] = None
+    mixed.loc[len(trades) - 1, 'account_id'] = 'house'
+    mixed.to_csv(tmp_path / 'mixed.csv', index=False)
+
+    store = ingest_trade_store(str(tmp_path / 'mixed.csv'), str(tmp_path / 'mixed.store'), chunksize=100)
+    users, accounts = store.dictionaries['user_id'].tolist(), store.dictionaries['account_id'].tolist()
+    assert len(set(users)) == len(users)
+    assert set(users) == set(trades['user_id'].drop(5))
+    assert store.total_users == trades['user_id'].drop(5).nunique()
+    assert all(type(user) is int for user in users)
+    assert len(set(accounts)) == len(accounts)
+    assert set(accounts) == set(trades['account_id'].iloc[:-1].astype(str)) | {'house'}
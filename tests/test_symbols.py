@@ -0,0 +1,76 @@
+import json
+
+import pandas as pd
+import pytest
+
+from symbols import SymbolNormalizer
+
+
+@pytest.fixture
+def normalizer():
+    return SymbolNormalizer()
+
+
+@pytest.mark.parametrize('symbol, reference_year, parts', [
+    ('MNQM5', 2025, ('MNQ', 'NQ', 6, 2025)),
+    ('ESZ24', 2024, ('ES', 'ES', 12, 2024)),
+    ('/ESZ24', 2031, ('ES', 'ES', 12, 2024)),
+    ('CLN2025.NYMEX', None, ('CL', 'CL', 7, 2025)),
+    ('cln2025.nymex', 2019, ('CL', 'CL', 7, 2025)),
+    ('NQ', 2025, ('NQ', 'NQ', None, None))
+])
+def test_symbols_parse_into_root_month_and_year(normalizer, symbol, reference_year, parts):
+    contract = normalizer.parse(symbol, reference_year)
+    assert (contract.root, contract.canonical_root, contract.month, contract.year) == parts
+
+
+@pytest.mark.parametrize('symbol, reference_year, year', [
+    ('NQM5', 2025, 2025),
+    ('NQM5', 2035, 2035),
+    # The nearest year with that last digit, across a decade boundary
+    ('ESH0', 2029, 2030),
+    ('ESZ9', 2030, 2029),
+    ('ESZ99', 2001, 1999),
+    ('ESH01', 1999, 2001)
+])
+def test_short_years_resolve_against_the_entry_year(normalizer, symbol, reference_year, year):
+    assert normalizer.parse(symbol, reference_year).year == year
+
+
+def test_short_years_without_an_entry_year_stay_unresolved(normalizer):
+    assert normalizer.parse('NQM5').year is None
+    assert normalizer.normalize('NQM5') == 'NQM'
+    assert normalizer.normalize('NQM2025') == 'NQM25'
+
+
+def epoch_ms(text):
+    return pd.Timestamp(text, tz='UTC').timestamp() * 1000
+
+
+def test_columns_resolve_each_trade_by_its_own_entry(normalizer):
+    # Two minutes apart, on either side of a new decade
+    entry = [epoch_ms('2029-12-31 23:59'), epoch_ms('2030-01-01 00:01'), epoch_ms('2030-01-01 00:01'), None]
+    keys = normalizer.normalize_column(['ESH0', 'ESH0', 'MESZ9', 'ESZ9'], entry)
+    assert keys.tolist() == ['ESH30', 'ESH30', 'ESZ29', 'ESZ']
+    keys = normalizer.normalize_column(['NQM5', 'NQM5'], [epoch_ms('2025-06-01'), epoch_ms('2035-06-01')])
+    assert keys.tolist() == ['NQM25', 'NQM35']
+
+
+@pytest.mark.parametrize('symbol, key', [
+    ('MESM5', 'ESM25'),
+    ('FESXM5', 'FESXM25'),
+    ('DESM5', 'DESM25'),
+    ('ESTX50', 'ESTX50'),
+    ('TESLA', 'TESLA')
+])
+def test_symbols_containing_es_are_not_merged_into_es(normalizer, symbol, key):
+    assert normalizer.normalize(symbol, 2025) == key
+
+
+def test_equivalence_file_extends_the_defaults(tmp_path):
+    path = tmp_path / 'roots.json'
+    path.write_text(json.dumps({'mbt': 'btc'}))
+    normalizer = SymbolNormalizer.from_env({'HEDGE_ROOT_EQUIVALENCE': str(path)})
+    assert normalizer.normalize('MBTF5', 2025) == 'BTCF25'
+    assert normalizer.normalize('MNQM5', 2025) == 'NQM25'
+    assert normalizer.fingerprint != SymbolNormalizer().fingerprint